@@ -2,6 +2,7 @@ import ROOT
 import os
 import numpy as np
 import sys
+from TwoDAlphabet.helpers import hist_to_array, rdh_to_array, set_hist_from_array
 
 ROOT.gROOT.SetBatch(True)
 
@@ -121,29 +122,20 @@ def compare_2D_histograms(data_obs1, data_obs2, mH_default, mA_default, name):
     hist_data_obs1 = ROOT.TH2F("hist_data_obs1", "Data Distribution (data_obs1)", nbins_mH, mH_default.getMin(), mH_default.getMax(), nbins_mA, mA_default.getMin(), mA_default.getMax())
     hist_data_obs2 = ROOT.TH2F("hist_data_obs2", "MC Distribution (data_obs2)", nbins_mH, mH_default.getMin(), mH_default.getMax(), nbins_mA, mA_default.getMin(), mA_default.getMax())
 
-    # Loop through data_obs1 and data_obs2 to fill the histograms
-    Total_events_data = 0
-    Total_events_MC = 0
+    # rdh_to_array lays the weights out as [mA bin][mH bin] only if mH is the first observable
+    expected_vars = [v.GetName() for v in var_list]
+    for data_obs in [data_obs1, data_obs2]:
+        rdh_vars = [v.GetName() for v in data_obs.get()]
+        if rdh_vars != expected_vars:
+            raise ValueError(f"{data_obs.GetName()} has observables {rdh_vars}, expected {expected_vars}.")
 
-    for i in range(data_obs1.numEntries()):
-        var_set = data_obs1.get(i)
-        weight = data_obs1.weight()
-        mH_val = var_set.getRealValue(f"mH_{MHRegion}_default")  # Extract mH value
-        mA_val = var_set.getRealValue("mA_default")  # Extract mA value
-        binx = hist_data_obs1.GetXaxis().FindBin(mH_val)
-        biny = hist_data_obs1.GetYaxis().FindBin(mA_val)
-        hist_data_obs1.Fill(mH_val, mA_val, weight)  # Fill data_obs1 histogram with weight
-        Total_events_data += weight
-
-    for i in range(data_obs2.numEntries()):
-        var_set = data_obs2.get(i)
-        weight = data_obs2.weight()
-        mH_val = var_set.getRealValue(f"mH_{MHRegion}_default")  # Extract mH value
-        mA_val = var_set.getRealValue("mA_default")  # Extract mA value
-        binx = hist_data_obs2.GetXaxis().FindBin(mH_val)
-        biny = hist_data_obs2.GetYaxis().FindBin(mA_val)
-        hist_data_obs2.Fill(mH_val, mA_val, weight)  # Fill data_obs2 histogram with weight
-        Total_events_MC += weight
+    # Fill the histograms with the data_obs1 and data_obs2 weights (as Fill(mH, mA, weight) would)
+    weights_data = rdh_to_array(data_obs1)[0]
+    weights_MC = rdh_to_array(data_obs2)[0]
+    set_hist_from_array(hist_data_obs1, weights_data, weights_data**2)
+    set_hist_from_array(hist_data_obs2, weights_MC, weights_MC**2)
+    Total_events_data = weights_data.sum()
+    Total_events_MC = weights_MC.sum()
 
     print(f"Total events in data_obs1: {Total_events_data}")
     print(f"Total events in data_obs2: {Total_events_MC}")
@@ -259,14 +251,7 @@ for IsPass in ["Pass", "Fail"]:
         #print("Data Events: ", data_obs1.numEntries())
         mH_default = w1.var(f"mH_{MHRegion}_default")
         mA_default = w1.var("mA_default")
-        Total_events1=0
-        for i in range(data_obs1.numEntries()):
-            var_set = data_obs1.get(i)
-            weight = data_obs1.weight()
-            mH_val = var_set.getRealValue(f"mH_{MHRegion}_default")  # Extract mH value
-            mA_val = var_set.getRealValue("mA_default")  # Extract mA value
-            Total_events1 += weight
-            #print( f"Bin {i}, (mH = {mH_val}, mA = {mA_val}): {weight}")
+        Total_events1 = rdh_to_array(data_obs1)[0].sum()
         Nevt_allregions[IsPass]+=Total_events1
         #print("total: ", Total_events1)
         nbins_mH = mH_default.getBins()  # Default number of bins in mH
@@ -300,17 +285,12 @@ for IsPass in ["Pass", "Fail"]:
                                      ROOT.RooArgList(mH_default, mA_default),
                                      hist_rebinned)
         w1.Import(data_obs2)  # Import data_obs2 into the workspace w1
-        Total_events2=0
-        for i in range(data_obs2.numEntries()):
-            var_set = data_obs2.get(i)
-            weight = data_obs2.weight()
-            mH_val = var_set.getRealValue(f"mH_{MHRegion}_default")  # Extract mH value
-            mA_val = var_set.getRealValue("mA_default")  # Extract mA value
-            Total_events2 +=weight
-            if weight<0:
-                print( f"Bin {i}, (mH = {mH_val}, mA = {mA_val}): {weight}")
-                if f"{IsPass}"=="Fail":
-                    exit()
+        weights2 = rdh_to_array(data_obs2)[0] # [mA bin][mH bin]
+        Total_events2 = weights2.sum()
+        for ibinA, ibinH in zip(*np.nonzero(weights2 < 0)):
+            print( f"Bin (mH = {mH_default.getBinning().binCenter(int(ibinH))}, mA = {mA_default.getBinning().binCenter(int(ibinA))}): {weights2[ibinA,ibinH]}")
+            if f"{IsPass}"=="Fail":
+                exit()
         print("total ws, raw hist: ", Total_events2, Total_events1)
         if(abs(Total_events1-Total_events2)/Total_events1 > 0.2) :
             print("----- Something is wrong! -----")
@@ -324,25 +304,24 @@ BKGMCTotal_pass_Smooth1.Scale( Nevt_allregions["Pass"]*1.0/BKGMCTotal_pass_Smoot
 BKGMCTotal_fail_Smooth1.Scale( Nevt_allregions["Fail"]*1.0/BKGMCTotal_fail_Smooth1.Integral() )
 
 def toys_generator(hist1, hist2, ntoyes, output_filename):
-    for i in range(ntoyes):
-        print(hist1.GetName())
-        filename = hist1.GetName().split("_pnet")[0].replace("smooth1",f"smooth1_toy{i}")
-        output_file = ROOT.TFile(output_filename+"/"+filename+".root", "RECREATE")
-        toy_hist1 = hist1.Clone(hist1.GetName().replace("smooth1",f"smooth1_toy{i}"))
-        for ix in range(1, hist1.GetNbinsX() + 1):
-            for iy in range(1, hist1.GetNbinsY() + 1):
-                expected = hist1.GetBinContent(ix, iy)
-                fluctuated = np.random.poisson(expected)
-                toy_hist1.SetBinContent(ix, iy, fluctuated)
-        toy_hist1.Write()
-        toy_hist2 = hist2.Clone(hist2.GetName().replace("smooth1",f"smooth1_toy{i}"))
-        for ix in range(1, hist2.GetNbinsX() + 1):
-            for iy in range(1, hist2.GetNbinsY() + 1):
-                expected = hist2.GetBinContent(ix, iy)
-                fluctuated = np.random.poisson(expected)
-                toy_hist2.SetBinContent(ix, iy, fluctuated)
-        toy_hist2.Write()
-        output_file.Close()
+    """Poisson-fluctuate the in-range bins of hist1 and hist2 for all ntoyes toys at once
+    (drawn as one (ntoyes, nx, ny) array per histogram) and write every toy into a single
+    file, <output_filename>/<prefix>_toys.root, where <prefix> is the part of the
+    histogram name before "_pnet". Toy i is stored as <prefix>_toy-<i><rest of the name>
+    so that the data_obs ALIAS of the templated config can select it with the TOYIDX
+    findreplace key. Returns the name of the toys file."""
+    prefix = hist1.GetName().split("_pnet")[0]
+    output_file = ROOT.TFile(output_filename+"/"+prefix+"_toys.root", "RECREATE")
+    for hist in [hist1, hist2]:
+        expected = hist_to_array(hist, flow=False)[0].T # (nx, ny)
+        fluctuated = np.random.poisson(expected, size=(ntoyes,)+expected.shape)
+        for i in range(ntoyes):
+            toy_hist = hist.Clone(hist.GetName().replace(prefix, f"{prefix}_toy-{i}"))
+            set_hist_from_array(toy_hist, fluctuated[i].T) # flow bins and errors kept from the template
+            toy_hist.Write()
+            del toy_hist
+    output_file.Close()
+    return prefix+"_toys.root"
 
 #output_file = ROOT.TFile(output_hist_name, "RECREATE")  # Create a new ROOT file
 ##w1.Write()  # Write the workspace to the file
@@ -354,43 +333,24 @@ def toys_generator(hist1, hist2, ntoyes, output_filename):
 #Ntoys=50
 Ntoys = int(sys.argv[2])
 
-toys_generator(BKGMCTotal_pass_Smooth1, BKGMCTotal_fail_Smooth1, Ntoys, output_hist_name)
+toys_file = toys_generator(BKGMCTotal_pass_Smooth1, BKGMCTotal_fail_Smooth1, Ntoys, output_hist_name)
 
 import json
-# Read JSON file
+# Write one config for all toys. The toy is picked at run time by passing
+# findreplace={'TOYIDX': <toy index>} to TwoDAlphabet (see htoaato4b_mctoy.py).
 os.system("mkdir -p mctoysjson/")
-if category == "Leptonic_Hi":
-    for i in range(Ntoys):
-        with open('XXHi_Htoaato4b.json', 'r') as f:
-            data = json.load(f)  # `data` is now a Python dictionary or list
-        data['PROCESSES']["data_obs"]['ALIAS'] = f"XXHi_BKGsmooth1_toy{i}_2018"
-        with open(f'mctoysjson/XXHi_Htoaato4b_mctoy{i}.json', 'w') as f:
-            json.dump(data, f, indent=4)
-elif category == "Leptonic_Lo":
-    for i in range(Ntoys):
-        with open('XXLo_Htoaato4b.json', 'r') as f:
-            data = json.load(f)  # `data` is now a Python dictionary or list
-        data['PROCESSES']["data_obs"]['ALIAS'] = f"XXLo_BKGsmooth1_toy{i}_2018"
-        with open(f'mctoysjson/XXLo_Htoaato4b_mctoy{i}.json', 'w') as f:
-            json.dump(data, f, indent=4)
-elif category == "gg0lIncl":
-    for i in range(Ntoys):
-        with open('gg0lIncl_Htoaato4b.json', 'r') as f:
-            data = json.load(f)  # `data` is now a Python dictionary or list
-        data['PROCESSES']["data_obs"]['ALIAS'] = f"gg0lIncl_BKGsmooth1_toy{i}_2018"
-        with open(f'mctoysjson/gg0lIncl_Htoaato4b_mctoy{i}.json', 'w') as f:
-            json.dump(data, f, indent=4)
-elif category == "VBF_Hi":
-    for i in range(Ntoys):
-        with open('VBFjjHi_Htoaato4b.json', 'r') as f:
-            data = json.load(f)  # `data` is now a Python dictionary or list
-        data['PROCESSES']["data_obs"]['ALIAS'] = f"VBFjjHi_Xto4bv2_BKGsmooth1_toy{i}_2018"
-        with open(f'mctoysjson/VBFjjHi_Xto4bv2_Htoaato4b_mctoy{i}.json', 'w') as f:
-            json.dump(data, f, indent=4)
-elif category == "VBF_Lo":
-    for i in range(Ntoys):
-        with open('VBFjjLo_Htoaato4b.json', 'r') as f:
-            data = json.load(f)  # `data` is now a Python dictionary or list
-        data['PROCESSES']["data_obs"]['ALIAS'] = f"VBFjjLo_Xto4bv2_BKGsmooth1_toy{i}_2018"
-        with open(f'mctoysjson/VBFjjLo_Xto4bv2_Htoaato4b_mctoy{i}.json', 'w') as f:
-            json.dump(data, f, indent=4)
+toy_configs = {
+    "Leptonic_Hi": ("XXHi_Htoaato4b.json", "mctoysjson/XXHi_Htoaato4b_mctoy.json"),
+    "Leptonic_Lo": ("XXLo_Htoaato4b.json", "mctoysjson/XXLo_Htoaato4b_mctoy.json"),
+    "gg0lIncl":    ("gg0lIncl_Htoaato4b.json", "mctoysjson/gg0lIncl_Htoaato4b_mctoy.json"),
+    "VBF_Hi":      ("VBFjjHi_Htoaato4b.json", "mctoysjson/VBFjjHi_Xto4bv2_Htoaato4b_mctoy.json"),
+    "VBF_Lo":      ("VBFjjLo_Htoaato4b.json", "mctoysjson/VBFjjLo_Xto4bv2_Htoaato4b_mctoy.json"),
+}
+if category in toy_configs:
+    json_in, json_out = toy_configs[category]
+    with open(json_in, 'r') as f:
+        data = json.load(f)  # `data` is now a Python dictionary or list
+    data['PROCESSES']["data_obs"]['ALIAS'] = outprocess.split("_pnet")[0]+"_toy-TOYIDX"
+    data['PROCESSES']["data_obs"]['LOC'] = "path/"+toys_file+":HIST"
+    with open(json_out, 'w') as f:
+        json.dump(data, f, indent=4)
@@ -1,8 +1,7 @@
 from collections import OrderedDict
-from TwoDAlphabet.helpers import roofit_form_to_TF1
-from ROOT import RooRealVar, RooFormulaVar, RooArgList, RooParametricHist2D, RooConstVar, TFormula, RooAddition
+from TwoDAlphabet.helpers import ROOT, roofit_form_to_TF1, hist_to_array
 from TwoDAlphabet.binning import copy_hist_with_new_bins
-import itertools
+import itertools, numpy
 # import numpy as np
 # from numpy.lib.function_base import piecewise
 
@@ -43,14 +42,18 @@ class Generic2D(object):
         self.binArgLists = {c:None for c in _subspace}
         self.rph = {c:None for c in _subspace}
         self.forcePositive = forcePositive
-        self._varStorage = [] # only used by AddShapeTemplates
+        self._varStorage = [] # keeps RooFit objects alive (AddShapeTemplates) and the Generic2Ds this one is built from (_manipulate)
 
-    def _manipulate(self,name,other,operator=''):
+    def _manipulate(self,name,other,operator='',useFormula=False):
         '''Base method to create a new Generic2D object. When combining
-        `self` and `other`, a new set of RooFormulaVars will be created for
+        `self` and `other`, a new set of RooFit objects will be created for
         the new Generic2D object that connect `self` and `other` with the
         `operator` string. The associated nuisances of `self` and `other` will
         also be passed to the new object as one set (with potential duplicates removed).
+
+        Sums ("+") are built with RooAddition and products ("*") with RooProduct so that
+        no formula needs to be compiled per bin. Any other operator (ex. "/" or the
+        "<factor>*" of `Add`) falls back to a RooFormulaVar of "@0<operator>@1".
         
         If attempting to add, subtract, multiply, or divide,
         use the dedicated methods. More complex use cases could be built here.
@@ -60,11 +63,17 @@ class Generic2D(object):
             other (Generic2D): Object to combine with self.
             operator (str, optional): Connecting mathematical operator string for the combination. Defaults to '*'
                 which causes the method to return self*other.
+            useFormula (bool, optional): Always use a RooFormulaVar per bin. Defaults to False.
+
+        Raises:
+            RuntimeError: If `self` and `other` track different objects under the same nuisance name.
 
         Returns:
             Generic2D: Object containing the combination of `self` and `other`.
         '''
         out = Generic2D(name,self.binning,self.forcePositive)
+        out._varStorage.extend([self, other]) # the new bins point to the bins of self and other
+        node_maker = _formula_node_maker(operator) if useFormula else _arithmetic_node_maker(operator)
         for cat in _subspace:
             new_cat_name = name+'_'+cat
             for ybin in range(1,len(self.binning.ybinList)):
@@ -72,22 +81,22 @@ class Generic2D(object):
                     new_bin_name   = '%s_bin_%s-%s'%(new_cat_name,xbin,ybin)
                     self_bin_name  = new_bin_name.replace(new_cat_name, self.name+'_'+cat)
                     other_bin_name = new_bin_name.replace(new_cat_name, other.name+'_'+cat)
-                    out.binVars[new_bin_name] = RooFormulaVar(
-                                                    new_bin_name, new_bin_name, '@0%s@1'%operator,
-                                                    RooArgList(
-                                                        self.binVars[self_bin_name],
-                                                        other.binVars[other_bin_name]))
+                    out.binVars[new_bin_name] = node_maker(new_bin_name, self.binVars[self_bin_name], other.binVars[other_bin_name])
 
         all_nuisances = self.nuisances+other.nuisances
+        tracked = {}
         for nuisance in all_nuisances:
-            if nuisance['name'] in [n['name'] for n in out.nuisances]:
-                raise RuntimeError('Already tracking nuisance %s. Printing all nuisances...\n\t'%(nuisance['name'],all_nuisances))
+            if nuisance['name'] in tracked:
+                if tracked[nuisance['name']] is not nuisance['obj']:
+                    raise RuntimeError('Already tracking a different nuisance named %s. Printing all nuisances...\n\t%s'%(nuisance['name'],[n['name'] for n in all_nuisances]))
+                continue
 
+            tracked[nuisance['name']] = nuisance['obj']
             out.nuisances.append(nuisance)
 
         return out
 
-    def Add(self,name,other,factor='1'):
+    def Add(self,name,other,factor='1',useFormula=False):
         '''Add `self` with `other`. Optionally change the
         factor in front of `other` (defaults to 1). This option is
         primarly for the case of subtracting `other` from `self`.
@@ -97,6 +106,7 @@ class Generic2D(object):
             other (Generic2D): Object to add to `self`.
             factor (str, optional): Factor to include in front of `other` in the combination. Defaults to '1'.
                 Primary use case is "-1" which will subtract `other` from `self`.
+            useFormula (bool, optional): Use a RooFormulaVar per bin instead of RooAddition (only applies when `factor` is "1"). Defaults to False.
 
         Returns:
             Generic2D: Object containing the addition of `self` and `other`.
@@ -107,19 +117,20 @@ class Generic2D(object):
             op = '+'
         else:
             op = '+%s*'%factor
-        return self._manipulate(name,other,op)
+        return self._manipulate(name,other,op,useFormula)
 
-    def Multiply(self,name,other):
+    def Multiply(self,name,other,useFormula=False):
         '''Multiply `self` with `other`.
 
         Args:
             name (str): Unique name for the new output Generic2D object.
             other (Generic2D): Object to multiply `self` by.
+            useFormula (bool, optional): Use a RooFormulaVar per bin instead of RooProduct. Defaults to False.
 
         Returns:
             Generic2D: Object containing the multiplication of `self` and `other`.
         '''
-        return self._manipulate(name,other,'*')
+        return self._manipulate(name,other,'*',useFormula)
     def Divide(self,name,other):
         '''Divide `self` by `other`.
 
@@ -145,19 +156,19 @@ class Generic2D(object):
             cat_hist = self.binning.CreateHist(cat_name+'_temp',cat)
             obj_name = '%s_%s'%(name if name != '' else self.name, cat)
 
-            self.binArgLists[cat] = RooArgList()
+            self.binArgLists[cat] = ROOT.RooArgList()
             for ybin in range(1,len(self.binning.ybinList)):
                 for xbin in range(1,len(self.binning.xbinByCat[cat])):
                     bin_name   = '%s_bin_%s-%s'%(cat_name,xbin,ybin)
                     self.binArgLists[cat].add(self.binVars[bin_name])
 
-            out_rph[cat] = RooParametricHist2D(
+            out_rph[cat] = ROOT.RooParametricHist2D(
                         obj_name, obj_name,
                         self.binning.xVars[cat],
                         self.binning.yVar,
                         self.binArgLists[cat], cat_hist
             )
-            out_add[cat] = RooAddition(obj_name+'_norm',obj_name+'_norm',self.binArgLists[cat])
+            out_add[cat] = ROOT.RooAddition(obj_name+'_norm',obj_name+'_norm',self.binArgLists[cat])
         return out_rph, out_add
 
     def getBinVal(self,xbin,ybin):
@@ -196,7 +207,7 @@ class Generic2D(object):
             
 
 class ParametricFunction(Generic2D):
-    def __init__(self,name,binning,formula,constraints={},forcePositive=True):
+    def __init__(self,name,binning,formula,constraints={},forcePositive=True,sharedFormula=False):
         '''Represents parametric functions as a group of RooFormulaVars which
         create a binned distribution and which change
         as the underlying function parameters change. Set parameter specific
@@ -223,12 +234,24 @@ class ParametricFunction(Generic2D):
                 and the range of the parameter will be [-1000,1000]. 
             
         @param forcePositive (bool, optional). Defaults to True in which case the bin values will be lower bound by 1e-9.
+        @param sharedFormula (bool, optional). If True, every bin uses the same formula string with the bin centers
+                passed as RooConstVar arguments (after the fit parameters) so that the expression is only compiled once.
+                If False (default), the bin centers are written into a distinct formula string for each bin.
         '''
         super(ParametricFunction,self).__init__(name,binning,forcePositive)
         self.formula = formula
         self.nuisances = self._createFuncVars(constraints)
-        self.arglist = RooArgList()
+        self.arglist = ROOT.RooArgList()
         for n in self.nuisances: self.arglist.add(n['obj'])
+        self.binCenters = {} # only used if sharedFormula
+
+        if sharedFormula:
+            # Only pass the bin centers that the formula actually uses
+            uses_x = '@X' in self._replaceXY('@X','@Y')
+            uses_y = '@Y' in self._replaceXY('@X','@Y')
+            npars = len(self.nuisances)
+            shared_formula = self._replaceXY('@%s'%npars if uses_x else 'x', '@%s'%(npars+uses_x) if uses_y else 'y')
+            if forcePositive: shared_formula = "max(1e-9,%s)"%(shared_formula)
 
         for cat in _subspace:
             cat_name = name+'_'+cat
@@ -236,15 +259,40 @@ class ParametricFunction(Generic2D):
                 for xbin in range(1,len(self.binning.xbinByCat[cat])):
                     bin_name = '%s_bin_%s-%s'%(cat_name,xbin,ybin)
                     xConst,yConst = self.mappedBinCenter(xbin,ybin,cat)
+                    if sharedFormula:
+                        bin_args = ROOT.RooArgList(self.arglist)
+                        if uses_x: bin_args.add(self._binCenterVar('%s_x%s'%(cat_name,xbin),xConst))
+                        if uses_y: bin_args.add(self._binCenterVar('%s_y%s'%(name,ybin),yConst))
+                        self.binVars[bin_name] = ROOT.RooFormulaVar(
+                            bin_name, bin_name,
+                            shared_formula,
+                            bin_args
+                        )
+                        continue
+
                     if forcePositive: final_formula = "max(1e-9,%s)"%(self._replaceXY(xConst,yConst))
                     else:             final_formula = self._replaceXY(xConst,yConst)
 
-                    self.binVars[bin_name] = RooFormulaVar(
+                    self.binVars[bin_name] = ROOT.RooFormulaVar(
                         bin_name, bin_name,
                         final_formula,
                         self.arglist
                     )
 
+    def _binCenterVar(self,name,val):
+        '''Get (or create and cache) the RooConstVar for a mapped bin center.
+
+        Args:
+            name (str): Name of the RooConstVar.
+            val (float): Mapped bin center.
+
+        Returns:
+            RooConstVar: Constant bin center.
+        '''
+        if name not in self.binCenters:
+            self.binCenters[name] = ROOT.RooConstVar(name, name, val)
+        return self.binCenters[name]
+
     def _replaceXY(self,x,y):
         '''Find and replace "x" and "y" in the input formula
         with this method's arguments (floats) which should
@@ -272,7 +320,7 @@ class ParametricFunction(Generic2D):
         Returns:
             int: Number of parameters in the fit (not counting "x" or "y").
         '''
-        return TFormula('tempFormula',roofit_form_to_TF1(self.formula)).GetNpar()
+        return ROOT.TFormula('tempFormula',roofit_form_to_TF1(self.formula)).GetNpar()
 
     def _createFuncVars(self,constraints):
         '''Creates the nuisances list of the function variables (RooRealVars)
@@ -297,7 +345,7 @@ class ParametricFunction(Generic2D):
                 if 'NOM' in constraints[i]: NOM = constraints[i]['NOM']
                 if 'ERROR' in constraints[i]: ERROR = constraints[i]['ERROR']
 
-            this_out = {'name':name, 'obj': RooRealVar(name,name,NOM,MIN,MAX), 'constraint': constraint}
+            this_out = {'name':name, 'obj': ROOT.RooRealVar(name,name,NOM,MIN,MAX), 'constraint': constraint}
             this_out['obj'].setError(ERROR)
             out.append(this_out)
         return out
@@ -372,17 +420,20 @@ class BinnedDistribution(Generic2D):
         for cat in _subspace:
             cat_name = name+'_'+cat
             cat_hist = copy_hist_with_new_bins(cat_name,'X',inhist,self.binning.xbinByCat[cat])
+            # Arrays indexed as [ybin][xbin] with under/overflow included
+            content = hist_to_array(cat_hist)[0]
+            nzeros = _surrounding_zeros(content)
+            is_const = numpy.full(nzeros.shape, True) if constant else (nzeros > 7)
             for ybin in range(1,cat_hist.GetNbinsY()+1):
                 for xbin in range(1,cat_hist.GetNbinsX()+1):
                     bin_name = '%s_bin_%s-%s'%(cat_name,xbin,ybin)
-                    nzeros = self._nSurroundingZeros(cat_hist,xbin,ybin)
-                    if constant or nzeros > 7:
-                        if verbose: print('\n%d surrounding zeros for (%d, %d), fix to 1e-9' % (nzeros, xbin, ybin))
-                        self.binVars[bin_name] = RooConstVar(bin_name, bin_name, cat_hist.GetBinContent(xbin,ybin))
+                    bin_val = float(content[ybin,xbin])
+                    if is_const[ybin,xbin]:
+                        if verbose: print('\n%d surrounding zeros for (%d, %d), fix to 1e-9' % (nzeros[ybin,xbin], xbin, ybin))
+                        self.binVars[bin_name] = ROOT.RooConstVar(bin_name, bin_name, bin_val)
                     else:
-                        bin_val = cat_hist.GetBinContent(xbin,ybin)
                         if verbose and bin_val < 5: print('\nBin (%d, %d) has %d entries, set to 5' % (bin_val, xbin, ybin))
-                        self.binVars[bin_name] = RooRealVar(bin_name, bin_name, max(5,bin_val), 1e-6, 1e6)
+                        self.binVars[bin_name] = ROOT.RooRealVar(bin_name, bin_name, max(5,bin_val), 1e-6, 1e6)
                         self.nuisances.append({'name':bin_name, 'constraint':'flatParam', 'obj': self.binVars[bin_name]})
                     self._varStorage.append(self.binVars[bin_name]) # For safety if we add shape templates            
                      
@@ -416,20 +467,21 @@ class BinnedDistribution(Generic2D):
             forcePositive (bool, optional): If True, shape template mapping will use exponentials so that values asymptotically
                 approach zero as the associated nuisance increases/decreases. If False, the mapping will be linear.
         '''
-        nuisance_par = RooRealVar(nuis_name,nuis_name,0,-5,5)
+        nuisance_par = ROOT.RooRealVar(nuis_name,nuis_name,0,-5,5)
         self.nuisances.append({'name':nuis_name, 'constraint':constraint, 'obj': nuisance_par})
 
         for cat in _subspace:
             cat_name = self.name+'_'+cat
             cat_hist_up =   copy_hist_with_new_bins(up_shape.GetName()+'_'+cat,  'X', up_shape,   self.binning.xbinByCat[cat])
             cat_hist_down = copy_hist_with_new_bins(down_shape.GetName()+'_'+cat,'X', down_shape, self.binning.xbinByCat[cat])
+            content_up, content_down = hist_to_array(cat_hist_up)[0], hist_to_array(cat_hist_down)[0]
             for ybin in range(1,cat_hist_up.GetNbinsY()+1):
                 for xbin in range(1,cat_hist_up.GetNbinsX()+1):
                     bin_name = '%s_%s_bin_%s-%s'%(cat_name,nuis_name,xbin,ybin)
                     self.binVar[bin_name] = singleBinInterp( # change to singleBinInterpQuad to change interpolation method
                                                 bin_name, self.getBinVar(xbin,ybin,cat), nuisance_par,
-                                                cat_hist_up.GetBinContent(xbin,ybin),
-                                                cat_hist_down.GetBinContent(xbin,ybin),
+                                                float(content_up[ybin,xbin]),
+                                                float(content_down[ybin,xbin]),
                                                 self.forcePositive
                     )
                     self._varStorage.append(self.binVars[bin_name]) # For safety if we add more shape templates  
@@ -437,15 +489,55 @@ class BinnedDistribution(Generic2D):
     def KDESmooth(self):
         raise NotImplementedError()
 
-    def _nSurroundingZeros(self,hist,xbin,ybin):
-        nzeros = 0
-        if hist.GetBinContent(xbin,ybin) > 0:
-            nzeros = 0
-        else:
-            for pair in itertools.product([xbin,xbin-1,xbin+1],[ybin-1,ybin,ybin+1]):
-                if hist.GetBinContent(pair[0],pair[1]) <= 0:
-                    nzeros += 1
-        return nzeros
+def _surrounding_zeros(content):
+    '''Count the empty neighbours of every bin. A `BinnedDistribution` bin is kept constant
+    (rather than floated) if it is surrounded by more than 7 empty bins.
+    For each bin with content <= 0, count the bins with content <= 0 in the 3x3 block
+    centered on it (including itself and the under/overflow bins). Bins with
+    positive content have a count of zero.
+
+    Args:
+        content (numpy.ndarray): Bin contents of shape (nbinsY+2, nbinsX+2) including the under/overflow bins.
+
+    Returns:
+        numpy.ndarray: Counts with the same shape as `content`. The under/overflow entries are zero.
+    '''
+    empty = (content <= 0).astype(int)
+    ny, nx = content.shape[0]-2, content.shape[1]-2
+    counts = numpy.zeros(content.shape, dtype=int)
+    for dy, dx in itertools.product([-1,0,1],[-1,0,1]):
+        counts[1:-1,1:-1] += empty[1+dy:ny+1+dy, 1+dx:nx+1+dx]
+    counts[content > 0] = 0
+    return counts
+
+def _formula_node_maker(operator):
+    '''Build the per-bin node factory for `Generic2D._manipulate` using RooFormulaVars.
+
+    Args:
+        operator (str): Connecting mathematical operator string.
+
+    Returns:
+        function: Takes the new bin name and the two bin RooAbsReals and returns the new bin RooAbsReal.
+    '''
+    return lambda bin_name, a, b: ROOT.RooFormulaVar(bin_name, bin_name, '@0%s@1'%operator, ROOT.RooArgList(a, b))
+
+def _arithmetic_node_maker(operator):
+    '''Build the per-bin node factory for `Generic2D._manipulate` using RooProduct
+    for "*" and RooAddition for "+". Falls back to `_formula_node_maker` for other
+    operators, including the "<factor>*" of `Generic2D.Add`, which a single
+    RooFormulaVar per bin describes with fewer nodes than a weighted RooAddition.
+
+    Args:
+        operator (str): Connecting mathematical operator string.
+
+    Returns:
+        function: Takes the new bin name and the two bin RooAbsReals and returns the new bin RooAbsReal.
+    '''
+    if operator == '*':
+        return lambda bin_name, a, b: ROOT.RooProduct(bin_name, bin_name, ROOT.RooArgList(a, b))
+    if operator == '+':
+        return lambda bin_name, a, b: ROOT.RooAddition(bin_name, bin_name, ROOT.RooArgList(a, b))
+    return _formula_node_maker(operator)
 
 def singleBinInterp(name, nuis, binVar, upVal, downVal, forcePositive):
     '''Create a RooFormulaVar containing the nuisance parameter that can
@@ -489,7 +581,7 @@ def singleBinInterp(name, nuis, binVar, upVal, downVal, forcePositive):
         neg_term = '(1+(1-{d})*@0)'.format(d=downVal)
     
     full = '@1*({act_pos}*{pos}+{act_neg}*{neg})/{nom}'.format(act_pos=activate_pos, act_neg=activate_neg, pos=pos_term, neg=neg_term, nom=binVar.getValV())
-    return RooFormulaVar(name, name, full, RooArgList(nuis,binVar))
+    return ROOT.RooFormulaVar(name, name, full, ROOT.RooArgList(nuis,binVar))
 
 # def singleBinInterpQuad(name, nuis, binVar, upVal, downVal): # NOT USED
 #     nomVal = binVar.getValV()
@@ -501,13 +593,13 @@ def singleBinInterp(name, nuis, binVar, upVal, downVal, forcePositive):
 #         '(@0 > -1 && @0 < 1)*(%s*@0**2+%s*@0+%s)'%(a,b,c),
 #         '(@0 > 1)*(%s*@0+%s)'%(m_1,b_1)]
     
-#     return RooFormulaVar(name, name, '@1*(({0})-{1})/{1}'.format('+'.join(pieces),nomVal), RooArgList(nuis,binVar))
+#     return ROOT.RooFormulaVar(name, name, '@1*(({0})-{1})/{1}'.format('+'.join(pieces),nomVal), ROOT.RooArgList(nuis,binVar))
 
 # def singleBinInterpCombine(name, nuis, binVar, upVal, downVal): # NOT USED
 #     nomVal = binVar.getValV()
 #     pieces = '(abs(@0) < 1)*(0.125*@0*(pow(@0,2)*(3*pow(@0,2) - 10) + 15))-(@0 < -1)+(@0 > 1)'
 #     alpha = '@1*( (@0/2) * (({up}-{down})+({up}+{down}-2*{nom})*({piecewise})) )/{nom}'.format(up=upVal,down=downVal,nom=nomVal,piecewise=pieces)
-#     return RooFormulaVar(name,name,alpha,RooArgList(nuis,binVar))
+#     return ROOT.RooFormulaVar(name,name,alpha,ROOT.RooArgList(nuis,binVar))
 
 # class quadratic:
 #     def __init__(self, params):
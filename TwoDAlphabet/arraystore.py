@@ -0,0 +1,225 @@
+'''Histogram store backed by a single memory-mapped array file, used as the "array"
+backend of `OrganizedHists`.
+
+The contents and sums of squared weights of all histograms (with the under/overflow
+bins, as float64) are appended to one raw data file. A JSON name index next to it
+(<data file>.json) holds, for each histogram, its offset in the data file and the
+metadata needed to export it back to ROOT (class, title, bin edges, axis names and
+titles, fill color, and statistics). The index is written when the store is closed
+so an interrupted build leaves no index and is not read back.
+
+Reading the arrays of a histogram (`GetArrays()`) is a slice of the memory-mapped file
+and does not need ROOT. Processes that open the same store share its pages. A TH2 is
+only made when the histogram is requested with `Get()` (ex. when the workspace is built).
+
+The store implements the parts of the TFile and KeyIndex interfaces used by
+`OrganizedHists` (`WriteTObject`, `Get`, `Delete`, `Close`, `GetName`, `Names`, `Invalidate`).
+'''
+import array, json, os, numpy
+from collections import OrderedDict
+from TwoDAlphabet.helpers import ROOT, hist_to_array, set_hist_from_array
+
+_store_version = 1
+_read_modes = ['READ','OPEN']
+_write_modes = ['UPDATE','RECREATE']
+
+class ArrayStore():
+    def __init__(self, filename, mode='READ'):
+        '''Open an array store.
+
+        Args:
+            filename (str): Data file name. The index is `filename`+".json".
+            mode (str, optional): "READ" (or "OPEN"), "UPDATE", or "RECREATE". Defaults to "READ".
+
+        Raises:
+            ValueError: If the mode is not accepted.
+            IOError: If the store does not exist or is of another version (READ and UPDATE modes).
+        '''
+        mode = mode.upper()
+        if mode not in _read_modes+_write_modes:
+            raise ValueError('Mode "%s" not accepted. Options are %s.'%(mode, ', '.join(_read_modes+_write_modes)))
+        self.filename = filename
+        self.indexname = filename+'.json'
+        self.mode = mode
+        self._data = None
+
+        if mode == 'RECREATE':
+            open(self.filename,'wb').close()
+            if os.path.exists(self.indexname):
+                os.remove(self.indexname)
+            self.index = OrderedDict()
+        else:
+            if not store_exists(filename):
+                raise IOError('Array store %s does not exist.'%filename)
+            with open(self.indexname) as f:
+                meta = json.load(f, object_pairs_hook=OrderedDict)
+            if meta.get('version') != _store_version:
+                raise IOError('Array store %s is of version %s (expected %s).'%(filename, meta.get('version'), _store_version))
+            self.index = meta['hists']
+        self._size = os.path.getsize(self.filename)//8
+
+    def GetName(self):
+        return self.filename
+
+    def _array(self):
+        if self._data is None and self._size > 0:
+            self._data = numpy.memmap(self.filename, dtype='f8', mode='r', shape=(self._size,))
+        return self._data
+
+    def _checkWritable(self):
+        if self.mode not in _write_modes:
+            raise IOError('Array store %s is opened read-only.'%self.filename)
+
+    def WriteTObject(self, h, name, option=''):
+        '''Append a TH1 or TH2 to the store. A previous histogram of the same name is replaced
+        (its arrays become unused and are removed by `Compact()`).
+
+        Args:
+            h (TH1): Histogram.
+            name (str): Name to store it under.
+            option (str, optional): Ignored (accepted for compatibility with TDirectory::WriteTObject).
+
+        Returns:
+            None
+        '''
+        self._checkWritable()
+        content, sumw2 = hist_to_array(h)
+        with open(self.filename,'ab') as f:
+            f.write(numpy.ascontiguousarray(content, dtype='f8').tobytes())
+            f.write(numpy.ascontiguousarray(sumw2, dtype='f8').tobytes())
+
+        stats = array.array('d', [0.]*13)
+        h.GetStats(stats)
+        entry = OrderedDict([
+            ('offset', self._size),
+            ('shape', list(content.shape)),
+            ('class', h.ClassName()),
+            ('title', h.GetTitle()),
+            ('color', h.GetFillColor()),
+            ('entries', h.GetEntries()),
+            ('stats', list(stats)[:_nstats(content.ndim)])
+        ])
+        for axis in ['X','Y'][:content.ndim]:
+            a = getattr(h,'Get%saxis'%axis)()
+            entry[axis] = [a.GetName(), a.GetTitle(), [a.GetBinLowEdge(i) for i in range(1,a.GetNbins()+2)]]
+
+        self.index.pop(name, None)
+        self.index[name] = entry
+        self._size += 2*content.size
+        self._data = None
+
+    def GetArrays(self, name):
+        '''
+        Args:
+            name (str): Histogram name.
+
+        Raises:
+            NameError: If the histogram is not in the store.
+
+        Returns:
+            tuple(numpy.ndarray): Read-only views of the contents and sums of squared weights,
+            indexed as [xbin] (TH1) or [ybin][xbin] (TH2) and including the under/overflow bins.
+        '''
+        if name not in self.index:
+            raise NameError('Histogram %s does not exist in %s.'%(name, self.filename))
+        entry = self.index[name]
+        shape = tuple(entry['shape'])
+        n = int(numpy.prod(shape))
+        data = self._array()[entry['offset']:entry['offset']+2*n]
+        return data[:n].reshape(shape), data[n:].reshape(shape)
+
+    def Get(self, name):
+        '''Export a histogram to ROOT (not attached to any directory).
+
+        Args:
+            name (str): Histogram name.
+
+        Returns:
+            TH1: Histogram, or None if it is not in the store (as with TFile::Get).
+        '''
+        if name not in self.index:
+            return None
+        entry = self.index[name]
+        content, sumw2 = self.GetArrays(name)
+        axes = []
+        for axis in ['X','Y'][:content.ndim]:
+            edges = entry[axis][2]
+            axes.extend([len(edges)-1, array.array('d',edges)])
+        h = getattr(ROOT, entry['class'])(name, entry['title'], *axes)
+        h.SetDirectory(0)
+        for axis in ['X','Y'][:content.ndim]:
+            getattr(h,'Get%saxis'%axis)().SetName(entry[axis][0])
+            getattr(h,'Get%saxis'%axis)().SetTitle(entry[axis][1])
+        set_hist_from_array(h, content, sumw2)
+        h.PutStats(array.array('d', entry['stats']))
+        h.SetEntries(entry['entries'])
+        h.SetFillColor(entry['color'])
+        return h
+
+    def Delete(self, namecycle):
+        '''Remove a histogram from the index. Accepts TDirectory-style "name;*" names.'''
+        self._checkWritable()
+        self.index.pop(namecycle.split(';')[0], None)
+
+    def Compact(self):
+        '''Rewrite the data file with only the arrays of the histograms in the index.
+        The index on disk is removed first (its offsets no longer hold) and is only
+        written again by `Close()` so an interrupted compaction is never read back.
+
+        Returns:
+            None
+        '''
+        self._checkWritable()
+        if os.path.exists(self.indexname):
+            os.remove(self.indexname)
+        data = self._array()
+        tmp_name = self.filename+'.tmp'
+        offset = 0
+        with open(tmp_name,'wb') as f:
+            for entry in self.index.values():
+                n = 2*int(numpy.prod(entry['shape']))
+                f.write(numpy.asarray(data[entry['offset']:entry['offset']+n]).tobytes())
+                entry['offset'] = offset
+                offset += n
+        self._data = None
+        os.replace(tmp_name, self.filename)
+        self._size = offset
+
+    def Close(self):
+        '''Write the index (compacting the data file first if more than half of it is unused).
+
+        Returns:
+            None
+        '''
+        if self.mode in _write_modes:
+            used = sum(2*int(numpy.prod(e['shape'])) for e in self.index.values())
+            if self._size > 2*used:
+                self.Compact()
+            tmp_name = self.indexname+'.tmp'
+            with open(tmp_name,'w') as f:
+                json.dump({'version': _store_version, 'hists': self.index}, f)
+            os.replace(tmp_name, self.indexname)
+            self.mode = 'READ'
+        self._data = None
+
+    # KeyIndex interface
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def Names(self):
+        return list(self.index.keys())
+
+    def Invalidate(self):
+        '''Nothing to do - the index is always up to date.'''
+        pass
+
+def store_exists(filename):
+    '''Whether a complete array store exists (data file and index).'''
+    return os.path.exists(filename) and os.path.exists(filename+'.json')
+
+def _nstats(ndim):
+    # TH1: sumw, sumw2, sumwx, sumwx2; TH2 adds sumwy, sumwy2, sumwxy
+    return 4 if ndim == 1 else 7
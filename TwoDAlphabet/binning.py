@@ -1,5 +1,5 @@
-import ROOT, array
-from math import sqrt
+import array, numpy, json, bisect
+from TwoDAlphabet.helpers import ROOT, hist_to_array, set_hist_from_array
 
 class Binning:
     '''Class to handle information on and manipulations of binning schemes.'''
@@ -16,11 +16,101 @@ class Binning:
         self.sigEnd = binning_dict['X']['SIGEND']
         self.xtitle = binning_dict['X']['TITLE']
         self.ytitle = binning_dict['Y']['TITLE']
+        self.xname = binning_dict['X']['NAME']
+        self.yname = binning_dict['Y']['NAME']
         self.xbinByCat, self.ybinList = parse_binning_info(binning_dict)
         self.ySlices,self.ySliceIdx = self._getYslices(binning_dict) # x slices defined as properties
+        self._buildIndex()
         self._checkBinning('X',start_template)
         self._checkBinning('Y',start_template)
-        self.xVars, self.yVar = self.CreateRRVs(binning_dict['X'], binning_dict['Y']) 
+        self._rrvs = None # xVars and yVar are created on first access
+
+    _serialized = ['name','sigStart','sigEnd','xtitle','ytitle','xname','yname','xbinByCat','ybinList','ySlices','ySliceIdx']
+
+    def ToDict(self):
+        '''Plain (json-able) representation of the binning. Does not include the RooRealVars
+        which are recreated by `FromDict()` when first accessed.
+
+        Returns:
+            dict: Names, titles, bin edges, and slices of the binning.
+        '''
+        return {k: getattr(self,k) for k in self._serialized}
+
+    @classmethod
+    def FromDict(cls, d):
+        '''Rebuild a Binning from the output of `ToDict()` (without ROOT and without
+        the sanity checks against the input histograms done at construction).
+
+        Args:
+            d (dict): Output of `ToDict()`.
+
+        Returns:
+            Binning: New Binning.
+        '''
+        out = cls.__new__(cls)
+        for k in cls._serialized:
+            setattr(out, k, d[k])
+        out._rrvs = None
+        out._buildIndex()
+        return out
+
+    _derived = ['_xbinList','xEdges','yEdges','xEdgesByCat','_globalXbinIdx','_xcatTable','_nLowBins','_nSigBins']
+
+    def _buildIndex(self):
+        '''Precompute the (immutable) edge arrays and the global <-> (category, local index)
+        tables of the X axis so that the per-bin lookups do not search the edge lists.'''
+        self._xbinList = concat_bin_dicts(self.xbinByCat)
+        self.xEdges = _frozen_array(self._xbinList)
+        self.yEdges = _frozen_array(self.ybinList)
+        self.xEdgesByCat = {c: _frozen_array(self.xbinByCat[c]) for c in self.xbinByCat}
+
+        first_idx = {}
+        for i, edge in enumerate(self._xbinList):
+            first_idx.setdefault(edge, i)
+        self._globalXbinIdx = {c: [first_idx[edge] for edge in self.xbinByCat[c]] for c in self.xbinByCat}
+
+        self._nLowBins = len(self.xbinByCat['LOW'])-1
+        self._nSigBins = len(self.xbinByCat['SIG'])-1
+        self._xcatTable = [self._xcatFromGlobal(xbin) for xbin in range(len(self._xbinList))]
+
+    def __getstate__(self):
+        # RooFit objects are not pickled - they are recreated on first access.
+        # Derived lookup tables are rebuilt on unpickling.
+        state = self.__dict__.copy()
+        state['_rrvs'] = None
+        for k in self._derived:
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        if 'xVars' in state: # pickled before the RooRealVars were created lazily
+            state['_rrvs'] = (state.pop('xVars'), state.pop('yVar'))
+            state.setdefault('xname', state['_rrvs'][0]['LOW'].GetName()[:-len('_LOW_'+state['name'])])
+            state.setdefault('yname', state['_rrvs'][1].GetName()[:-len('_'+state['name'])])
+        self.__dict__.update(state)
+        self._buildIndex()
+
+    @property
+    def xVars(self):
+        '''
+        Returns:
+            dict: X axis RooRealVars for the LOW, SIG, and HIGH categories (created on first access).
+        '''
+        return self._getRRVs()[0]
+
+    @property
+    def yVar(self):
+        '''
+        Returns:
+            RooRealVar: Y axis RooRealVar (created on first access).
+        '''
+        return self._getRRVs()[1]
+
+    def _getRRVs(self):
+        if self._rrvs is None:
+            self._rrvs = self.CreateRRVs({'NAME': self.xname, 'TITLE': self.xtitle},
+                                         {'NAME': self.yname, 'TITLE': self.ytitle})
+        return self._rrvs
 
     def CreateRRVs(self,xdict,ydict):
         '''Create the RooRealVars representing the X and Y axes.
@@ -58,7 +148,7 @@ class Binning:
         input_min = getattr(start_template,'Get%saxis'%axis)().GetXmin()
         input_max = getattr(start_template,'Get%saxis'%axis)().GetXmax()
 
-        if axis == 'X': new_bins = self.xbinList
+        if axis == 'X': new_bins = self._xbinList
         else: new_bins = self.ybinList
 
         if (new_bins[0] < input_min) or (new_bins[-1] > input_max):
@@ -94,11 +184,11 @@ class Binning:
 
     @property
     def xSliceIdx(self):
-        return [0,self.GlobalXbinIdx(0,'SIG'),self.GlobalXbinIdx(-1,'SIG'),len(self.xbinList)-1]
+        return [0,self.GlobalXbinIdx(0,'SIG'),self.GlobalXbinIdx(-1,'SIG'),len(self._xbinList)-1]
 
     @property
     def xSlices(self):
-        return [int(self.xbinList[i]) for i in self.xSliceIdx]
+        return [int(self._xbinList[i]) for i in self.xSliceIdx]
 
     def GlobalXbinIdx(self,xbin,c):
         '''Evaluate for the bin - a bit tricky since it was built with separate categories.
@@ -112,26 +202,63 @@ class Binning:
         Returns:
             int: Global index
         '''
-        return self.xbinList.index(self.xbinByCat[c][xbin])
+        return self._globalXbinIdx[c][xbin]
 
     def xcatFromGlobal(self,xbin):
-        n_low_bins = len(self.xbinByCat['LOW'])-1
-        n_sig_bins = len(self.xbinByCat['SIG'])-1
-        if xbin < n_low_bins+1:
+        '''Inverse of `GlobalXbinIdx`.
+
+        Args:
+            xbin (int): Global bin index.
+
+        Returns:
+            tuple: (0) Category local bin index and (1) category name - LOW, SIG, or HIGH.
+        '''
+        if 0 <= xbin < len(self._xcatTable):
+            return self._xcatTable[xbin]
+        return self._xcatFromGlobal(xbin)
+
+    def _xcatFromGlobal(self,xbin):
+        if xbin < self._nLowBins+1:
             return xbin,'LOW'
-        elif xbin < n_low_bins+n_sig_bins+1:
-            return xbin-n_low_bins,'SIG'
+        elif xbin < self._nLowBins+self._nSigBins+1:
+            return xbin-self._nLowBins,'SIG'
         else:
-            return xbin-n_low_bins-n_sig_bins,'HIGH'
+            return xbin-self._nLowBins-self._nSigBins,'HIGH'
 
     @property
     def xbinList(self):
         '''
         Returns:
             list: X axis binning dict converted from a dictionary of the regions to
-            a continuous list of bin edges for the full X axis.
+            a continuous list of bin edges for the full X axis. A copy of the list computed
+            at construction (which `FindBinX` searches).
         '''
-        return concat_bin_dicts(self.xbinByCat)
+        return list(self._xbinList)
+
+    def FindBinX(self,value,cat=''):
+        '''Find the X bin containing `value` with the ROOT conventions (bins start at 1,
+        0 is the underflow and nbins+1 the overflow, the upper edge belongs to the overflow).
+
+        Args:
+            value (float): Value to look up.
+            cat (str, optional): One of "LOW", "SIG", or "HIGH" to get the bin in the
+                given subspace. Defaults to '' in which case the global bin is returned.
+
+        Returns:
+            int: Bin index.
+        '''
+        return bisect.bisect_right(self.xbinByCat[cat] if cat != '' else self._xbinList, value)
+
+    def FindBinY(self,value):
+        '''Find the Y bin containing `value` with the ROOT conventions (see `FindBinX`).
+
+        Args:
+            value (float): Value to look up.
+
+        Returns:
+            int: Bin index.
+        '''
+        return bisect.bisect_right(self.ybinList, value)
 
     def GetBinCenterBase(self,ibin,binlist):
         if ibin < 1: raise ValueError('Binning is indexed at 1 for compatibility with ROOT.')
@@ -147,7 +274,7 @@ class Binning:
         if cat != '':
             xbins = self.xbinByCat[cat]
         else:
-            xbins = self.xbinList
+            xbins = self._xbinList
 
         return ROOT.TH2F(name,name,
                         len(xbins)-1,
@@ -156,6 +283,36 @@ class Binning:
                         array.array('d',self.ybinList)
         )
 
+def _frozen_array(values):
+    out = numpy.array(values, dtype=float)
+    out.flags.writeable = False
+    return out
+
+def save_binnings(binnings, filename):
+    '''Save a dictionary of Binning objects to a json file (see `Binning.ToDict()`).
+
+    Args:
+        binnings (dict): Map of binning names to Binning objects.
+        filename (str): Output json file name.
+
+    Returns:
+        None
+    '''
+    with open(filename,'w') as f:
+        json.dump({k: b.ToDict() for k,b in binnings.items()}, f, indent=2)
+
+def load_binnings(filename):
+    '''Load the dictionary of Binning objects saved by `save_binnings()`.
+
+    Args:
+        filename (str): Input json file name.
+
+    Returns:
+        dict: Map of binning names to Binning objects.
+    '''
+    with open(filename) as f:
+        return {k: Binning.FromDict(d) for k,d in json.load(f).items()}
+
 def create_RRV_base(name,title,bins):
     '''Generically create a RooRealVar with the specified bin edges.
 
@@ -414,6 +571,11 @@ def copy_hist_with_new_bins(copyName,XorY,inHist,new_bins):
     New bins must be larger than the old bins and the edges of new bins must line up with 
     existing edges (no finer binning and no splitting bins).
 
+    The input content and error arrays are read in one shot, the old bin edges are mapped
+    onto the new ones with an index table, and the merged bins are aggregated with
+    array operations. The result is bit-identical to the previous per-bin implementation
+    (kept in test/benchmarks/reference.py).
+
     Args:
         copyName (str): Name of copy.
         XorY (str): "X" or "Y" to change which axis is rebinned.
@@ -432,11 +594,33 @@ def copy_hist_with_new_bins(copyName,XorY,inHist,new_bins):
         raise ValueError('Arg XorY is not "X" or "Y".')
     axis_to_rebin = XorY
     axis_to_hold = "X" if XorY=="Y" else "Y"
-    
+
     static_array = array.array('f',get_bins_from_hist(axis_to_hold,inHist))
     static_nbins = len(static_array)-1
     rebin_array = array.array('f',new_bins)
-    rebin_nbins = len(rebin_array)-1 
+    rebin_nbins = len(rebin_array)-1
+
+    # Index table: new bin i collects old bins [group_start[i], group_stop[i])
+    old_edges = numpy.array(get_bins_from_hist(axis_to_rebin,inHist), dtype='f8')
+    new_edges = numpy.array(rebin_array, dtype='f8')
+    group_start, group_stop = _rebin_index_table(axis_to_rebin, old_edges, new_edges)
+
+    # Arrays are indexed [ybin][xbin] and include the under/overflow bins.
+    # Work with the rebinned axis first so the aggregation is a column loop.
+    content, sumw2 = hist_to_array(inHist)
+    if axis_to_rebin == "X":
+        content, sumw2 = content.T, sumw2.T
+    content = content[1:-1, 1:static_nbins+1]
+    # Matches GetBinError()**2 of the per-bin implementation to the last bit
+    errorsq = numpy.sqrt(sumw2[1:-1, 1:static_nbins+1])**2
+
+    new_content = numpy.zeros((rebin_nbins, static_nbins))
+    new_errorsq = numpy.zeros((rebin_nbins, static_nbins))
+    for rebin in range(rebin_nbins):
+        # Sequential sum (rather than a pairwise reduction) to keep the summation order
+        for old_bin in range(group_start[rebin], group_stop[rebin]):
+            new_content[rebin] += content[old_bin]
+            new_errorsq[rebin] += errorsq[old_bin]
 
     # Use copyName with _temp to avoid overwriting if inHist has the same name
     # We can do this at the end but not before we're finished with inHist
@@ -447,55 +631,52 @@ def copy_hist_with_new_bins(copyName,XorY,inHist,new_bins):
     hist_copy.Sumw2()
     hist_copy.GetXaxis().SetName(inHist.GetXaxis().GetName())
     hist_copy.GetYaxis().SetName(inHist.GetYaxis().GetName())
-    old_axis = getattr(inHist,'Get%saxis'%axis_to_rebin)()
-    rebin_axis = getattr(hist_copy,'Get%saxis'%axis_to_rebin)()
-
-    # Loop through the old bins
-    for static_bin in range(1,static_nbins+1):
-        # print 'Bin y: ' + str(binY)
-        for rebin in range(1,rebin_nbins+1):
-            new_bin_content = 0
-            new_bin_errorsq = 0
-            new_bin_min = rebin_axis.GetBinLowEdge(rebin)
-            new_bin_max = rebin_axis.GetBinUpEdge(rebin)
-
-            # print '\t New bin x: ' + str(newBinX) + ', ' + str(newBinXlow) + ', ' + str(newBinXhigh)
-            for old_bin in range(1,old_axis.GetNbins()+1):
-                old_bin_min = old_axis.GetBinLowEdge(old_bin)
-                old_bin_max = old_axis.GetBinUpEdge(old_bin)
-                if old_bin_min >= new_bin_max:
-                    break
-                elif old_bin_min >= new_bin_min and old_bin_min < new_bin_max:
-                    if old_bin_max <= new_bin_max:
-                        if axis_to_rebin == "X":
-                            new_bin_content += inHist.GetBinContent(old_bin,static_bin)
-                            new_bin_errorsq += inHist.GetBinError(old_bin,static_bin)**2
-                        else:
-                            new_bin_content += inHist.GetBinContent(static_bin,old_bin)
-                            new_bin_errorsq += inHist.GetBinError(static_bin,old_bin)**2
-                    elif old_bin_max > new_bin_max:
-                        raise ValueError(
-                            '''The requested %s rebinning does not align bin edges with the input bin edge.
-                            Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_to_rebin,old_bin_min,old_bin_max,new_bin_min,new_bin_max))
-                elif old_bin_min <= new_bin_min and old_bin_max > new_bin_min:
-                    raise ValueError(
-                        '''The requested %s rebinning does not align bin edges with the input bin edge.
-                        Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_to_rebin,old_bin_min,old_bin_max,new_bin_min,new_bin_max))
-
-            # print '\t Setting content ' + str(newBinContent) + '+/-' + str(sqrt(newBinErrorSq))
-            if new_bin_content > 0:
-                if axis_to_rebin == "X":
-                    hist_copy.SetBinContent(rebin,static_bin,new_bin_content)
-                    hist_copy.SetBinError(rebin,static_bin,sqrt(new_bin_errorsq))
-                else:
-                    hist_copy.SetBinContent(static_bin,rebin,new_bin_content)
-                    hist_copy.SetBinError(static_bin,rebin,sqrt(new_bin_errorsq))
+
+    # Only bins with positive content are filled (others are left empty)
+    filled = new_content > 0
+    new_error = numpy.sqrt(new_errorsq)
+    new_content = numpy.where(filled, new_content, 0.)
+    new_sumw2 = numpy.where(filled, new_error*new_error, 0.) # as stored by SetBinError()
+    if axis_to_rebin == "X":
+        new_content, new_sumw2 = new_content.T, new_sumw2.T
+    set_hist_from_array(hist_copy, new_content, new_sumw2)
 
     # Will now set the copyName which will overwrite inHist if it has the same name
     hist_copy.SetName(copyName)
     hist_copy.SetTitle(copyName)
     return hist_copy
 
+def _rebin_index_table(axis_name, old_edges, new_edges):
+    '''Map each new bin onto the contiguous range of old bins that it merges.
+
+    Args:
+        axis_name (str): "X" or "Y". Only used for error messages.
+        old_edges (numpy.ndarray): Bin edges of the input axis.
+        new_edges (numpy.ndarray): Requested bin edges.
+
+    Raises:
+        ValueError: If a new bin edge would split an input bin.
+
+    Returns:
+        tuple(numpy.ndarray): Start (inclusive) and stop (exclusive) 0-indexed old bin
+            for each new bin.
+    '''
+    old_low, old_high = old_edges[:-1], old_edges[1:]
+    group_start = numpy.searchsorted(old_low, new_edges[:-1], side='left')
+    group_stop  = numpy.searchsorted(old_low, new_edges[1:],  side='left')
+
+    for i in range(len(new_edges)-1):
+        new_bin_min, new_bin_max = new_edges[i], new_edges[i+1]
+        straddles_low  = group_start[i] > 0 and old_high[group_start[i]-1] > new_bin_min
+        straddles_high = group_stop[i] > group_start[i] and old_high[group_stop[i]-1] > new_bin_max
+        if straddles_low or straddles_high:
+            split = group_start[i]-1 if straddles_low else group_stop[i]-1
+            raise ValueError(
+                '''The requested %s rebinning does not align bin edges with the input bin edge.
+                Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_name,old_low[split],old_high[split],new_bin_min,new_bin_max))
+
+    return group_start, group_stop
+
 def get_min_bin_width(hist):
     '''Get the minimum width among all bins in a 1D histogram.
 
@@ -0,0 +1,274 @@
+'''On-disk cache of the templates processed by `OrganizedHists.Add()` (scaled, rebinned,
+trimmed, and split into the LOW, SIG, and HIGH sub-regions) so that a new project
+(ex. a new tag or a new toy iteration) only processes the rows whose inputs changed.
+
+Entries are keyed by a hash of everything the processed histograms depend on:
+the source file (its path, size, and modification time or, optionally, its content),
+the source histogram name, the scale, the binning edges, and whether the signal
+trimming applies. The histogram names are not part of the key - cached histograms
+are renamed when reused - so entries are shared between projects.
+
+The cache can be pruned from the command line:
+    python -m TwoDAlphabet.cache prune <cache dir> [--max-size 5G] [--max-age 30]
+    python -m TwoDAlphabet.cache info <cache dir>
+'''
+import argparse, hashlib, json, os, tempfile, time
+from TwoDAlphabet.helpers import ROOT
+
+_cache_version = 1
+_subspaces = ['LOW','SIG','HIGH']
+_size_units = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+class IngestCache:
+    def __init__(self, cacheDir, maxSize=0, fingerprint='mtime'):
+        '''Cache of processed templates stored as one ROOT file per entry in `cacheDir`.
+
+        Args:
+            cacheDir (str): Directory of the cache. Created if it does not exist.
+            maxSize (int or str, optional): Maximum size of the cache in bytes (or with a
+                K, M, G, or T suffix, ex. "5G"). The least recently used entries are removed
+                when the cache grows beyond it (see `Prune()`). Defaults to 0 (no limit).
+            fingerprint (str, optional): How source files are identified - "mtime" (path,
+                size, and modification time) or "content" (hash of the file content).
+                Defaults to "mtime".
+
+        Raises:
+            ValueError: If `fingerprint` is not "mtime" or "content".
+        '''
+        if fingerprint not in ['mtime','content']:
+            raise ValueError('Fingerprint "%s" not accepted. Options are "mtime" and "content".'%fingerprint)
+        self.cacheDir = cacheDir
+        self.maxSize = parse_size(maxSize)
+        self.fingerprint = fingerprint
+        self.hits, self.misses = 0, 0
+        self._file_ids = {}
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+    def Key(self, filename, row, binningEdges, trimSig):
+        '''Key of the processed histograms of a row of the histogram map.
+
+        Args:
+            filename (str): Source file name.
+            row (namedtuple): Row of the histogram map.
+            binningEdges (tuple): Y bin edges, X bin edges, and X bin edges per category.
+            trimSig (bool): Whether the signal trimming applies to this row.
+
+        Returns:
+            str: Hex digest, or None if the source file cannot be identified (ex. remote files).
+        '''
+        return row_key(self._fileId(filename), row, binningEdges, trimSig)
+
+    def _fileId(self, filename):
+        version = source_id(filename)
+        if version is None or self.fingerprint == 'mtime':
+            return version
+
+        # content hash, computed once per file version
+        version = tuple(version)
+        if version not in self._file_ids:
+            sha = hashlib.sha256()
+            with open(filename,'rb') as f:
+                for chunk in iter(lambda: f.read(1<<20), b''):
+                    sha.update(chunk)
+            self._file_ids[version] = sha.hexdigest()
+        return self._file_ids[version]
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, key[:2], key+'.root')
+
+    def Get(self, key, outHistname, color, subspaces=_subspaces):
+        '''Get the cached full and sub-region histograms, renamed as they would be
+        by the processing of a row with output name `outHistname`.
+
+        Args:
+            key (str): Entry key (see `Key()`).
+            outHistname (str): Name of the full histogram.
+            color (int): Fill color of the full histogram.
+            subspaces (list(str), optional): Order of the sub-regions. Defaults to LOW, SIG, HIGH.
+
+        Returns:
+            list(TH2): Full histogram followed by the sub-region histograms, or None if
+            the entry does not exist or is incomplete (ex. removed by a `Prune()` of
+            another process while being read).
+        '''
+        path = self._path(key) if key is not None else None
+        if path is None or not os.path.exists(path):
+            self.misses += 1
+            return None
+
+        f = ROOT.TFile.Open(path)
+        if not f or f.IsZombie():
+            self.misses += 1
+            return None
+        out = []
+        for sub in ['FULL']+list(subspaces):
+            h = f.Get(sub)
+            if not h:
+                break
+            h.SetDirectory(0)
+            name = outHistname if sub == 'FULL' else outHistname.replace('_FULL','_'+sub)
+            h.SetName(name)
+            h.SetTitle(name)
+            out.append(h)
+        f.Close()
+
+        try:
+            os.utime(path, None) # mark as recently used
+        except OSError: # removed since it was opened
+            out = []
+        if len(out) != len(subspaces)+1:
+            self.misses += 1
+            return None
+
+        out[0].SetFillColor(color)
+        self.hits += 1
+        return out
+
+    def Put(self, key, hists, subspaces=_subspaces):
+        '''Store the full and sub-region histograms of a row (as returned by `Get()`).
+        The entry is written to a temporary file and moved in place so that concurrent
+        projects never read a partial entry.
+
+        Args:
+            key (str): Entry key (see `Key()`). Nothing is stored if None.
+            hists (list(TH2)): Full histogram followed by the sub-region histograms.
+            subspaces (list(str), optional): Order of the sub-regions. Defaults to LOW, SIG, HIGH.
+
+        Returns:
+            None
+        '''
+        if key is None:
+            return
+        path = self._path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.root', dir=os.path.dirname(path))
+        os.close(fd)
+        f = ROOT.TFile.Open(tmp_path,'RECREATE')
+        for sub, h in zip(['FULL']+list(subspaces), hists):
+            f.WriteTObject(h, sub)
+        f.Close()
+        os.replace(tmp_path, path)
+
+    def Entries(self):
+        '''
+        Returns:
+            list(tuple): (path, size in bytes, last use time) of each entry.
+        '''
+        out = []
+        for root, _, files in os.walk(self.cacheDir):
+            for fname in files:
+                if fname.endswith('.root'):
+                    path = os.path.join(root, fname)
+                    stat = os.stat(path)
+                    out.append((path, stat.st_size, stat.st_mtime))
+        return out
+
+    def Size(self):
+        return sum(size for _, size, _ in self.Entries())
+
+    def Prune(self, maxSize=None, maxAge=None):
+        '''Remove the entries not used in the last `maxAge` days and then the least
+        recently used entries until the cache is no larger than `maxSize`.
+
+        Args:
+            maxSize (int or str, optional): Maximum size (see `IngestCache`). Defaults to None
+                in which case the `maxSize` of the cache is used (0 means no limit).
+            maxAge (float, optional): Maximum age in days since the last use. Defaults to None (no limit).
+
+        Returns:
+            tuple: Number of entries removed and bytes freed.
+        '''
+        maxSize = self.maxSize if maxSize is None else parse_size(maxSize)
+        entries = sorted(self.Entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        nremoved, freed = 0, 0
+        for path, size, last_use in entries:
+            too_old = maxAge is not None and now-last_use > maxAge*86400
+            too_big = maxSize > 0 and total-freed > maxSize
+            if not (too_old or too_big):
+                continue
+            try:
+                os.remove(path)
+            except OSError: # removed by another process
+                continue
+            nremoved += 1
+            freed += size
+        return nremoved, freed
+
+def source_id(filename):
+    '''Identify a version of a source file by its path, size, and modification time.
+
+    Args:
+        filename (str): Source file name.
+
+    Returns:
+        list: Real path, size in bytes, and modification time in ns, or None if the file
+        cannot be found (ex. remote files).
+    '''
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [os.path.realpath(filename), stat.st_size, stat.st_mtime_ns]
+
+def row_key(file_id, row, binningEdges, trimSig):
+    '''Hash of the inputs of the processing of a row of the histogram map.
+
+    Args:
+        file_id (list or str): Identifier of the source file (see `source_id()`).
+        row (namedtuple): Row of the histogram map.
+        binningEdges (tuple): Y bin edges, X bin edges, and X bin edges per category.
+        trimSig (bool): Whether the signal trimming applies to this row.
+
+    Returns:
+        str: Hex digest, or None if `file_id` is None.
+    '''
+    if file_id is None:
+        return None
+    ybinList, xbinList, xbinByCat = binningEdges
+    payload = json.dumps([_cache_version, file_id, row.source_histname, float(row.scale),
+                          list(ybinList), [[c, list(v)] for c,v in xbinByCat.items()], bool(trimSig)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def parse_size(size):
+    '''Convert a size in bytes or with a K, M, G, or T suffix (ex. "5G") to bytes.
+
+    Args:
+        size (int, float, or str): Size.
+
+    Raises:
+        ValueError: If the suffix is not recognized.
+
+    Returns:
+        int: Size in bytes.
+    '''
+    if isinstance(size, (int,float)):
+        return int(size)
+    size = size.strip().upper().rstrip('B')
+    unit = size[-1] if size and size[-1].isalpha() else ''
+    if unit not in _size_units:
+        raise ValueError('Size unit "%s" not accepted. Options are K, M, G, and T.'%unit)
+    return int(float(size[:-1] if unit else size)*_size_units[unit])
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Inspect or prune the ingestion cache of TwoDAlphabet.')
+    parser.add_argument('command', choices=['prune','info'])
+    parser.add_argument('cacheDir', help='Cache directory.')
+    parser.add_argument('--max-size', dest='maxSize', default='0',
+        help='Maximum size of the cache after pruning, in bytes or with a K, M, G, or T suffix. Defaults to 0 (no limit).')
+    parser.add_argument('--max-age', dest='maxAge', default=None, type=float,
+        help='Remove the entries not used in this many days. Defaults to no limit.')
+    args = parser.parse_args(args)
+
+    cache = IngestCache(args.cacheDir)
+    if args.command == 'prune':
+        nremoved, freed = cache.Prune(args.maxSize, args.maxAge)
+        print('Removed %s entries (%.1f MB)'%(nremoved, freed/1024.**2))
+    entries = cache.Entries()
+    print('%s entries (%.1f MB) in %s'%(len(entries), sum(e[1] for e in entries)/1024.**2, args.cacheDir))
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,15 @@
 from collections import OrderedDict
-import ROOT, json, os, pandas, re, warnings, itertools
+import json, os, pandas, re, warnings, itertools, multiprocessing, time
 from numpy import nan
 import pprint
 pp = pprint.PrettyPrinter(indent=4)
-from TwoDAlphabet.helpers import copy_update_dict, open_json, parse_arg_dict, replace_multi
+from TwoDAlphabet.helpers import ROOT, copy_update_dict, open_json, parse_arg_dict, replace_multi, KeyIndex, hist_to_array
 from TwoDAlphabet.binning import Binning, copy_hist_with_new_bins, get_bins_from_hist
+from TwoDAlphabet.cache import source_id, row_key
+from TwoDAlphabet.arraystore import ArrayStore, store_exists
 
+_fingerprint_version = 1
+_backends = {'root': 'organized_hists.root', 'array': 'organized_hists.arrays'}
 _protected_keys = ["PROCESSES","SYSTEMATICS","REGIONS","BINNING","OPTIONS","GLOBAL","SCALE","COLOR","TYPE","X","Y","TITLE","BINS","NBINS","LOW","HIGH"]
 _syst_col_defaults = {
     # 'variation': nan,
@@ -72,14 +76,17 @@ class Config:
         and replace values found in self.config['GLOBAL']. Call self._addFindReplace()
         before running this function to add in external find-replace pairs.
 
-        Args:
-            findreplace (dict): Non-nested dictionary with key-value pairs to find-replace
-                in the internal class configuration dict.
+        All find-replace pairs are applied in a single traversal of the config
+        (see `config_multi_replace()`).
+
+        Raises:
+            ValueError: If the substitutions are cyclic or cannot be resolved.
 
         Returns:
             None.
         '''
         print ("Doing GLOBAL variable replacement in input json...")
+        findreplace = OrderedDict()
         for old_string in self._section('GLOBAL'):
             if old_string == "HELP":
                 print ('WARNING: The HELP entry is deprecated and checking for it will be removed in the future. Please remove it from your config.')
@@ -88,7 +95,9 @@ class Config:
             if isinstance(new_obj,list):
                 self.iterWorkspaceObjs[old_string] = new_obj
             else:
-                self.config = config_loop_replace(self.config, old_string, new_obj)
+                findreplace[old_string] = new_obj
+
+        self.config = config_multi_replace(self.config, findreplace)
 
     def SaveOut(self, projPath): # pragma: no cover
         '''Save the histogram table to the `projPath` directory in csv
@@ -136,6 +145,11 @@ class Config:
         Returns:
             pandas.DataFrame
         '''
+        regions_section = self._section('REGIONS')
+        processes_section = self._section('PROCESSES')
+        globals_section = self._section('GLOBAL')
+        process_types = pandas.DataFrame(processes_section).T[['TYPE']]
+
         def _data_not_included(region):
             '''Check if the list of processes associated with a region
             includes the one marked as `type` `DATA` in the `PROCESSES`
@@ -155,8 +169,8 @@ class Config:
                 str: The name of the data key if it's not already included in the list of processes
                 for the region.
             '''
-            region_df = pandas.DataFrame({'process':self._section('REGIONS')[region]['PROCESSES']})
-            process_df = pandas.DataFrame(self._section('PROCESSES')).T[['TYPE']]
+            region_df = pandas.DataFrame({'process':regions_section[region]['PROCESSES']})
+            process_df = process_types
             region_df = region_df.merge(process_df,
                                         left_on='process',
                                         right_index=True,
@@ -180,26 +194,24 @@ class Config:
 
             return out
 
-        out_df = pandas.DataFrame(columns=['process','region','binning'])
-        for r in self._section('REGIONS'):
+        records = []
+        for r in regions_section:
             data_key = _data_not_included(r)
             if data_key:
-                out_df = out_df.append(pandas.Series({'process':data_key,'region':r, 'binning':self._section('REGIONS')[r]['BINNING']}),ignore_index=True)
+                records.append({'process':data_key,'region':r, 'binning':regions_section[r]['BINNING']})
 
-            for p in self._section('REGIONS')[r]['PROCESSES']:
-                if p not in self._section('PROCESSES') and len([kglobal for kglobal in self._section('GLOBAL') if kglobal in p]) == 0:
+            for p in regions_section[r]['PROCESSES']:
+                if p not in processes_section and len([kglobal for kglobal in globals_section if kglobal in p]) == 0:
                     raise RuntimeError('Process "%s" listed for region "%s" not defined in PROCESSES section.'%(p,r))
                 
                 row_format = lambda c: {
                     'process': c['PROCESS'],
                     'region': c['REGION'],
-                    'binning':self._section('REGIONS')[c['REGION']]['BINNING']
+                    'binning':regions_section[c['REGION']]['BINNING']
                 }
-                rows_to_append = self._iterObjReplaceProducer({'PROCESS':p, 'REGION':r}, row_format)
-                for new_row in rows_to_append:
-                    out_df = out_df.append(new_row,ignore_index=True)
-                
-        return out_df
+                records.extend(self._iterObjReplaceProducer({'PROCESS':p, 'REGION':r}, row_format))
+
+        return pandas.DataFrame(records, columns=['process','region','binning'], dtype=object)
 
     def _processTable(self):
         '''Generate the table of process information based on the JSON config.
@@ -209,7 +221,7 @@ class Config:
         Returns:
             pandas.DataFrame
         '''
-        out_df = pandas.DataFrame(columns=['color','process_type','scale','variation','source_filename','source_histname','alias','title','combine_idx'])
+        names, records = [], []
         for p in self._section('PROCESSES'):
             this_proc_info = self._section('PROCESSES')[p]
             this_proc_info['NAME'] = p
@@ -217,7 +229,7 @@ class Config:
                 raise RuntimeError('Any process of type DATA must have section key "data_obs".')
             for s in this_proc_info['SYSTEMATICS']+['nominal']:
                 this_proc_info['VARIATION'] = s
-                row_format = lambda info: pandas.Series(
+                row_format = lambda info: (info['NAME'],
                     {'color': nan if 'COLOR' not in info else info['COLOR'],
                     'process_type': info['TYPE'],
                     'scale': 1.0 if 'SCALE' not in info else info['SCALE'],
@@ -226,13 +238,14 @@ class Config:
                     'alias': info['NAME'] if 'ALIAS' not in info.keys() else info['ALIAS'], #in file name
                     'title': info['NAME'] if 'TITLE' not in info.keys() else info['TITLE'], #in legend entry
                     'variation': info['VARIATION'],
-                    }, name=info['NAME']
+                    }
                 )
-                rows_to_append = self._iterObjReplaceProducer(this_proc_info, row_format)
-                for new_row in rows_to_append:
-                    out_df = out_df.append(new_row)
+                for name, record in self._iterObjReplaceProducer(this_proc_info, row_format):
+                    names.append(name)
+                    records.append(record)
 
-        return out_df
+        return pandas.DataFrame(records, index=names, dtype=object,
+                                columns=['color','process_type','scale','variation','source_filename','source_histname','alias','title','combine_idx'])
 
     def _systematicsTable(self):
         '''Generate the table of process information based on the JSON config.
@@ -244,14 +257,15 @@ class Config:
         Returns:
             pandas.DataFrame
         '''
-        out_df = pandas.DataFrame(columns=_syst_col_defaults.keys())
+        names, records = [], []
         for s in self._section('SYSTEMATICS'):
             iterations_to_process = self._iterObjReplaceProducer(self._section('SYSTEMATICS')[s], lambda c: c)
             for iteration in iterations_to_process:
-                for syst in _get_syst_attrs(s, iteration):
-                    out_df = out_df.append(syst)
-        
-        return out_df
+                for syst in _get_syst_records(s, iteration):
+                    names.append(s)
+                    records.append(syst)
+
+        return pandas.DataFrame(records, index=names, columns=list(_syst_col_defaults.keys()), dtype=object)
 
     def _iterObjReplaceProducer(self, obj_package, func):
         '''Pre-processes input to DataFrame in the case that the inputs
@@ -353,74 +367,214 @@ class OrganizedHists():
 
     Attributes:
         name (str): Name, taken from input configObj.
-        filename (str): Path to `organized_hists.root`.
+        filename (str): Path to `organized_hists.root` (or `organized_hists.arrays` with the array backend).
         hists (dict): Three-level nested dictionary organized as [process][region][systematic variation].
         binning (Binning): Binning object, taken from configObj.
         rebinned (bool): Flag to denote if a rebinning has already occured.
-        file (ROOT.TFile): TFile to store histograms on disk.
+        backend (str): Storage backend - "root" (TH2s in a TFile) or "array" (memory-mapped
+            arrays, see `ArrayStore`).
+        file (ROOT.TFile or ArrayStore): TFile (or array store) to store histograms on disk.
+        keys (KeyIndex or ArrayStore): Name index of `file`.
+        report (OrderedDict): Histograms rebuilt and removed by the last `Add()` and the time of each step.
+        viewCacheSize (int): Number of sub-region views kept in memory (see `Get()`).
 
     Args:
         configObj (Config): Config object.
     '''
-    def __init__(self,projPath,binnings,hist_map,readOnly=False,trimSig=False):
-        self.filename = projPath + 'organized_hists.root'
-        self.hist_map = hist_map
-
-        if os.path.exists(self.filename) and readOnly:
-            self.file = ROOT.TFile.Open(self.filename,"OPEN")
+    def __init__(self,projPath,binnings,hist_map,readOnly=False,trimSig=False,nWorkers=1,cache=None,lazySubRegions=False,viewCacheSize=256,backend='root'):
+        if backend not in _backends:
+            raise ValueError('Backend "%s" not accepted. Options are %s.'%(backend, ', '.join(_backends.keys())))
+        self.backend = backend
+        self.filename = projPath + _backends[backend]
+        self.fingerprintFile = projPath + 'organized_hists.json'
+        self.hist_map = hist_map # also builds the histogram name to binning index
+        self.report = None
+        self.viewCacheSize = viewCacheSize
+        self._subViews, self._viewSources = _view_index(hist_map, binnings)
+        self._viewCache = OrderedDict()
+
+        if self._exists() and readOnly:
+            self._open("OPEN")
         else:
-            self.file = ROOT.TFile.Open(self.filename,"RECREATE")
-            self.Add(binnings, trimSig)
+            previous = self._loadFingerprints()
+            if os.path.exists(self.fingerprintFile): # not valid until the rebuild completes
+                os.remove(self.fingerprintFile)
+            self._open("RECREATE" if previous is None else "UPDATE")
+            self.Add(binnings, trimSig, nWorkers, cache, lazySubRegions, previous=previous)
             self.file.Close()
-            self.file = ROOT.TFile.Open(self.filename,"OPEN")
+            self._open("OPEN")
+
+    def _exists(self):
+        if self.backend == 'array':
+            return store_exists(self.filename)
+        return os.path.exists(self.filename)
+
+    def _open(self, mode):
+        '''Open the histogram file with the storage backend and index its keys.'''
+        if self.backend == 'array':
+            self.file = ArrayStore(self.filename, mode)
+            self.keys = self.file
+        else:
+            self.file = ROOT.TFile.Open(self.filename, mode)
+            self.keys = KeyIndex(self.file)
 
-    def Add(self, binnings, trimSig=False):
+    def Add(self, binnings, trimSig=False, nWorkers=1, cache=None, lazySubRegions=False, previous=None):
         '''Manipulate all histograms in self.hist_map and save them to organized_hists.root.
 
+        The fingerprint of each row of self.hist_map (the source file version, source histogram,
+        scale, color, binning, and trimming) is saved in organized_hists.json. If the fingerprints
+        of the previous build are given as `previous`, only the rows whose fingerprint changed are
+        processed again and the histograms of the rows no longer in self.hist_map are removed.
+        What was rebuilt and the time of each step are stored in `report` and printed.
+
+        If `lazySubRegions` is True, only the full histograms are stored and the LOW, SIG, and HIGH
+        histograms are made when they are requested (see `Get()`).
+
+        If `nWorkers` > 1, the source files are split into contiguous subsets which are
+        processed by a pool of worker processes. Each worker writes its histograms to a
+        shard file and the shards are then merged into organized_hists.root in the
+        same order as the serial processing so that the output is identical.
+
+        If a `cache` is given, the processed histograms of the rows whose inputs did not
+        change since they were last processed (by this or any other project) are taken
+        from the cache and the source files are only opened for the other rows.
+
+        Args:
+            binnings (dict): Map of binning names to Binning objects.
+            trimSig (bool, optional): Zero low-occupancy signal bins. Defaults to False.
+            nWorkers (int, optional): Number of worker processes. Defaults to 1 (serial).
+            cache (IngestCache, optional): Cache of processed histograms. Defaults to None (no cache).
+            lazySubRegions (bool, optional): Do not store the sub-region histograms. Defaults to False.
+            previous (dict, optional): Fingerprints of the previous build (see `_loadFingerprints()`).
+                Defaults to None in which case all rows are processed.
+
         Returns:
             None
         '''
-        for infilename,histdf in self.hist_map.items():
-            infile = ROOT.TFile.Open(infilename)
-            for row in histdf.itertuples():
-                if row.source_histname not in [k.GetName() for k in infile.GetListOfKeys()]:
-                    raise NameError('Histogram name %s does not exist in file %s.'%(row.source_histname,infile.GetName()))
-                h = infile.Get(row.source_histname)
-                h.SetDirectory(0)
-                h.Scale(row.scale)
-                binning = binnings[row.binning]
-
-                if get_bins_from_hist("Y", h) != binning.ybinList:
-                    h = copy_hist_with_new_bins(row.out_histname+'_rebinY','Y',h,binning.ybinList)
-                if get_bins_from_hist("X", h) != binning.xbinList:
-                    h = copy_hist_with_new_bins(row.out_histname,'X',h,binning.xbinList)
-                else:
-                    h.SetName(row.out_histname)
-
-                h.SetTitle(row.out_histname)
-                h.SetFillColor(row.color)
-
-                ## Set low-occupancy signal bins to 0 to avoid fit issues in empty data bins - AWB 2024.05.21
-                if trimSig and 'Htoaato4b_mA' in row.out_histname:
-                    max_occ = h.GetMaximum()
-                    for iX in range(1, h.GetNbinsX()+1):
-                        for iY in range(1, h.GetNbinsY()+1):
-                            bin_occ = h.GetBinContent(iX, iY)
-                            if bin_occ < 0.05*max_occ:
-                                print('Signal bin (%d,%d) = %.2f (max = %.2f), set to 0.' % (iX, iY, bin_occ, max_occ))
-                                h.SetBinContent(iX, iY, 0)
-                                h.SetBinError(iX, iY, 0)
-
-                self.file.WriteTObject(h, row.out_histname)
-                self.CreateSubRegions(h, binning)
+        timings = OrderedDict()
+        start = time.perf_counter()
+        edges = {k:(b.ybinList, b.xbinList, b.xbinByCat) for k,b in binnings.items()}
+        fingerprints = _row_fingerprints(self.hist_map, edges, trimSig, not lazySubRegions)
+        if previous is None:
+            todo, dirty = self.hist_map, set(fingerprints.keys())
+        else:
+            dirty = set(n for n,fp in fingerprints.items()
+                        if fp['fingerprint'] is None or n not in previous or previous[n]['fingerprint'] != fp['fingerprint'])
+            todo = OrderedDict()
+            for infilename,histdf in self.hist_map.items():
+                mask = histdf.out_histname.isin(dirty)
+                if mask.any():
+                    todo[infilename] = histdf[mask]
+        timings['fingerprint'] = time.perf_counter()-start
+
+        start = time.perf_counter()
+        if nWorkers > 1 and len(todo) > 1:
+            self._addParallel(todo, edges, trimSig, nWorkers, cache, not lazySubRegions)
+        else:
+            for infilename,histdf in todo.items():
+                for hists in _ingest_file(infilename, histdf, edges, trimSig, cache, not lazySubRegions):
+                    for h in hists:
+                        self._write(h, h.GetName())
+        timings['process'] = time.perf_counter()-start
+
+        start = time.perf_counter()
+        removed = []
+        if previous is not None:
+            current = set(h for fp in fingerprints.values() for h in fp['hists'])
+            removed = sorted(set(h for fp in previous.values() for h in fp['hists']) - current)
+            for name in removed:
+                self.file.Delete(name+';*')
+            self.keys.Invalidate()
+        timings['remove'] = time.perf_counter()-start
+
+        start = time.perf_counter()
+        with open(self.fingerprintFile,'w') as f:
+            json.dump({'version': _fingerprint_version, 'backend': self.backend, 'rows': fingerprints}, f)
+        timings['save'] = time.perf_counter()-start
+
+        self.report = OrderedDict([
+            ('rebuilt', [n for n in fingerprints if n in dirty]),
+            ('removed', removed),
+            ('kept', len(fingerprints)-len(dirty)),
+            ('timings', timings)
+        ])
+        self._printReport(previous is None)
+
+        if cache is not None:
+            print ('Ingestion cache: %s templates reused, %s processed'%(cache.hits, cache.misses))
+            if cache.maxSize > 0:
+                cache.Prune()
+
+    def _printReport(self, full):
+        '''Print `report`. The names of the rebuilt and removed histograms are only listed for
+        an incremental rebuild.'''
+        print ('%s: %s build, %s templates rebuilt, %s kept, %s histograms removed'%(
+            self.filename, 'full' if full else 'incremental',
+            len(self.report['rebuilt']), self.report['kept'], len(self.report['removed'])))
+        if not full:
+            for name in self.report['rebuilt']:
+                print ('\trebuilt %s'%name)
+            for name in self.report['removed']:
+                print ('\tremoved %s'%name)
+        print ('\t'+', '.join('%s: %.2f s'%(step,t) for step,t in self.report['timings'].items()))
+
+    def _loadFingerprints(self):
+        '''Load the row fingerprints of the previous build of organized_hists.root.
 
-            infile.Close()
+        Returns:
+            dict: Map of out_histname to its fingerprint and histogram names, or None if
+            there is no complete previous build (in which case everything is rebuilt).
+        '''
+        if not (self._exists() and os.path.exists(self.fingerprintFile)):
+            return None
+        try:
+            with open(self.fingerprintFile) as f:
+                meta = json.load(f)
+        except ValueError: # corrupted
+            return None
+        if meta.get('version') != _fingerprint_version or meta.get('backend','root') != self.backend:
+            return None
+        return meta['rows']
+
+    def _addParallel(self, hist_map, edges, trimSig, nWorkers, cache=None, subRegions=True):
+        '''Parallel version of `Add()`. See `Add()` for details.'''
+        items = list(hist_map.items())
+        nWorkers = min(nWorkers, len(items))
+        chunk_size, remainder = divmod(len(items), nWorkers)
+
+        jobs, start = [], 0
+        for i in range(nWorkers):
+            stop = start + chunk_size + (1 if i < remainder else 0)
+            shard_name = '%s.shard%s.root'%(os.path.splitext(self.filename)[0], i)
+            jobs.append((shard_name, items[start:stop], edges, trimSig, cache, subRegions))
+            start = stop
+
+        pool = multiprocessing.Pool(nWorkers)
+        try:
+            shards = pool.map(_ingest_shard, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        for shard_name, written, hits, misses in shards:
+            if cache is not None:
+                cache.hits += hits
+                cache.misses += misses
+            shard = ROOT.TFile.Open(shard_name)
+            for name in written:
+                self._write(shard.Get(name), name)
+            shard.Close()
+            os.remove(shard_name)
 
     def Get(self,histname='',process='',region='',systematic='',subspace='FULL'):
         '''Get histogram from the opened TFile. Specify the histogram
         you want via `histname` or by the combination of `process`, `region`,
         and `systematic` options. The `histname` option will take priority.
 
+        Sub-region histograms that are not stored (see `lazySubRegions` in `Add()`) are made
+        from the full histogram exactly as they would have been stored and the last
+        `viewCacheSize` of them are kept in memory.
+
         Args:
             histname (str, optional): Name of histogram to get. Overrides other three options if specified. Defaults to ''.
             process (str, optional): Name of process to search for. Must be used in conjunction with `region` and `systematic` options. Overridden by `histname`. Defaults to ''.
@@ -441,18 +595,91 @@ class OrganizedHists():
             if systematic != '':
                 histname+='_'+systematic
 
-        all_histnames = [k.GetName() for k in self.file.GetListOfKeys()]
-        if histname not in all_histnames:
+        if histname in self.keys:
+            return self.file.Get(histname)
+        elif histname in self._viewSources:
+            return self._getView(histname)
+        else:
             raise NameError('Histogram %s does not exist.'%(histname))
 
-        return self.file.Get(histname)
+    def GetArrays(self,histname):
+        '''Get the contents and sums of squared weights of a histogram as arrays indexed as
+        [ybin][xbin] and including the under/overflow bins. With the array backend, the arrays
+        of the stored histograms are read-only views of the memory-mapped file (no ROOT objects
+        are made).
+
+        Args:
+            histname (str): Name of histogram to get.
+
+        Raises:
+            NameError: If the histogram does not exist.
+
+        Returns:
+            tuple(numpy.ndarray): Contents and sums of squared weights.
+        '''
+        if self.backend == 'array' and histname in self.keys:
+            return self.file.GetArrays(histname)
+        return hist_to_array(self.Get(histname))
+
+    def _getView(self, histname):
+        '''Make (or get from memory) a sub-region histogram that is not stored in the file.'''
+        if histname in self._viewCache:
+            self._viewCache.move_to_end(histname)
+            return self._viewCache[histname]
+
+        fullname, sub, xbins = self._viewSources[histname]
+        if fullname not in self.keys:
+            raise NameError('Histogram %s does not exist.'%(histname))
+        h = _sub_region_hists(self.file.Get(fullname), OrderedDict([(sub,xbins)]))[0]
+        h.SetDirectory(0)
+        self._viewCache[histname] = h
+        if len(self._viewCache) > self.viewCacheSize:
+            self._viewCache.popitem(last=False)
+        return h
 
     def GetHistNames(self):
-        return [hkey.GetName() for hkey in self.file.GetListOfKeys()]
+        '''
+        Returns:
+            list(str): Names of the stored histograms, each full histogram followed by
+            its sub-region histograms if they are not stored.
+        '''
+        names = []
+        for name in self.keys.Names():
+            names.append(name)
+            names.extend(v for v in self._subViews.get(name,[]) if v not in self.keys)
+        return names
+
+    def _write(self,h,name):
+        '''Write histogram to organized_hists.root (replacing any previous version)
+        and invalidate the key index.'''
+        self.file.WriteTObject(h, name, 'WriteDelete')
+        self.keys.Invalidate()
+
+    @property
+    def hist_map(self):
+        return self._hist_map
+
+    @hist_map.setter
+    def hist_map(self, hist_map):
+        self._hist_map = hist_map
+        self._binningIndex = _binning_index(hist_map)
 
     def BinningLookup(self,histname):
-        all_hists = pandas.concat([v[['out_histname','binning']] for v in self.hist_map.values()])
-        return all_hists.loc[all_hists.out_histname.eq(histname)].iloc[0].binning
+        '''Get the name of the binning of an output histogram (from an index built
+        when `hist_map` is set).
+
+        Args:
+            histname (str): Name of the output histogram (out_histname in `hist_map`).
+
+        Raises:
+            IndexError: If the histogram is not in `hist_map`.
+
+        Returns:
+            str: Binning name.
+        '''
+        if histname not in self._binningIndex:
+            raise IndexError('Histogram %s is not in the histogram map.'%histname)
+        return self._binningIndex[histname]
 
     def CreateSubRegions(self,h,binning):
         '''Sub-divide input histogram along the X axis into the regions specified in the config
@@ -461,15 +688,204 @@ class OrganizedHists():
         Returns:
             None
         '''
-        for sub in binning.xbinByCat.keys():
-            hsub = h.Clone()
-            hsub = copy_hist_with_new_bins(h.GetName().replace('_FULL','_'+sub),'X',h,binning.xbinByCat[sub])
-            hsub.SetTitle(hsub.GetName())
-            if hsub.Integral() <= 0:
-                print ('WARNING: %s has zero or negative events - %s'%(hsub.GetName(), hsub.Integral()))
-                for b in range(1,hsub.GetNbinsX()*hsub.GetNbinsY()+1):
-                    hsub.SetBinContent(b,1e-6)
-            self.file.WriteObject(hsub, hsub.GetName())
+        for hsub in _sub_region_hists(h, binning.xbinByCat):
+            self._write(hsub, hsub.GetName())
+
+def _row_fingerprints(hist_map, edges, trimSig=False, subRegions=True):
+    '''Fingerprint each row of the histogram map by the version of its source file and the
+    inputs of its processing. A name that appears in several rows takes the fingerprint
+    of the last one (whose histogram is the one read back).
+
+    Args:
+        hist_map (dict): Map of source file names to histogram map DataFrames.
+        edges (dict): Map of binning names to (Y bin edges, X bin edges, X bin edges per category).
+        trimSig (bool, optional): Zero low-occupancy signal bins. Defaults to False.
+        subRegions (bool, optional): Whether the sub-region histograms are stored. Defaults to True.
+
+    Returns:
+        OrderedDict: Map of out_histname to a dict with the fingerprint (None if the source file
+        version is unknown) and the names of the full and sub-region histograms.
+    '''
+    out = OrderedDict()
+    for infilename,histdf in hist_map.items():
+        file_id = source_id(infilename)
+        for row in histdf.itertuples():
+            key = row_key(file_id, row, edges[row.binning], _trims(row, trimSig))
+            hists = [row.out_histname]
+            if subRegions:
+                hists += [row.out_histname.replace('_FULL','_'+sub) for sub in edges[row.binning][2].keys()]
+            out[row.out_histname] = {
+                'fingerprint': None if key is None else '%s:%s:%s'%(key, row.color, len(hists)),
+                'hists': hists
+            }
+    return out
+
+def _view_index(hist_map, binnings):
+    '''Index the sub-region histograms that can be made from each full histogram.
+
+    Args:
+        hist_map (dict): Map of source file names to histogram map DataFrames.
+        binnings (dict): Map of binning names to Binning objects. Rows with other binnings are skipped.
+
+    Returns:
+        tuple(dict, dict): Map of full histogram name to its sub-region histogram names and
+        map of sub-region histogram name to (full histogram name, category, X bin edges).
+    '''
+    subViews, viewSources = {}, {}
+    for histdf in hist_map.values():
+        for name, binning in zip(histdf.out_histname.tolist(), histdf.binning.tolist()):
+            if binning not in binnings or name in subViews:
+                continue
+            subViews[name] = []
+            for sub, xbins in binnings[binning].xbinByCat.items():
+                subname = name.replace('_FULL','_'+sub)
+                subViews[name].append(subname)
+                viewSources[subname] = (name, sub, xbins)
+    return subViews, viewSources
+
+def _trims(row, trimSig):
+    '''Whether the low-occupancy signal bins of a row of the histogram map are zeroed.'''
+    return trimSig and 'Htoaato4b_mA' in row.out_histname
+
+def _binning_index(hist_map):
+    '''Map each out_histname of `hist_map` to its binning (first occurrence, in the
+    order of the files and rows).'''
+    index = {}
+    for histdf in hist_map.values():
+        for name, binning in zip(histdf.out_histname.tolist(), histdf.binning.tolist()):
+            index.setdefault(name, binning)
+    return index
+
+def _ingest_hist(infile_keys, row, ybinList, xbinList, trimSig=False):
+    '''Get, scale, and rebin a histogram from an input file according to a row
+    of the histogram map.
+
+    Args:
+        infile_keys (KeyIndex): Key index of the open input file.
+        row (namedtuple): Row of the histogram map.
+        ybinList (list): Y axis bin edges.
+        xbinList (list): X axis bin edges.
+        trimSig (bool, optional): Zero low-occupancy signal bins. Defaults to False.
+
+    Raises:
+        NameError: If the histogram does not exist in the input file.
+
+    Returns:
+        TH2: Histogram named `row.out_histname`.
+    '''
+    if row.source_histname not in infile_keys:
+        raise NameError('Histogram name %s does not exist in file %s.'%(row.source_histname,infile_keys.file.GetName()))
+    h = infile_keys.file.Get(row.source_histname)
+    h.SetDirectory(0)
+    h.Scale(row.scale)
+
+    if get_bins_from_hist("Y", h) != ybinList:
+        h = copy_hist_with_new_bins(row.out_histname+'_rebinY','Y',h,ybinList)
+    if get_bins_from_hist("X", h) != xbinList:
+        h = copy_hist_with_new_bins(row.out_histname,'X',h,xbinList)
+    else:
+        h.SetName(row.out_histname)
+
+    h.SetTitle(row.out_histname)
+    h.SetFillColor(row.color)
+
+    ## Set low-occupancy signal bins to 0 to avoid fit issues in empty data bins - AWB 2024.05.21
+    if _trims(row, trimSig):
+        max_occ = h.GetMaximum()
+        for iX in range(1, h.GetNbinsX()+1):
+            for iY in range(1, h.GetNbinsY()+1):
+                bin_occ = h.GetBinContent(iX, iY)
+                if bin_occ < 0.05*max_occ:
+                    print('Signal bin (%d,%d) = %.2f (max = %.2f), set to 0.' % (iX, iY, bin_occ, max_occ))
+                    h.SetBinContent(iX, iY, 0)
+                    h.SetBinError(iX, iY, 0)
+
+    return h
+
+def _ingest_file(infilename, histdf, edges, trimSig=False, cache=None, subRegions=True):
+    '''Process the rows of the histogram map of one source file, in order.
+    The source file is only opened if a row is not found in the cache.
+
+    Args:
+        infilename (str): Source file name.
+        histdf (pandas.DataFrame): Histogram map of the source file.
+        edges (dict): Map of binning names to (Y bin edges, X bin edges, X bin edges per category).
+        trimSig (bool, optional): Zero low-occupancy signal bins. Defaults to False.
+        cache (IngestCache, optional): Cache of processed histograms. Defaults to None (no cache).
+        subRegions (bool, optional): Make the sub-region histograms. Defaults to True.
+            They are always made for the cache.
+
+    Yields:
+        list(TH2): Full histogram of a row followed by its sub-region histograms (if `subRegions`).
+    '''
+    infile = None
+    try:
+        for row in histdf.itertuples():
+            ybinList, xbinList, xbinByCat = edges[row.binning]
+            key, hists = None, None
+            if cache is not None:
+                key = cache.Key(infilename, row, edges[row.binning], _trims(row, trimSig))
+                hists = cache.Get(key, row.out_histname, row.color, list(xbinByCat.keys()))
+
+            if hists is None:
+                if infile is None:
+                    infile = ROOT.TFile.Open(infilename)
+                    infile_keys = KeyIndex(infile)
+                h = _ingest_hist(infile_keys, row, ybinList, xbinList, trimSig)
+                hists = [h]
+                if subRegions or cache is not None:
+                    hists += _sub_region_hists(h, xbinByCat)
+                if cache is not None:
+                    cache.Put(key, hists, list(xbinByCat.keys()))
+            yield hists if subRegions else hists[:1]
+    finally:
+        if infile is not None:
+            infile.Close()
+
+def _sub_region_hists(h, xbinByCat):
+    '''Sub-divide input histogram along the X axis into the LOW, SIG, and HIGH regions.
+
+    Args:
+        h (TH2): Full histogram (name ending in "_FULL" or containing "_FULL_").
+        xbinByCat (dict): X axis bin edges per category.
+
+    Returns:
+        list(TH2): One histogram per category.
+    '''
+    out = []
+    for sub in xbinByCat.keys():
+        hsub = copy_hist_with_new_bins(h.GetName().replace('_FULL','_'+sub),'X',h,xbinByCat[sub])
+        hsub.SetTitle(hsub.GetName())
+        if hsub.Integral() <= 0:
+            print ('WARNING: %s has zero or negative events - %s'%(hsub.GetName(), hsub.Integral()))
+            for b in range(1,hsub.GetNbinsX()*hsub.GetNbinsY()+1):
+                hsub.SetBinContent(b,1e-6)
+        out.append(hsub)
+    return out
+
+def _ingest_shard(job):
+    '''Worker for `OrganizedHists._addParallel()`. Processes a subset of the source files
+    and writes the full and sub-region histograms to a shard file.
+
+    Args:
+        job (tuple): Shard file name, list of (source file name, histogram map DataFrame) pairs,
+            dict of binning name to (Y bin edges, X bin edges, X bin edges per category),
+            the trimSig flag, the IngestCache (or None), and whether to write the sub-region histograms.
+
+    Returns:
+        tuple: Shard file name, the list of histogram names in the order they were written,
+        and the numbers of cache hits and misses.
+    '''
+    shard_name, items, edges, trimSig, cache, subRegions = job
+    shard = ROOT.TFile.Open(shard_name,"RECREATE")
+    written = []
+    for infilename,histdf in items:
+        for hists in _ingest_file(infilename, histdf, edges, trimSig, cache, subRegions):
+            for hout in hists:
+                shard.WriteTObject(hout, hout.GetName())
+                written.append(hout.GetName())
+    shard.Close()
+    return shard_name, written, (cache.hits if cache else 0), (cache.misses if cache else 0)
 
 def _keyword_replace(df,col_strs):
     '''Given a DataFrame and list of column names,
@@ -483,20 +899,16 @@ def _keyword_replace(df,col_strs):
     Returns:
         pandas.DataFrame: The manipulated DataFrame copy.
     '''
-    def _batch_replace(row,s=None):
-        # print('_batch_replace process = %s, region = %s, syst = %s' % (row.alias, row.region, row.variation_alias))
-        if pandas.isna(row[s]):
-            return nan
-        else:
-            return replace_multi(
-                row[col_str],
-                {'$process': row.alias,
-                 '$region':  row.region,
-                 '$syst':    row.variation_alias}
-            )
-
     for col_str in col_strs:
-        df[col_str] = df.apply(_batch_replace, axis='columns', s=col_str)
+        df[col_str] = [
+            nan if pandas.isna(val) else replace_multi(
+                val,
+                {'$process': alias,
+                 '$region':  region,
+                 '$syst':    variation_alias}
+            )
+            for val, alias, region, variation_alias in zip(df[col_str], df['alias'], df['region'], df['variation_alias'])
+        ]
     return df
 
 def _get_syst_attrs(name,syst_dict):
@@ -514,6 +926,22 @@ def _get_syst_attrs(name,syst_dict):
     Returns:
         list(pands.Series): List of new rows to append to the main systematics DataFrame.
     '''
+    return [pandas.Series(d, name=name) for d in _get_syst_records(name, syst_dict)]
+
+def _get_syst_records(name,syst_dict):
+    '''Same as `_get_syst_attrs()` but returns the rows as dictionaries (with the
+    defaults of `_syst_col_defaults` filled) to build the systematics table in one go.
+
+    Args:
+        name (str): Name of the systematic variation.
+        syst_dict (dict): Dictionary of the config["SYSTEMATICS"][name] section of the JSON config.
+
+    Raises:
+        RuntimeError: Systematic variation type could not be determined.
+
+    Returns:
+        list(dict): List of rows of the systematics table.
+    '''
     if 'VAL' in syst_dict:
         out = [{
             'lnN':str(syst_dict['VAL']),
@@ -545,8 +973,7 @@ def _get_syst_attrs(name,syst_dict):
     else:
         raise RuntimeError('Systematic variation type could not be determined for "%s".'%name)
 
-    out = [pandas.Series(copy_update_dict(_syst_col_defaults, d), name=name) for d in out]
-    return out
+    return [copy_update_dict(_syst_col_defaults, d) for d in out]
 
 def _df_condense_nameinfo(df,baseColName):
     '''Condense information after the left-join of the process and systematics DataFrames which creates duplicates
@@ -560,7 +987,8 @@ def _df_condense_nameinfo(df,baseColName):
     Returns:
         pandas.DataFrame: Condensed DataFrame.
     '''
-    df[baseColName] = df.apply(lambda row: row[baseColName+'_syst'] if pandas.notna(row[baseColName+'_syst']) else row[baseColName], axis='columns')
+    syst_col = df[baseColName+'_syst']
+    df[baseColName] = syst_col.where(syst_col.notna(), df[baseColName])
     df.drop(baseColName+'_syst',axis='columns',inplace=True)
     return df
 
@@ -629,3 +1057,105 @@ def config_loop_replace(config,old,new,inGLOBAL=False):
         raise TypeError('Type "%s" not accepted in config_loop_replace.')
 
     return config
+
+def config_multi_replace(config,findreplace):
+    '''Find-replace all (old,new) pairs of `findreplace` in a nested dictionary or list (config)
+    in a single traversal. The keys are compiled into one alternation pattern and
+    matched as whole words, as in `config_loop_replace()`. A `new` string that itself contains
+    other keys is resolved first so the result does not depend on the order of `findreplace`.
+
+    If `new` is not a string, <old> must match the config entry in its entirety (ie. <old> == <config value>).
+    Keys of the immediate "GLOBAL" sub-dictionary are never replaced.
+
+    Args:
+        config (dict,list): Nested dictionary or list where keys and values will have the
+            find-replace algorithm applied.
+        findreplace (dict): Non-nested dictionary of (old,new) pairs. Keys must be strings.
+
+    Raises:
+        ValueError: If the substitutions are cyclic (ex. {"a": "b", "b": "a"}).
+        ValueError: If a non-string replacement would need to be inserted into a longer string.
+        TypeError: If input is not a dict or list.
+
+    Returns:
+        dict,list: Modified dict/list.
+    '''
+    if len(findreplace) == 0:
+        return config
+    pattern = re.compile(r'\b(?:%s)\b'%'|'.join(re.escape(k) for k in sorted(findreplace, key=len, reverse=True)))
+    resolved = _resolve_findreplace(findreplace, pattern)
+    return _multi_replace_loop(config, pattern, resolved.__getitem__)
+
+def _resolve_findreplace(findreplace,pattern):
+    '''Substitute the keys of `findreplace` that appear in its own values
+    until no key is left.
+
+    Args:
+        findreplace (dict): Non-nested dictionary of (old,new) pairs.
+        pattern (re.Pattern): Compiled alternation of the keys.
+
+    Raises:
+        ValueError: If the substitutions are cyclic.
+
+    Returns:
+        dict: Resolved (old,new) pairs.
+    '''
+    resolved = {}
+    def _resolve(key, chain):
+        if key in resolved:
+            return resolved[key]
+        if key in chain:
+            raise ValueError('Cyclic GLOBAL substitution: %s'%(' -> '.join(chain+[key])))
+        value = findreplace[key]
+        if isinstance(value,str):
+            value = _substitute(value, pattern, lambda k: _resolve(k, chain+[key]))
+        resolved[key] = value
+        return value
+
+    for key in findreplace:
+        _resolve(key, [])
+    return resolved
+
+def _substitute(s,pattern,lookup,allowNonStr=True):
+    '''Replace all matches of `pattern` in `s` using `lookup(match)`.
+
+    Raises:
+        ValueError: If a non-string replacement would need to be inserted into a string.
+    '''
+    if allowNonStr:
+        full_match = pattern.fullmatch(s)
+        if full_match:
+            return lookup(full_match.group(0))
+
+    def _repl(match):
+        new = lookup(match.group(0))
+        if not isinstance(new,str):
+            raise ValueError('Unresolved substitution of "%s" in "%s": replacement %r is not a string.'%(match.group(0),s,new))
+        return new
+
+    return pattern.sub(_repl, s)
+
+def _multi_replace_loop(config,pattern,lookup,inGLOBAL=False):
+    '''Self-calling traversal for `config_multi_replace()`.'''
+    if isinstance(config,dict):
+        out = type(config)()
+        for k,v in config.items():
+            new_k = k if inGLOBAL or not isinstance(k,str) else _substitute(k, pattern, lookup, allowNonStr=False)
+            if isinstance(v,dict) or isinstance(v,list):
+                out[new_k] = _multi_replace_loop(v, pattern, lookup, inGLOBAL=(k == 'GLOBAL'))
+            elif isinstance(v,str):
+                out[new_k] = _substitute(v, pattern, lookup)
+            else:
+                out[new_k] = v
+        config.clear()
+        config.update(out)
+    elif isinstance(config,list):
+        for i,v in enumerate(config):
+            if isinstance(v,dict) or isinstance(v,list):
+                config[i] = _multi_replace_loop(v, pattern, lookup)
+            elif isinstance(v,str):
+                config[i] = _substitute(v, pattern, lookup)
+    else:
+        raise TypeError('Type "%s" not accepted in config_multi_replace.'%type(config))
+
+    return config
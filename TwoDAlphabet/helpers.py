@@ -1,6 +1,44 @@
-import subprocess, json, ROOT, os, copy, time, glob
+import subprocess, json, os, copy, time, glob, numpy, importlib
 from collections import defaultdict
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+class LazyModule(object):
+    '''Stand-in for a module that is only imported when one of its attributes is first
+    accessed (or set). Used for ROOT so that importing TwoDAlphabet (ex. to parse a config,
+    query a ledger or write a card) does not pay for the PyROOT initialization.
+
+    Example:
+        ::
+
+            ROOT = LazyModule('ROOT')
+            ROOT.TFile.Open(...) # ROOT is imported here
+
+    Args:
+        name (str): Full name of the module.
+    '''
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        if self._module is None:
+            object.__setattr__(self, '_module', importlib.import_module(self._name))
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return '<LazyModule %s (%s)>'%(self._name, 'loaded' if self._module is not None else 'not loaded')
+
+ROOT = LazyModule('ROOT')
 
 # Function stolen from https://stackoverflow.com/questions/9590382/forcing-python-json-module-to-work-with-ascii
 def open_json(f):
@@ -137,6 +175,180 @@ def make_RDH(myTH2,RAL_vars,altname=''):
     thisRDH = ROOT.RooDataHist(name,name,RAL_vars,myTH2)
     return thisRDH
 
+# ----------------- ROOT <-> numpy bridge --------------------
+_hist_dtypes = [('TArrayD','f8'), ('TArrayF','f4'), ('TArrayI','i4'), ('TArrayS','i2'), ('TArrayC','i1')]
+def _hist_dtype(h):
+    for array_class, dtype in _hist_dtypes:
+        if h.InheritsFrom(array_class):
+            return dtype
+    raise TypeError('Histogram %s does not store its contents in a known TArray type.'%h.GetName())
+
+def _buffer_view(ptr, n, dtype):
+    '''View `n` elements of a C array exposed by PyROOT as a numpy array (no copy).'''
+    if hasattr(ptr, 'reshape'):
+        reshaped = ptr.reshape((n,))
+        if reshaped is not None: ptr = reshaped
+    return numpy.frombuffer(ptr, dtype=dtype, count=n)
+
+def _hist_shape(h):
+    if h.GetDimension() == 1:
+        return (h.GetNbinsX()+2,)
+    elif h.GetDimension() == 2:
+        return (h.GetNbinsY()+2, h.GetNbinsX()+2)
+    raise TypeError('Only TH1 and TH2 are supported (%s has dimension %s).'%(h.GetName(),h.GetDimension()))
+
+def _in_range(a, flow):
+    return a if flow else a[(slice(1,-1),)*a.ndim]
+
+def hist_to_array(h, flow=True, copy=True):
+    '''Access the bin contents and sum of squared weights of a TH1 or TH2 as numpy arrays.
+    Arrays are indexed as [xbin] for TH1 and [ybin][xbin] for TH2.
+
+    Args:
+        h (TH1): Input histogram.
+        flow (bool, optional): Include the under/overflow bins. Defaults to True.
+        copy (bool, optional): If False, return views onto the histogram buffers instead of copies.
+            Writing to the views changes the histogram. Defaults to True.
+
+    Returns:
+        tuple(numpy.ndarray): Contents and sum of squared weights. If copy is True, the contents are
+            converted to float64 and, if the histogram does not store its squared weights, abs(content)
+            is returned as the sum of squared weights (as with TH1::GetBinError). If copy is False,
+            the contents keep the storage type of the histogram and the sum of squared weights is None
+            when not stored.
+    '''
+    shape = _hist_shape(h)
+    ncells = h.GetNcells()
+    has_sumw2 = h.GetSumw2N() > 0
+    try:
+        content = _buffer_view(h.GetArray(), ncells, _hist_dtype(h))
+        sumw2 = _buffer_view(h.GetSumw2().GetArray(), ncells, 'f8') if has_sumw2 else None
+    except (TypeError, ValueError, AttributeError):
+        if not copy:
+            raise
+        content = numpy.array([h.GetBinContent(i) for i in range(ncells)], dtype='f8')
+        sumw2 = numpy.array([h.GetSumw2().At(i) for i in range(ncells)], dtype='f8') if has_sumw2 else None
+
+    if copy:
+        content = content.astype('f8')
+        sumw2 = numpy.abs(content) if sumw2 is None else numpy.array(sumw2)
+    content = _in_range(content.reshape(shape), flow)
+    if sumw2 is not None:
+        sumw2 = _in_range(sumw2.reshape(shape), flow)
+    return content, sumw2
+
+def set_hist_from_array(h, content, sumw2=None):
+    '''Fill a TH1 or TH2 in place from numpy arrays. Arrays may include the under/overflow
+    bins (shape (nbinsX+2,) or (nbinsY+2, nbinsX+2)) or only cover the bins in range
+    (shape (nbinsX,) or (nbinsY, nbinsX)) in which case the flow bins are not changed.
+    The statistics of the histogram are recomputed from the new contents.
+
+    Args:
+        h (TH1): Histogram to fill.
+        content (numpy.ndarray): Bin contents.
+        sumw2 (numpy.ndarray, optional): Sum of squared weights (ie. squared bin errors). Defaults to None
+            in which case the squared weights are not changed.
+
+    Raises:
+        ValueError: If the array shapes do not match the histogram binning.
+
+    Returns:
+        TH1: The same histogram.
+    '''
+    shape = _hist_shape(h)
+    content = numpy.asarray(content)
+    if content.shape == shape:
+        flow = True
+    elif content.shape == tuple(n-2 for n in shape):
+        flow = False
+    else:
+        raise ValueError('Array of shape %s does not match histogram %s of shape %s (with flow bins).'%(content.shape,h.GetName(),shape))
+    if sumw2 is not None and numpy.shape(sumw2) != content.shape:
+        raise ValueError('Sum of squared weights of shape %s does not match the contents of shape %s.'%(numpy.shape(sumw2),content.shape))
+
+    if sumw2 is not None and h.GetSumw2N() == 0:
+        h.Sumw2()
+    try:
+        content_view, sumw2_view = hist_to_array(h, flow=flow, copy=False)
+        content_view[...] = content
+        if sumw2 is not None:
+            sumw2_view[...] = sumw2
+    except (TypeError, ValueError, AttributeError):
+        offset = 0 if flow else 1
+        for index in numpy.ndindex(*content.shape):
+            cell = h.GetBin(*reversed([i+offset for i in index]))
+            h.SetBinContent(cell, float(content[index]))
+            if sumw2 is not None:
+                h.GetSumw2().AddAt(float(sumw2[index]), cell)
+    h.ResetStats()
+    return h
+
+def array_to_hist(name, content, template, sumw2=None):
+    '''Make a new histogram with the binning of `template` filled from numpy arrays.
+    See `set_hist_from_array()` for the accepted shapes.
+
+    Args:
+        name (str): Name (and title) of the new histogram.
+        content (numpy.ndarray): Bin contents.
+        template (TH1): Histogram to take the binning (and type) from.
+        sumw2 (numpy.ndarray, optional): Sum of squared weights. Defaults to None.
+
+    Returns:
+        TH1: New histogram.
+    '''
+    h = template.Clone(name)
+    h.SetTitle(name)
+    h.Reset()
+    if sumw2 is not None: h.Sumw2()
+    return set_hist_from_array(h, content, sumw2)
+
+def _rdh_bins(rdh):
+    ral = ROOT.RooArgList(rdh.get())
+    return [ral.at(i).getBins() for i in range(ral.getSize())]
+
+def rdh_to_array(rdh):
+    '''Read the weights and sum of squared weights of a RooDataHist with one or two observables
+    into numpy arrays, in the same layout as `hist_to_array(..., flow=False)` (ie. [ybin][xbin] where
+    x is the first observable).
+
+    Args:
+        rdh (RooDataHist): Input dataset.
+
+    Returns:
+        tuple(numpy.ndarray): Weights and sum of squared weights.
+    '''
+    bins = _rdh_bins(rdh)
+    if len(bins) > 2:
+        raise TypeError('Only RooDataHists with one or two observables are supported.')
+    n = rdh.numEntries()
+    if hasattr(rdh, 'weightArray'): # ROOT >= 6.24
+        weights = numpy.array(_buffer_view(rdh.weightArray(), n, 'f8'))
+        sumw2 = numpy.array(_buffer_view(rdh.sumW2Array(), n, 'f8')) if rdh.sumW2Array() else weights.copy()
+    else:
+        weights, sumw2 = numpy.empty(n), numpy.empty(n)
+        for i in range(n):
+            rdh.get(i)
+            weights[i] = rdh.weight()
+            sumw2[i] = rdh.weightError(ROOT.RooAbsData.SumW2)**2
+    # The RooDataHist index runs fastest over the last observable
+    return weights.reshape(bins).T, sumw2.reshape(bins).T
+
+def array_to_rdh(name, content, RAL_vars, template, sumw2=None):
+    '''Make a RooDataHist from numpy arrays via a histogram with the binning of `template`.
+    See `set_hist_from_array()` for the accepted shapes.
+
+    Args:
+        name (str): Name of the RooDataHist.
+        content (numpy.ndarray): Bin contents.
+        RAL_vars (RooArgList): List of RooRealVars representing the axes.
+        template (TH1): Histogram to take the binning from.
+        sumw2 (numpy.ndarray, optional): Sum of squared weights. Defaults to None.
+
+    Returns:
+        RooDataHist
+    '''
+    return make_RDH(array_to_hist(name+'_hist', content, template, sumw2), RAL_vars, name)
+
 # def make_RHP(myRDH,RAL_vars):
 #     name = myRDH.GetName()
 #     thisRAS = ROOT.RooArgSet(RAL_vars)
@@ -294,6 +506,65 @@ def _combineTool_impacts_fix(fileNameExpected):
             new_name = '%s.root'%('.'.join(f.split('.')[:-2]))
             execute_cmd('mv %s %s'%(f,new_name))
 
+# ----------------- TFile key index --------------------
+class KeyIndex():
+    '''Name to TKey index of the top-level keys of an open TFile so that
+    existence checks and lookups are constant time instead of a scan of
+    `GetListOfKeys()`. The index is built lazily on first use and must be
+    invalidated (see `Invalidate()`) whenever the file is written to.
+
+    Only the highest cycle of each name is kept, consistent with `TFile::Get()`.
+
+    Args:
+        tfile (TFile): Open file to index.
+    '''
+    def __init__(self, tfile):
+        self.file = tfile
+        self._keys = None
+
+    @property
+    def keys(self):
+        '''
+        Returns:
+            dict: Map of object name to TKey.
+        '''
+        if self._keys is None:
+            self._keys = {}
+            for k in self.file.GetListOfKeys():
+                name = k.GetName()
+                if name not in self._keys or k.GetCycle() > self._keys[name].GetCycle():
+                    self._keys[name] = k
+        return self._keys
+
+    def Invalidate(self):
+        '''Drop the index so that it is rebuilt on the next lookup.'''
+        self._keys = None
+
+    def Names(self):
+        return list(self.keys.keys())
+
+    def Get(self, name):
+        '''Get the object from the file.
+
+        Args:
+            name (str): Name of the object.
+
+        Raises:
+            NameError: If the object does not exist in the file.
+
+        Returns:
+            TObject: Object read from the file.
+        '''
+        if name not in self.keys:
+            raise NameError('Object %s does not exist in file %s.'%(name,self.file.GetName()))
+        return self.file.Get(name)
+
+    def __contains__(self, name):
+        return name in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
 # ----------------- Inline condor submission --------------------
 class CondorRunner():
     def __init__(self, name, primaryCmds, toPkg, runIn, toGrab, remakeEnv=False, eosRootfileTarball=None):
@@ -383,6 +654,114 @@ class CondorRunner():
 
         return os.path.abspath(shell_name)
 
+# ----------------- Local parallel execution --------------------
+class LocalRunner():
+    def __init__(self, name, primaryCmds, toPkg=None, runIn='', toGrab=None, remakeEnv=False, eosRootfileTarball=None,
+                       nWorkers=1, retries=0, logDir=None):
+        '''Run a list of shell commands on the local machine with a bounded pool of
+        concurrent processes. The constructor and `submit()` follow the CondorRunner
+        interface so that the two can be swapped. Arguments only needed to ship jobs
+        to condor (`toPkg`, `toGrab`, `remakeEnv`, `eosRootfileTarball`) are accepted
+        and ignored since the outputs are already written locally.
+
+        The stdout and stderr of each job are written to `<logDir>/<name>_<job index>.log`.
+
+        Args:
+            name (str): Name of the group of jobs (used for the log file names).
+            primaryCmds (list(str)): Shell commands, one per job.
+            toPkg (str, optional): Ignored. Defaults to None.
+            runIn (str or list(str), optional): Directory in which to run the jobs (or one per job).
+                Defaults to '' which is the current directory.
+            toGrab (str, optional): Ignored. Defaults to None.
+            remakeEnv (bool, optional): Ignored. Defaults to False.
+            eosRootfileTarball (str, optional): Ignored. Defaults to None.
+            nWorkers (int, optional): Maximum number of jobs to run at once. Defaults to 1.
+            retries (int, optional): Number of times to rerun a failed job. Defaults to 0.
+            logDir (str, optional): Directory for the log files. Defaults to "notneeded/<name>_logs/".
+        '''
+        self.name = name.replace('/','_')
+        self.primary_cmds = primaryCmds
+        self.run_in = runIn if isinstance(runIn, list) else [runIn]*len(primaryCmds)
+        if len(self.run_in) != len(self.primary_cmds):
+            raise ValueError('Number of run directories (%s) does not match the number of commands (%s).'%(len(self.run_in),len(self.primary_cmds)))
+        self.run_in = [os.path.abspath(d) if d != '' else os.getcwd() for d in self.run_in]
+        self.to_grab = toGrab
+        self.nworkers = max(1, nWorkers)
+        self.retries = retries
+        self.log_dir = os.path.abspath(logDir if logDir != None else 'notneeded/%s_logs'%self.name)
+        self.logs = ['%s/%s_%s.log'%(self.log_dir,self.name,i) for i in range(len(primaryCmds))]
+        self.status = [None]*len(primaryCmds)
+        self.attempts = [0]*len(primaryCmds)
+
+    def submit(self):
+        '''Run all jobs and wait for them to finish.
+
+        Returns:
+            list(int): Exit status of each job (after retries).
+        '''
+        if not os.path.exists(self.log_dir): os.makedirs(self.log_dir)
+        with ThreadPoolExecutor(max_workers=self.nworkers) as pool:
+            list(pool.map(self._run_job, range(len(self.primary_cmds))))
+
+        if len(self.failed) > 0:
+            print ('WARNING: %s of %s jobs in %s failed:'%(len(self.failed), len(self.primary_cmds), self.name))
+            for i in self.failed:
+                print ('\t[%s] exit status %s after %s attempt(s), see %s'%(i, self.status[i], self.attempts[i], self.logs[i]))
+        return self.status
+
+    @property
+    def failed(self):
+        '''
+        Returns:
+            list(int): Indices of the jobs that finished with a non-zero exit status.
+        '''
+        return [i for i,s in enumerate(self.status) if s != 0]
+
+    def _run_job(self, i):
+        cmd = self.primary_cmds[i]
+        for attempt in range(self.retries+1):
+            print ('Executing [%s_%s]: %s'%(self.name, i, cmd))
+            with open(self.logs[i], 'w' if attempt == 0 else 'a') as log:
+                log.write('# attempt %s in %s\n# %s\n'%(attempt+1, self.run_in[i], cmd))
+                log.flush()
+                self.status[i] = subprocess.call(cmd, shell=True, cwd=self.run_in[i], stdout=log, stderr=subprocess.STDOUT)
+            self.attempts[i] = attempt+1
+            if self.status[i] == 0:
+                break
+        return self.status[i]
+
+def run_cmds(name, cmds, runIn='', nWorkers=1, retries=0):
+    '''Run shell commands serially with `execute_cmd()` (default) or, if `nWorkers` > 1,
+    in parallel with a `LocalRunner`.
+
+    Args:
+        name (str): Name of the group of jobs.
+        cmds (list(str)): Shell commands.
+        runIn (str or list(str), optional): Directory (or one per command) in which to run. Defaults to ''
+            which is the current directory.
+        nWorkers (int, optional): Maximum number of jobs to run at once. Defaults to 1.
+        retries (int, optional): Number of times to rerun a failed job (parallel mode only). Defaults to 0.
+
+    Raises:
+        RuntimeError: If any job failed (parallel mode only) so that later steps do not run on missing outputs.
+
+    Returns:
+        None
+    '''
+    if nWorkers > 1:
+        runner = LocalRunner(name, cmds, runIn=runIn, nWorkers=nWorkers, retries=retries)
+        runner.submit()
+        if len(runner.failed) > 0:
+            raise RuntimeError('Jobs %s of %s failed. See the logs in %s.'%(runner.failed, name, runner.log_dir))
+    else:
+        run_in = runIn if isinstance(runIn, list) else [runIn]*len(cmds)
+        for cmd, d in zip(cmds, run_in):
+            if d == '':
+                execute_cmd(cmd)
+            else:
+                with cd(d):
+                    execute_cmd(cmd)
+
 def make_env_tarball(makeEnv=True):
     dir_base = os.environ['CMSSW_BASE']
     cmssw = dir_base.split('/')[-1]
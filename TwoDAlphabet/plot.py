@@ -1,9 +1,10 @@
 import glob
-import ROOT, os, warnings, pandas, math, time
-from PIL import Image
-from TwoDAlphabet.helpers import set_hist_maximums, execute_cmd, cd
+import os, warnings, pandas, math, time, numpy
+from TwoDAlphabet.helpers import ROOT, LazyModule, set_hist_maximums, execute_cmd, run_cmds, cd, KeyIndex, hist_to_array, set_hist_from_array
 from TwoDAlphabet.binning import stitch_hists_in_x, convert_to_events_per_unit, get_min_bin_width
-from TwoDAlphabet.ext import tdrstyle, CMS_lumi
+Image = LazyModule('PIL.Image')
+tdrstyle = LazyModule('TwoDAlphabet.ext.tdrstyle')
+CMS_lumi = LazyModule('TwoDAlphabet.ext.CMS_lumi')
 
 class Plotter(object):
     '''Class to manage output distributions, manipulate them, and provide access to plotting
@@ -19,6 +20,7 @@ class Plotter(object):
         dir (str): Directory path to save final images.
         slices (dict): Stores edges to slice "x" and "y" axes. 
         root_out (ROOT.TFile): File storing all histograms that are made.
+        root_out_keys (KeyIndex): Name to TKey index of `root_out`.
     '''
     def __init__(self,ledger,twoD,fittag,loadExisting=False):
         '''Constructor.
@@ -37,6 +39,7 @@ class Plotter(object):
         self.dir = 'plots_fit_{f}'.format(f=self.fittag)
         self.slices = {'x': {}, 'y': {}}
         self.root_out = None
+        self.root_out_keys = None
 
         if not loadExisting:
             self._make()
@@ -53,6 +56,7 @@ class Plotter(object):
         and reference with `self.df` and `self.root_out` attributes.'''
         root_out_name = '%s/all_plots.root'%self.dir
         self.root_out = ROOT.TFile.Open(root_out_name)
+        self.root_out_keys = KeyIndex(self.root_out)
         self.df = pandas.read_csv('%s/df.csv'%self.dir)
 
     def _format_1Dhist(self, hslice, title, xtitle, ytitle, color, proc_type):
@@ -188,6 +192,7 @@ class Plotter(object):
         shapes_file.Close()
         self.root_out.Close()
         self.root_out = ROOT.TFile.Open(root_out_name)
+        self.root_out_keys = KeyIndex(self.root_out)
 
     def Get(self,hname=None,row=None,hist_type=None):
         '''Get a histogram by name from the master ROOT file.
@@ -200,7 +205,7 @@ class Plotter(object):
             LookupError: If histogram cannot be found.
         '''
         if hname != None:
-            if hname not in [k.GetName() for k in self.root_out.GetListOfKeys()]:
+            if hname not in self.root_out_keys:
                 raise LookupError('Histogram %s not found in %s'%(hname,self.root_out.GetName()))
             name = hname
         else:
@@ -836,25 +841,17 @@ def _make_pull_plot(data, bkg, preVsPost=False):
     pull = data.Clone(data.GetName()+"_pull")
     pull.Add(bkg,-1)
     
-    sigma = 0.0
-    for ibin in range(1,pull.GetNbinsX()+1):
-        d = data.GetBinContent(ibin)
-        b = bkg.GetBinContent(ibin)
-        if d >= b:
-            derr = data.GetBinErrorLow(ibin)
-            berr = bkg.GetBinErrorUp(ibin)
-        elif d < b:
-            derr = data.GetBinErrorUp(ibin)
-            berr = bkg.GetBinErrorLow(ibin)
-        
-        if d == 0:
-            derr = 1
-
-        sigma = math.sqrt(derr*derr + berr*berr)
-        if sigma != 0:
-            pull.SetBinContent(ibin, (pull.GetBinContent(ibin))/sigma)
-        else:
-            pull.SetBinContent(ibin, 0.0 )
+    d = hist_to_array(data, flow=False)[0]
+    b = hist_to_array(bkg, flow=False)[0]
+    # Asymmetric (ex. Poisson) errors are only available bin-by-bin
+    bins = range(1,pull.GetNbinsX()+1)
+    derr = numpy.where(d >= b, [data.GetBinErrorLow(i) for i in bins], [data.GetBinErrorUp(i) for i in bins])
+    berr = numpy.where(d >= b, [bkg.GetBinErrorUp(i) for i in bins], [bkg.GetBinErrorLow(i) for i in bins])
+    derr[d == 0] = 1
+
+    sigma = numpy.sqrt(derr*derr + berr*berr)
+    diff = hist_to_array(pull, flow=False)[0]
+    set_hist_from_array(pull, numpy.where(sigma != 0, diff/numpy.where(sigma != 0, sigma, 1), 0.0))
 
     pull.SetFillColor(ROOT.kBlue)
     pull.SetTitle(";"+data.GetXaxis().GetTitle()+";({})/#sigma".format('Post-Pre' if preVsPost else 'Data-Bkg'))
@@ -873,8 +870,9 @@ def _make_pull_plot(data, bkg, preVsPost=False):
 
 def _get_good_fit_results(tfile):
     successful_fits = []
+    tfile_keys = KeyIndex(tfile)
     for fittag in ['b','s']:
-        if 'fit_'+fittag not in [k.GetName() for k in tfile.GetListOfKeys()]:
+        if 'fit_'+fittag not in tfile_keys:
             warnings.warn('Unable to find result fit_%s...'%fittag,RuntimeWarning)
         else:
             successful_fits.append(fittag)
@@ -912,17 +910,25 @@ def save_post_fit_parametric_vals():
 
     fit_result_file.Close()
 
-def gen_post_fit_shapes():
+def gen_post_fit_shapes(nWorkers=1, retries=0):
+    '''Run PostFit2DShapesFromWorkspace for each good fit result (b and/or s) in fitDiagnosticsTest.root.
+
+    Args:
+        nWorkers (int, optional): Number of fit results to process at once. Defaults to 1 (serial).
+        retries (int, optional): Number of times to rerun a failed job when nWorkers > 1. Defaults to 0.
+    '''
     fit_result_file = ROOT.TFile.Open('fitDiagnosticsTest.root')
     goodFitTags = _get_good_fit_results(fit_result_file)
+    shapes_cmds = []
     for t in goodFitTags:
         if os.path.exists('higgsCombineTest.FitDiagnostics.mH120.root'):
             workspace_file = 'higgsCombineTest.FitDiagnostics.mH120.root'
         else:
             workspace_file = 'higgsCombineTest.FitDiagnostics.mH120.123456.root'
         shapes_cmd = 'PostFit2DShapesFromWorkspace -w {w} --output postfitshapes_{t}.root -f fitDiagnosticsTest.root:fit_{t} --postfit --samples 100 --print > PostFitShapes2D_stderr_{t}.txt'.format(t=t,w=workspace_file)
-        execute_cmd(shapes_cmd)
+        shapes_cmds.append(shapes_cmd)
     fit_result_file.Close()
+    run_cmds('postfitshapes', shapes_cmds, nWorkers=nWorkers, retries=retries)
 
 def _reduced_corr_matrix(fit_result, varsToIgnore=[], varsOfInterest=[], threshold=0):
     if threshold < 0:
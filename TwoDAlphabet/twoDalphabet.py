@@ -1,11 +1,11 @@
-import argparse, os, itertools, pandas, glob, pickle, sys, re, random, copy, numpy
+import argparse, os, itertools, pandas, glob, pickle, sys, re, random, copy, numpy, numbers, json
 from collections import OrderedDict
 from TwoDAlphabet.config import Config, OrganizedHists
-from TwoDAlphabet.binning import Binning
-from TwoDAlphabet.helpers import CondorRunner, execute_cmd, parse_arg_dict, unpack_to_line, make_RDH, cd, _combineTool_impacts_fix
+from TwoDAlphabet.binning import Binning, save_binnings, load_binnings
+from TwoDAlphabet.cache import IngestCache
+from TwoDAlphabet.helpers import ROOT, CondorRunner, LocalRunner, execute_cmd, run_cmds, parse_arg_dict, unpack_to_line, make_RDH, cd, _combineTool_impacts_fix
 from TwoDAlphabet.alphawrap import Generic2D
 from TwoDAlphabet import plot
-import ROOT
 
 class TwoDAlphabet:
     '''Class to ingest and organize inputs.
@@ -40,6 +40,7 @@ class TwoDAlphabet:
         self.iterWorkspaceObjs = config.iterWorkspaceObjs  ## Key-value pairs in JSON where value is a list
         self._binningMap = {r:config._section('REGIONS')[r]['BINNING'] for r in config._section('REGIONS').keys()}
         self.ledger = Ledger(self.df)  ## See class Ledger() below
+        self._alphaObjStorage = []  ## Keeps the objects added with AddAlphaObjs() (and their RooParametricHists) alive
 
         if not loadPrevious:
             self._setupProjDir(verbose)
@@ -57,16 +58,24 @@ class TwoDAlphabet:
             if verbose: print('About to create OrganizedHists()')
             self.organizedHists = OrganizedHists(
                 self.tag+'/', self.binnings,
-                self.GetHistMap(verbose=verbose), readOnly=False, trimSig=True
+                self.GetHistMap(verbose=verbose), readOnly=False, trimSig=True,
+                nWorkers=self.options.nIngestWorkers,
+                cache=IngestCache(self.options.ingestCache, self.options.ingestCacheSize) if self.options.ingestCache else None,
+                lazySubRegions=self.options.lazySubRegions,
+                backend=self.options.organizedBackend
             )
             if verbose: print('About to run _makeWorkspace()')
             self.workspace = self._makeWorkspace()
 
         else:
-            self.binnings = pickle.load(open(self.tag+'/binnings.p','rb'))
+            if os.path.exists(self.tag+'/binnings.json'):
+                self.binnings = load_binnings(self.tag+'/binnings.json')
+            else: # projects saved before binnings.json
+                self.binnings = pickle.load(open(self.tag+'/binnings.p','rb'))
             self.organizedHists = OrganizedHists(
                 self.tag+'/', self.binnings,
-                self.GetHistMap(verbose=verbose), readOnly=True
+                self.GetHistMap(verbose=verbose), readOnly=True,
+                backend=self.options.organizedBackend
             )
             # Does not contain the RooFit objects - just meta info
             self.ledger = LoadLedger(self.tag+'/', verbose=verbose)
@@ -132,6 +141,19 @@ class TwoDAlphabet:
             help='Post-fit bins are plotted as events per unit rather than events per bin. Defaults to False.')
         parser.add_argument('year', default=1, type=int, nargs='?',
             help='Year information used for the sake of plotting text. Defaults to 1 which indicates that the full Run 2 is being analyzed.')
+        # Performance
+        parser.add_argument('nIngestWorkers', default=1, type=int, nargs='?',
+            help='Number of worker processes used to read, rebin, and split the input histograms (one or more source files per worker). Defaults to 1 (serial).')
+        parser.add_argument('organizedBackend', default='root', type=str, nargs='?',
+            help='Storage of the organized histograms - "root" (organized_hists.root) or "array" (memory-mapped arrays in organized_hists.arrays, exported to ROOT when read). Defaults to "root".')
+        parser.add_argument('lazySubRegions', default=False, type=bool, nargs='?',
+            help='Only store the full histograms in organized_hists.root and make the LOW, SIG, and HIGH histograms when they are read. Defaults to False.')
+        parser.add_argument('ingestCache', default='', type=str, nargs='?',
+            help='Directory of a cache of the processed input histograms shared between projects. Only the histograms whose inputs changed are processed again. Defaults to "" (no cache).')
+        parser.add_argument('ingestCacheSize', default='0', type=str, nargs='?',
+            help='Maximum size of the ingestion cache, in bytes or with a K, M, G, or T suffix (ex. "5G"). The least recently used entries are removed beyond it. Defaults to "0" (no limit).')
+        parser.add_argument('exportLedger', default=False, type=bool, nargs='?',
+            help='Also save the ledgers as csv and markdown tables for inspection. The ledger.npz file is always saved and is the one read back. Defaults to False.')
 
         if nonDefaultOpts != {}:
             out = parse_arg_dict(parser,nonDefaultOpts)
@@ -141,22 +163,22 @@ class TwoDAlphabet:
 
     def Save(self):
         '''Save to project directory:
-        - the full model table in csv (and markdown if py3)
-        - the binnings dictionary (with objects)
+        - the full model table in ledger.npz (and csv/markdown if the exportLedger option is set)
+        - the binnings dictionary (without objects, in binnings.json)
         - the alphaObjs and alphaParams dictionaries (without objects)
         '''
         fworkspace = ROOT.TFile.Open(self.tag+'/base.root','RECREATE')
         fworkspace.cd()
         self.workspace.Write()
 
-        pickle.dump(self.binnings,open(self.tag+'/binnings.p','wb'))
-        self.ledger.Save(self.tag)
+        save_binnings(self.binnings, self.tag+'/binnings.json')
+        self.ledger.Save(self.tag, export=self.options.exportLedger)
 
         if self.options.plotTemplateComparisons:
             plot.make_systematic_plots(self)
 
 # --------------AlphaObj INTERFACE ------ #
-    def AddAlphaObj(self, process, region, obj, ptype='BKG', color=ROOT.kYellow, title=None):
+    def AddAlphaObj(self, process, region, obj, ptype='BKG', color=None, title=None):
         '''Start
 
         Args:
@@ -164,38 +186,73 @@ class TwoDAlphabet:
             region ([type]): [description]
             obj ([type]): [description]
             ptype ([str]): 'BKG' or 'SIGNAL'.
+            color (int, optional): ROOT color. Defaults to None in which case ROOT.kYellow is used.
         '''
-        if not isinstance(obj, Generic2D):
-            raise RuntimeError('Can only tack objects of type Generic2D.')
-        if ptype not in ['BKG','SIGNAL']:
-            raise RuntimeError('Process type (ptype) can only be BKG or SIGNAL.')
-        
-        title_to_use = process if title == None else title
-        self.ledger._checkAgainstConfig(process, region)
-
-        rph,norm = obj.RooParametricHist(name=process+'_'+region)
-        model_obj_row = {
-            "process": process,
-            "region": region,
-            "process_type": ptype,
-            "color": color,
-            'title': title_to_use
-        }
-
-        self.ledger.alphaObjs = self.ledger.alphaObjs.append(model_obj_row, ignore_index=True)
-
-        nuis_obj_cols = ['name', 'constraint']
-        for n in obj.nuisances:
-            d = {c:n[c] for c in nuis_obj_cols}
-            d['owner'] = process+'_'+region
-            self.ledger.alphaParams = self.ledger.alphaParams.append(d, ignore_index=True)
-
-        for rph_cat in rph.values():
-            print ('Adding RooParametricHist... %s'%rph_cat.GetName())
-            getattr(self.workspace,'import')(rph_cat,ROOT.RooFit.RecycleConflictNodes(),ROOT.RooFit.Silence())
-        for norm_cat in norm.values():
-            print ('Adding RooParametricHist norm... %s'%norm_cat.GetName())
-            getattr(self.workspace,'import')(norm_cat,ROOT.RooFit.RecycleConflictNodes(),ROOT.RooFit.Silence())
+        self.AddAlphaObjs([{'process': process, 'region': region, 'obj': obj,
+                            'ptype': ptype, 'color': color, 'title': title}])
+
+    def AddAlphaObjs(self, alphaObjs):
+        '''Bulk version of `AddAlphaObj()`. All objects are checked first, their rows and nuisance
+        parameters are added to the ledger in one step (one concatenation per table), and the
+        RooParametricHists (and norms) of every category of every object are passed to the workspace
+        in one RooArgSet. RooWorkspace::import still imports the elements of the set one at a time.
+
+        The objects (along with the Generic2Ds they were built from and their RooParametricHists)
+        are kept alive by this TwoDAlphabet object so the caller does not need to hold on to them.
+
+        Args:
+            alphaObjs (list(dict)): One dictionary per object with the arguments of `AddAlphaObj()`
+                as keys ("process", "region", "obj", and optionally "ptype", "color", and "title").
+
+        Raises:
+            RuntimeError: If an object is not of type Generic2D.
+            RuntimeError: If the process type is not BKG or SIGNAL.
+        '''
+        model_obj_rows, nuis_rows = [], []
+        to_import = ROOT.RooArgSet()
+        for alphaObj in alphaObjs:
+            process, region, obj = alphaObj['process'], alphaObj['region'], alphaObj['obj']
+            ptype = alphaObj.get('ptype', 'BKG')
+            title = alphaObj.get('title', None)
+            if not isinstance(obj, Generic2D):
+                raise RuntimeError('Can only tack objects of type Generic2D.')
+            if ptype not in ['BKG','SIGNAL']:
+                raise RuntimeError('Process type (ptype) can only be BKG or SIGNAL.')
+
+            title_to_use = process if title == None else title
+            self.ledger._checkAgainstConfig(process, region)
+
+            rph,norm = obj.RooParametricHist(name=process+'_'+region)
+            model_obj_rows.append({
+                "process": process,
+                "region": region,
+                "process_type": ptype,
+                "color": ROOT.kYellow if alphaObj.get('color') is None else alphaObj['color'],
+                'title': title_to_use
+            })
+
+            nuis_obj_cols = ['name', 'constraint']
+            for n in obj.nuisances:
+                d = {c:n[c] for c in nuis_obj_cols}
+                d['owner'] = process+'_'+region
+                nuis_rows.append(d)
+
+            for rph_cat in rph.values():
+                print ('Adding RooParametricHist... %s'%rph_cat.GetName())
+                to_import.add(rph_cat)
+            for norm_cat in norm.values():
+                print ('Adding RooParametricHist norm... %s'%norm_cat.GetName())
+                to_import.add(norm_cat)
+            self._alphaObjStorage.append((obj,rph,norm)) # RooArgSet does not own the objects
+
+        self.ledger.alphaObjs = pandas.concat(
+            [self.ledger.alphaObjs, pandas.DataFrame(model_obj_rows, columns=self.ledger.alphaObjs.columns)],
+            ignore_index=True)
+        self.ledger.alphaParams = pandas.concat(
+            [self.ledger.alphaParams, pandas.DataFrame(nuis_rows, columns=self.ledger.alphaParams.columns)],
+            ignore_index=True)
+
+        getattr(self.workspace,'import')(to_import,ROOT.RooFit.RecycleConflictNodes(),ROOT.RooFit.Silence())
 
 # --------------- GETTERS --------------- #
     def InitQCDHists(self, verbose=False):
@@ -328,7 +385,30 @@ class TwoDAlphabet:
     def MakeCard(self, subledger, subtag, workspaceDir='../'):
         with cd(self.tag):
             _runDirSetup(subtag)
-            MakeCard(subledger, subtag, workspaceDir)
+            MakeCard(subledger, subtag, workspaceDir, exportLedger=self.options.exportLedger)
+
+    def MakeCards(self, selections, workspaceDir='../'):
+        '''Make the cards (and save the ledgers) of several subsets of the ledger in one call
+        (ex. one per signal mass point). See `MakeCards()` for the accepted selections.
+
+        Example:
+            ::
+
+                twoD.MakeCards([
+                    ('mA_%s_area'%m, (_select_signal, 'Htoaato4b_mA_%s'%m, 'poly')) for m in masses
+                ])
+
+        Args:
+            selections (list(tuple)): List of (subtag, selection) pairs.
+            workspaceDir (str, optional): Directory (relative to the subtags) containing base.root. Defaults to '../'.
+
+        Returns:
+            OrderedDict(str,Ledger): The subset Ledger of each subtag.
+        '''
+        with cd(self.tag):
+            for subtag, _ in selections:
+                _runDirSetup(subtag)
+            return MakeCards(self.ledger, selections, workspaceDir, exportLedger=self.options.exportLedger)
 
 # -------- STAT METHODS ------------------ #
     def MLfit(self, subtag, cardOrW='card.txt', rMin=-1, rMax=10, setParams={}, verbosity=0, usePreviousFit=False, defMinStrat=0, extra=''):
@@ -347,10 +427,12 @@ class TwoDAlphabet:
             # systematic_analyzer_cmd = 'python $CMSSW_BASE/src/HiggsAnalysis/CombinedLimit/test/systematicsAnalyzer.py card.txt --all -f html > systematics_table.html'
             # execute_cmd(systematic_analyzer_cmd)    
 
-    def StdPlots(self, subtag, ledger=None, prefit=False):
+    def StdPlots(self, subtag, ledger=None, prefit=False, nWorkers=1):
         '''
         Args:
             prefit (bool): If True, plots the prefit distributions instead of postfit. Defaults to False.
+            nWorkers (int, optional): Number of local processes used to generate the b and s post-fit
+                shapes at the same time. Defaults to 1 (serial).
         '''
         run_dir = self.tag+'/'+subtag
         with cd(run_dir):
@@ -363,7 +445,7 @@ class TwoDAlphabet:
                 threshold=0, # change this to reduce the size of the correlation matrix to only those variables with correlations above a threshold
         corrText=False # change this if you want the correlation matrix to write the number values to each grid square (often there are too many parameters and looks ugly/useless)
             )
-            plot.gen_post_fit_shapes()
+            plot.gen_post_fit_shapes(nWorkers=nWorkers)
             plot.gen_projections(ledger, self, 'b', prefit)
             plot.gen_projections(ledger, self, 's', prefit)
             
@@ -457,7 +539,14 @@ class TwoDAlphabet:
         return masked_regions
 
     def GoodnessOfFit(self, subtag, ntoys, card_or_w='card.txt', freezeSignal=False, seed=123456,
-                            verbosity=0, extra='', condor=False, eosRootfiles=None, njobs=0, makeEnv=False):
+                            verbosity=0, extra='', condor=False, eosRootfiles=None, njobs=0, makeEnv=False, nWorkers=1):
+        '''Run the saturated goodness of fit test on data and on `ntoys` toys.
+
+        Args:
+            nWorkers (int, optional): When running locally (`condor=False`), split the toys across this
+                many combine processes with seeds `seed`, `seed+1`, ... and merge their output into
+                higgsCombine_gof_toys.GoodnessOfFit.mH120.<seed>.root. Defaults to 1 (one process).
+        '''
         # NOTE: There's no way to blind data here - need to evaluate it to get the p-value
         # param_str = '' if setParams == {} else '--setParameters '+','.join(['%s=%s'%(p,v) for p,v in setParams.items()])
 
@@ -484,7 +573,12 @@ class TwoDAlphabet:
 
             execute_cmd(gof_data_cmd)
 
-            if not condor:
+            if not condor and nWorkers > 1:
+                _runToyShards(self.tag.replace('/','_')+'_'+subtag+'_gof_toys', gof_toy_cmd, '-n _gof_toys', ntoys, seed, nWorkers,
+                    outputs=[('higgsCombine_gof_toys.GoodnessOfFit.mH120.%s.root'%seed, 'higgsCombine_gof_toys_shard{shard}.GoodnessOfFit.mH120.{seed}.root')]
+                )
+
+            elif not condor:
                 gof_toy_cmd = gof_toy_cmd.format(seed=seed, ntoys=ntoys)
                 execute_cmd(gof_toy_cmd)
                 
@@ -516,7 +610,14 @@ class TwoDAlphabet:
             condor.submit()
             
     def SignalInjection(self, subtag, injectAmount, ntoys, blindData=True, card_or_w='card.txt', rMin=-5, rMax=5, 
-                              seed=123456, verbosity=0, setParams={}, defMinStrat=0, extra='', condor=False, eosRootfiles=None, njobs=0, makeEnv=False):
+                              seed=123456, verbosity=0, setParams={}, defMinStrat=0, extra='', condor=False, eosRootfiles=None, njobs=0, makeEnv=False, nWorkers=1):
+        '''Fit `ntoys` toys generated with `injectAmount` of signal.
+
+        Args:
+            nWorkers (int, optional): When running locally (`condor=False`), split the toys across this
+                many combine processes with seeds `seed`, `seed+1`, ... and merge their output into
+                fitDiagnostics_sigInj_r<injectAmount>_<seed>.root. Defaults to 1 (one process).
+        '''
         run_dir = self.tag+'/'+subtag
         _runDirSetup(run_dir)
         
@@ -538,7 +639,15 @@ class TwoDAlphabet:
 
             fit_cmd = ' '.join(fit_cmd)
 
-            if not condor:
+            if not condor and nWorkers > 1:
+                _runToyShards(self.tag.replace('/','_')+'_'+subtag+'_sigInj_r'+rinj, fit_cmd, '-n _sigInj_r%s_{seed}'%rinj, ntoys, seed, nWorkers,
+                    outputs=[
+                        ('fitDiagnostics_sigInj_r%s_%s.root'%(rinj,seed), 'fitDiagnostics_sigInj_r%s_%s_shard{shard}.root'%(rinj,seed)),
+                        ('higgsCombine_sigInj_r%s_%s.FitDiagnostics.mH120.%s.root'%(rinj,seed,seed), 'higgsCombine_sigInj_r%s_%s_shard{shard}.FitDiagnostics.mH120.{seed}.root'%(rinj,seed))
+                    ]
+                )
+
+            elif not condor:
                 fit_cmd = fit_cmd.format(seed=seed, ntoys=ntoys)
                 execute_cmd(fit_cmd)
                 
@@ -593,12 +702,55 @@ class TwoDAlphabet:
                 remakeEnv=makeEnv
                     )
                     condor.submit()
-                
-    def Impacts(self, subtag, rMin=-15, rMax=15, cardOrW='initialFitWorkspace.root --snapshotName initialFit', defMinStrat=0, blindData=True, extra=''):
+
+    def Limits(self, subtags, card_or_w='card.txt', blindData=True, verbosity=0,
+                     setParams={}, nWorkers=1, retries=0):
+        '''Run Limit() for several subtags (ex. mass points) with the same options. The
+        Combine commands are run with a LocalRunner so that up to `nWorkers` of them
+        run at once. Each command is still written to Limit_command.txt in its run directory.
+
+        Args:
+            subtags (list(str)): Subtags to run the limit in. Must all be non-empty.
+            card_or_w (str, optional): Card or workspace to run on. Defaults to 'card.txt'.
+            blindData (bool, optional): Defaults to True.
+            verbosity (int, optional): Defaults to 0.
+            setParams (dict, optional): Parameter values to set. Defaults to {}.
+            nWorkers (int, optional): Number of limits to run at once. Defaults to 1 (serial).
+            retries (int, optional): Number of times to rerun a failed limit. Defaults to 0.
+
+        Returns:
+            None
+        '''
+        if '' in subtags:
+            raise RuntimeError('The subtag for limits must be non-empty so that the limit will be run in a nested directory.')
+
+        run_dirs, limit_cmds = [], []
+        for subtag in subtags:
+            run_dir = self.tag+'/'+subtag
+            _runDirSetup(run_dir)
+            with cd(run_dir):
+                limit_cmd = _runLimit(blindData, verbosity, setParams, card_or_w, condor=True)
+                with open('Limit_command.txt','w') as out:
+                    out.write(limit_cmd)
+            run_dirs.append(run_dir)
+            limit_cmds.append(limit_cmd)
+
+        run_cmds(self.tag.replace('/','_')+'_limits', limit_cmds, runIn=run_dirs, nWorkers=nWorkers, retries=retries)
+
+    def Impacts(self, subtag, rMin=-15, rMax=15, cardOrW='initialFitWorkspace.root --snapshotName initialFit', defMinStrat=0, blindData=True, extra='',
+                      nWorkers=1, retries=0):
+        '''Run the impacts of all systematics in the `subtag` ledger with combineTool.
+
+        Args:
+            nWorkers (int, optional): Number of local processes used for the fits of the individual
+                nuisance parameters (`--doFits`). The systematics are split into `nWorkers` groups, each
+                fit with one combineTool call. Defaults to 1 (one combineTool call).
+            retries (int, optional): Number of times to rerun a failed group of fits. Defaults to 0.
+        '''
         # param_str = '' if setParams == {} else '--setParameters '+','.join(['%s=%s'%(p,v) for p,v in setParams.items()])
         with cd(self.tag+'/'+subtag):
             subset = LoadLedger('')
-            impact_nuis_str = '--named='+','.join(subset.GetAllSystematics())
+            systematics = subset.GetAllSystematics()
             if cardOrW.endswith('.txt'):
                 execute_cmd('text2workspace.py -b %s -o prefitWorkspace.root --channel-masks --X-no-jmax'%cardOrW)
                 card_or_w = 'prefitWorkspace.root'
@@ -609,103 +761,229 @@ class TwoDAlphabet:
                 '-M Impacts', '--rMin %s'%rMin,
                 '--rMax %s'%rMax, '-d %s'%card_or_w,
                 '--cminDefaultMinimizerStrategy {} -m 0'.format(defMinStrat),
-                impact_nuis_str, extra, #param_str,
+                extra, #param_str,
                 '-t -1 --bypassFrequentistFit' if blindData else ''
             ]
+            named_opts = lambda named: ' '.join(base_opts+['--named='+','.join(named)])
             # Remove old runs if they exist
             execute_cmd('rm *_paramFit_*.root *_initialFit_*.root')
             # Step 1
-            execute_cmd('combineTool.py %s --doInitialFit'%(' '.join(base_opts)))
+            execute_cmd('combineTool.py %s --doInitialFit'%named_opts(systematics))
             # Dumb hack - combineTool --doFits will go looking for the wrong file if you run on a toy
             _combineTool_impacts_fix('higgsCombine_initialFit_Test.MultiDimFit.mH0.root')
             
             # Step 2
-            execute_cmd('combineTool.py %s --doFits'%(' '.join(base_opts)))
+            if nWorkers > 1:
+                groups = [systematics[i::nWorkers] for i in range(min(nWorkers,len(systematics)))]
+                fit_cmds = ['combineTool.py %s --doFits'%named_opts(g) for g in groups]
+                run_cmds(self.tag.replace('/','_')+'_'+subtag+'_impacts', fit_cmds, nWorkers=nWorkers, retries=retries)
+            else:
+                execute_cmd('combineTool.py %s --doFits'%named_opts(systematics))
             # Dumb hack - combineTool next step will go looking for the wrong file if you run on a toy
             _combineTool_impacts_fix('higgsCombine_paramFit_Test_*.MultiDimFit.mH0.root')
 
             # Grab the output
-            execute_cmd('combineTool.py %s -o impacts.json'%(' '.join(base_opts)))
+            execute_cmd('combineTool.py %s -o impacts.json'%named_opts(systematics))
             execute_cmd('plotImpacts.py -i impacts.json -o impacts')
 
 class Ledger():
     def __init__(self, df):
+        '''Track the histograms (`df`), the alphabet objects (`alphaObjs`) and their parameters
+        (`alphaParams`) of the model.
+
+        Views derived from the three tables (regions, processes, process-region pairs, etc) are
+        computed once and cached for the current version of the tables. The version changes
+        whenever one of the tables is replaced (ex. `ledger.alphaObjs = pandas.concat(...)`)
+        or modified in place through `[]`, `.loc`, `.iloc`, `.at` or `.iat`. For other in-place
+        edits (ex. `inplace=True` methods), call `Invalidate()`.
+
+        Args:
+            df (pandas.DataFrame): Table of histograms (see `Config.FullTable()`).
+        '''
+        self._cache = {}
+        self._version = 0
+        self._cacheVersion = 0
         self.df = df
         self.alphaObjs = pandas.DataFrame(columns=['process','region','obj','norm','process_type','color','combine_idx','title'])
         self.alphaParams = pandas.DataFrame(columns=['name','constraint','owner'])
 
+    @property
+    def df(self):
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = _LedgerFrame(df, self.Invalidate)
+        self.Invalidate()
+
+    @property
+    def alphaObjs(self):
+        return self._alphaObjs
+
+    @alphaObjs.setter
+    def alphaObjs(self, df):
+        self._alphaObjs = _LedgerFrame(df, self.Invalidate)
+        self.Invalidate()
+
+    @property
+    def alphaParams(self):
+        return self._alphaParams
+
+    @alphaParams.setter
+    def alphaParams(self, df):
+        self._alphaParams = _LedgerFrame(df, self.Invalidate)
+        self.Invalidate()
+
+    def Invalidate(self):
+        '''Mark the tables as modified so that the cached views are recomputed.'''
+        self._version += 1
+
+    def _cached(self, key, func):
+        if self._cacheVersion != self._version:
+            self._cache = {}
+            self._cacheVersion = self._version
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def index(self):
+        '''
+        Returns:
+            pandas.MultiIndex: (process, region, variation) of each row of `df`.
+        '''
+        return self._cached('index', lambda: pandas.MultiIndex.from_arrays(
+            [self.df.process, self.df.region, self.df.variation], names=['process','region','variation']))
+
     def append(self, toAppend):
-        self.df.append(toAppend, ignore_index=True if isinstance(toAppend, dict) else False)
+        self.df = pandas.concat([self.df, pandas.DataFrame([toAppend]) if isinstance(toAppend, dict) else toAppend],
+                                ignore_index=True if isinstance(toAppend, dict) else False)
 
     def select(self,f,*args):
-        def _kept_owner(row, owner_names):
-            if row.owner in owner_names:
-                return True
-            else:
-                return False
+        '''Make a new Ledger with the rows of `df` and `alphaObjs` for which `f(row, args)` is True
+        (and the `alphaParams` owned by the kept `alphaObjs`). The rows are evaluated as
+        pandas.Series on every call (`f` may depend on state outside of its arguments).
+        Use `selectWhere()` to select on column values.
 
+        Args:
+            f (function): Function of the row (pandas.Series) and the tuple of `args` returning a bool.
+            *args: Extra arguments passed to `f`.
+
+        Returns:
+            Ledger: New Ledger.
+        '''
+        return self.selectMask(*self._selectMasks(f, args))
+
+    def _selectMasks(self, f, args):
         eval_lambda = lambda row: f(row,args)
-        df = self.df.loc[self.df.apply(eval_lambda, axis=1)]
-        new_ledger = Ledger(df)
-        new_ledger.alphaObjs = self.alphaObjs.loc[self.alphaObjs.apply(eval_lambda, axis=1)]
-        owner_names = new_ledger.alphaObjs.apply(lambda owner_row: owner_row.process+'_'+owner_row.region, axis=1).to_list()
-
-        new_ledger.alphaParams = self.alphaParams.loc[ # Keep params if owner object was kept
-                                        self.alphaParams.apply(
-                                            lambda row: _kept_owner(row, owner_names),
-                                            axis=1
-                                        )
-                                    ]
+        return _row_mask(self.df, eval_lambda), _row_mask(self.alphaObjs, eval_lambda)
+
+    def selectMask(self, dfMask, alphaObjsMask):
+        '''Make a new Ledger from boolean masks over the rows of `df` and `alphaObjs`.
+        The `alphaParams` owned by the kept `alphaObjs` are kept.
+
+        Args:
+            dfMask (array-like(bool)): Rows of `df` to keep.
+            alphaObjsMask (array-like(bool)): Rows of `alphaObjs` to keep.
+
+        Returns:
+            Ledger: New Ledger.
+        '''
+        new_ledger = Ledger(self.df.loc[numpy.asarray(dfMask, dtype=bool)])
+        new_ledger.alphaObjs = self.alphaObjs.loc[numpy.asarray(alphaObjsMask, dtype=bool)]
+        owner_names = new_ledger.alphaObjs.process.astype(str)+'_'+new_ledger.alphaObjs.region.astype(str)
+        # Keep params if owner object was kept
+        new_ledger.alphaParams = self.alphaParams.loc[self.alphaParams.owner.isin(owner_names)]
         return new_ledger
 
+    def selectWhere(self, **criteria):
+        '''Vectorized selection on column values. Each keyword is a column name and the value
+        is either a single value or a list of accepted values. Criteria on columns missing from
+        `alphaObjs` (ex. "variation") only apply to `df`.
+
+        Example:
+            ::
+
+                ledger.selectWhere(region=['SR_pass','SR_fail'], process_type='BKG')
+
+        Returns:
+            Ledger: New Ledger.
+        '''
+        return self.selectMask(*self._whereMasks(criteria))
+
+    def _whereMasks(self, criteria):
+        def _mask(df):
+            mask = numpy.ones(len(df), dtype=bool)
+            for col, vals in criteria.items():
+                if col not in df.columns:
+                    continue
+                vals = vals if isinstance(vals, (list, tuple, set)) else [vals]
+                mask &= df[col].isin(vals).to_numpy()
+            return mask
+        return _mask(self.df), _mask(self.alphaObjs)
+
     def GetRegions(self):
-        return list(self.df.region.unique())
+        return list(self._cached('regions', lambda: self.df.region.unique().tolist()))
 
     def GetProcesses(self, ptype='', includeNonConfig=True, includeConfig=True):
         if ptype not in ['','SIGNAL','BKG','DATA']:
             raise ValueError('Process type "%s" not accepted. Must be empty string or one of "SIGNAL","BKG","DATA".'%ptype)
 
-        proc_list = []
-        if includeConfig:
-            df = self.df
-            if ptype == '': to_add = df.process.unique()
-            else:           to_add = df[df.process_type.eq(ptype)].process.unique()
-            proc_list.extend( list(to_add) )
-
-        if includeNonConfig and self.alphaObjs.process.unique().size > 0:
-            df = self.alphaObjs
-            if ptype == '': to_add = df.process.unique()
-            else:           to_add = df[df.process_type.eq(ptype)].process.unique()
-            proc_list.extend( list(to_add) )
+        def _processes():
+            proc_list = []
+            if includeConfig:
+                proc_list.extend(_unique_processes(self.df, ptype))
+            if includeNonConfig and self.alphaObjs.process.unique().size > 0:
+                proc_list.extend(_unique_processes(self.alphaObjs, ptype))
+            return proc_list
 
-        return proc_list
+        return list(self._cached(('processes', ptype, includeNonConfig, includeConfig), _processes))
 
     def GetProcRegPairs(self):
-        return [g[0] for g in self.df.groupby(['process','region'])]+[g[0] for g in self.alphaObjs.groupby(['process','region'])]
+        def _pairs():
+            # Same (sorted) order as the groupby on process and region
+            return sorted(set(zip(self.df.process, self.df.region))) + sorted(set(zip(self.alphaObjs.process, self.alphaObjs.region)))
+        return list(self._cached('procRegPairs', _pairs))
+
+    def _procRegSet(self):
+        return self._cached('procRegSet', lambda: set(self.GetProcRegPairs()))
+
+    def _alphaProcesses(self):
+        return self._cached('alphaProcesses', lambda: set(self.alphaObjs.process.unique()))
 
     def GetShapeSystematics(self, drop_norms=False):
-        if drop_norms:
-            systs = self.df.loc[self.df.syst_type.eq('shapes')]
-        else:
-            systs = self.df
-        systs = systs.variation.unique()
-        systs = numpy.delete(systs, numpy.where(systs == 'nominal'))
-        return systs.tolist()
+        def _systs():
+            if drop_norms:
+                systs = self.df.loc[self.df.syst_type.eq('shapes')]
+            else:
+                systs = self.df
+            systs = systs.variation.unique()
+            systs = numpy.delete(systs, numpy.where(systs == 'nominal'))
+            return systs.tolist()
+        return list(self._cached(('shapeSystematics', drop_norms), _systs))
 
     def GetAlphaSystematics(self):
-        return self.alphaParams.loc[~self.alphaParams.name.str.contains('_bin_\d+-\d+')].name.unique().tolist()
+        return list(self._cached('alphaSystematics',
+            lambda: self.alphaParams.loc[~self.alphaParams.name.str.contains('_bin_\d+-\d+')].name.unique().tolist()))
 
     def GetAllSystematics(self):
         return self.GetShapeSystematics()+self.GetAlphaSystematics()
 
+    def _processAttrs(self):
+        def _attrs():
+            # First row of each process, with the config processes taking precedence
+            out = {}
+            for df in [self.alphaObjs, self.df]:
+                for row in df.drop_duplicates('process').to_dict('records'):
+                    out[row['process']] = row
+            return out
+        return self._cached('processAttrs', _attrs)
+
     def _getProcessAttrBase(self, procName, attrName):
-        if procName in self.df.process.unique():
-            df = self.df
-        elif procName in self.alphaObjs.process.unique():
-            df = self.alphaObjs
-        else:
+        attrs = self._processAttrs()
+        if procName not in attrs:
             raise NameError('Process "%s" does not exist.'%procName)
-        return get_process_attr(df, procName, attrName)
+        return attrs[procName][attrName]
 
     def GetProcessColor(self, procName):
         return self._getProcessAttrBase(procName,'color')
@@ -727,33 +1005,52 @@ class Ledger():
 
     @property
     def nsignals(self):
-        return self.df[self.df.process_type.eq('SIGNAL')].process.nunique() + self.alphaObjs[self.alphaObjs.process_type.eq('SIGNAL')].process.nunique()
+        return self._cached('nsignals', lambda: len(_unique_processes(self.df,'SIGNAL')) + len(_unique_processes(self.alphaObjs,'SIGNAL')))
 
     @property
     def nbkgs(self):
-        return self.df[self.df.process_type.eq('BKG')].process.nunique() + self.alphaObjs[self.alphaObjs.process_type.eq('BKG')].process.nunique()
+        return self._cached('nbkgs', lambda: len(_unique_processes(self.df,'BKG')) + len(_unique_processes(self.alphaObjs,'BKG')))
 
     def _checkAgainstConfig(self, process, region):
-        if (process,region) in self.GetProcRegPairs():
+        if (process,region) in self._procRegSet():
             raise RuntimeError('Attempting to track an object for process-region pair (%s,%s) that already exists among those defined in the config:\n\t%s'%(process,region,self.GetProcesses()))
         if region not in self.GetRegions():
             raise RuntimeError('Attempting to track an object for region "%s" but that region does not exist among those defined in the config:\n\t%s'%(region,self.GetRegions()))
 
     def _getCombineIdxMap(self):
-        all_signals = self.df[self.df.process_type.eq('SIGNAL')].process.unique().tolist() + self.alphaObjs[self.alphaObjs.process_type.eq('SIGNAL')].process.unique().tolist()
-        all_bkgs    = self.df[self.df.process_type.eq('BKG')].process.unique().tolist()    + self.alphaObjs[self.alphaObjs.process_type.eq('BKG')].process.unique().tolist()
+        def _idx_map():
+            all_signals = _unique_processes(self.df,'SIGNAL') + _unique_processes(self.alphaObjs,'SIGNAL')
+            all_bkgs    = _unique_processes(self.df,'BKG')    + _unique_processes(self.alphaObjs,'BKG')
 
-        signal_map = pandas.DataFrame({'process': all_signals, 'combine_idx': [-1*i for i in range(0,len(all_signals))] })
-        bkg_map    = pandas.DataFrame({'process': all_bkgs,    'combine_idx': [i for i in range(1,len(all_bkgs)+1)] })
+            signal_map = pandas.DataFrame({'process': all_signals, 'combine_idx': [-1*i for i in range(0,len(all_signals))] })
+            bkg_map    = pandas.DataFrame({'process': all_bkgs,    'combine_idx': [i for i in range(1,len(all_bkgs)+1)] })
 
-        out = pandas.concat([signal_map, bkg_map])
-        return out
+            return pandas.concat([signal_map, bkg_map])
+        return self._cached('combineIdxMap', _idx_map).copy()
 
     def _saveAlphas(self,outDir=''):
         self.alphaObjs.to_csv(outDir+'/ledger_alphaObjs.csv')
         self.alphaParams.to_csv(outDir+'/ledger_alphaParams.csv')
 
-    def Save(self, outDir):
+    def Save(self, outDir, export=False):
+        '''Save the three tables to <outDir>/ledger.npz (read back by `LoadLedger()`).
+        The columns are stored with explicit types and the string columns (process, region,
+        systematic names, etc) as integer codes into their unique values.
+
+        Args:
+            outDir (str): Directory to save to.
+            export (bool, optional): Also write the human-readable csv (and markdown if py3)
+                tables. Defaults to False.
+
+        Returns:
+            None
+        '''
+        _saveTables(outDir+'/ledger.npz', OrderedDict([('df',self.df), ('alphaObjs',self.alphaObjs), ('alphaParams',self.alphaParams)]))
+        if export:
+            self.Export(outDir)
+
+    def Export(self, outDir):
+        '''Write the tables as csv (and the histogram table as markdown if py3) to `outDir`.'''
         if 'index' in self.df.columns:
                df = self.df.reset_index(drop=True).drop('index',axis=1)
         else:  df = self.df
@@ -764,12 +1061,96 @@ class Ledger():
 
         self._saveAlphas(outDir)
 
+class _MutationIndexer():
+    '''Wrap a pandas indexer (`.loc`, `.iloc`, `.at`, `.iat`) to call `onMutate` after each assignment.'''
+    def __init__(self, indexer, onMutate):
+        self._indexer = indexer
+        self._onMutate = onMutate
+
+    def __getattr__(self, name): # pandas uses the indexers internally (ex. `.loc` assigns through `.iloc`)
+        return getattr(self._indexer, name)
+
+    def __call__(self, *args, **kwargs):
+        return _MutationIndexer(self._indexer(*args, **kwargs), self._onMutate)
+
+    def __getitem__(self, key):
+        return self._indexer[key]
+
+    def __setitem__(self, key, value):
+        self._indexer[key] = value
+        self._onMutate()
+
+class _LedgerFrame(pandas.DataFrame):
+    '''DataFrame held by a `Ledger`. Calls `onMutate` (`Ledger.Invalidate`) after every
+    assignment through `[]`, `.loc`, `.iloc`, `.at` or `.iat`. Anything derived from it
+    (selections, copies, etc) is a plain pandas.DataFrame.'''
+    _metadata = ['_onMutate']
+
+    def __init__(self, data=None, onMutate=None, **kwargs):
+        super().__init__(data, **kwargs)
+        self._onMutate = onMutate if onMutate is not None else (lambda: None)
+
+    @property
+    def _constructor(self):
+        return pandas.DataFrame
+
+    @property
+    def loc(self):
+        return _MutationIndexer(super().loc, self._onMutate)
+
+    @property
+    def iloc(self):
+        return _MutationIndexer(super().iloc, self._onMutate)
+
+    @property
+    def at(self):
+        return _MutationIndexer(super().at, self._onMutate)
+
+    @property
+    def iat(self):
+        return _MutationIndexer(super().iat, self._onMutate)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._onMutate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._onMutate()
+
+def _row_mask(df, func):
+    '''Evaluate `func` on each row (pandas.Series) of `df`.'''
+    if len(df) == 0:
+        return numpy.zeros(0, dtype=bool)
+    return df.apply(func, axis=1).to_numpy(dtype=bool)
+
+def _unique_processes(df, ptype=''):
+    '''Unique processes of `df` (in order of appearance), optionally only those of type `ptype`.'''
+    if ptype == '': return df.process.unique().tolist()
+    else:           return df[df.process_type.eq(ptype)].process.unique().tolist()
+
 def LoadLedger(indir='', verbose=False):
-    if verbose: print('\nInside LoadLedger looking at %sledger.csv' % indir)
-    df = pandas.read_csv(indir+'ledger_df.csv', index_col=0)
-    ledger = Ledger(df)
-    ledger.alphaObjs = pandas.read_csv(indir+'ledger_alphaObjs.csv', index_col=0)
-    ledger.alphaParams = pandas.read_csv(indir+'ledger_alphaParams.csv', index_col=0)
+    '''Load the Ledger saved in `indir` (ledger.npz or, for older projects, the csv tables).
+
+    Args:
+        indir (str, optional): Directory (with trailing slash) to load from. Defaults to ''.
+        verbose (bool, optional): Defaults to False.
+
+    Returns:
+        Ledger: Loaded Ledger.
+    '''
+    if os.path.exists(indir+'ledger.npz'):
+        if verbose: print('\nInside LoadLedger looking at %sledger.npz' % indir)
+        tables = _loadTables(indir+'ledger.npz')
+        ledger = Ledger(tables['df'])
+        ledger.alphaObjs = tables['alphaObjs']
+        ledger.alphaParams = tables['alphaParams']
+    else:
+        if verbose: print('\nInside LoadLedger looking at %sledger_df.csv' % indir)
+        df = pandas.read_csv(indir+'ledger_df.csv', index_col=0)
+        ledger = Ledger(df)
+        ledger.alphaObjs = pandas.read_csv(indir+'ledger_alphaObjs.csv', index_col=0)
+        ledger.alphaParams = pandas.read_csv(indir+'ledger_alphaParams.csv', index_col=0)
     if verbose: print('alphaObjs:')
     if verbose: print(ledger.alphaObjs)
     if verbose: print('alphaParams:')
@@ -777,6 +1158,103 @@ def LoadLedger(indir='', verbose=False):
 
     return ledger
 
+def _isnull(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+def _columnKind(values):
+    '''Storage kind of an object column from its values (see `_encodeColumn()`).'''
+    nonnull = [v for v in values if not _isnull(v)]
+    if all(isinstance(v, str) for v in nonnull):
+        return 'category'
+    if all(isinstance(v, numbers.Number) and not isinstance(v, (bool,numpy.bool_)) for v in nonnull):
+        return 'numeric'
+    if all(isinstance(v, (str,numbers.Number)) and not isinstance(v, (bool,numpy.bool_)) for v in nonnull):
+        return 'mixed'
+    return 'other'
+
+def _encodeColumn(series):
+    '''Encode a column as (kind, dict of arrays). Numeric columns are stored as is. Other
+    columns are stored as codes (-1 for null) into their unique strings:
+        - "category": only strings (and nulls).
+        - "mixed": strings and numbers. The numbers are stored as float in "values" (with
+          the "integral" ones flagged).
+        - "other": any other object, stored as its string (as in the csv).
+    '''
+    if series.dtype.kind in 'biuf':
+        return 'array', {'values': series.to_numpy()}
+
+    values = series.tolist()
+    kind = _columnKind(values)
+    if kind == 'numeric':
+        if all(isinstance(v, numbers.Integral) for v in values):
+            return 'array', {'values': numpy.array(values, dtype='i8')}
+        return 'array', {'values': numpy.array([numpy.nan if _isnull(v) else v for v in values], dtype=float)}
+
+    as_str = [v if _isnull(v) or isinstance(v, str) or kind == 'mixed' else str(v) for v in values]
+    arrays = {}
+    if kind == 'mixed':
+        arrays['values'] = numpy.array([v if isinstance(v, numbers.Number) and not _isnull(v) else numpy.nan for v in values], dtype=float)
+        arrays['integral'] = numpy.array([isinstance(v, numbers.Integral) for v in values], dtype=bool)
+        as_str = [v if isinstance(v, str) else None for v in values]
+
+    codes, uniques = pandas.factorize(pandas.Series(as_str, dtype=object))
+    arrays['codes'] = codes.astype('i4')
+    # Unique strings packed in one utf-8 buffer (fixed width unicode arrays pad every string to the longest)
+    arrays['categories'] = numpy.frombuffer('\0'.join(str(u) for u in uniques).encode('utf-8'), dtype='u1')
+    return 'mixed' if kind == 'mixed' else 'category', arrays
+
+def _decodeColumn(kind, arrays):
+    if kind == 'array':
+        return arrays['values']
+
+    codes = arrays['codes']
+    if kind == 'mixed':
+        out = arrays['values'].astype(object)
+        out[arrays['integral']] = arrays['values'][arrays['integral']].astype('i8').astype(object)
+    else:
+        out = numpy.full(len(codes), numpy.nan, dtype=object)
+    found = codes >= 0
+    categories = numpy.array(arrays['categories'].tobytes().decode('utf-8').split('\0'), dtype=object)
+    out[found] = categories[codes[found]]
+    return out
+
+def _saveTables(filename, tables):
+    '''Save a dictionary of DataFrames to a single npz file (no pickling).'''
+    meta, arrays = {}, {}
+    for name, table in tables.items():
+        meta[name] = {'columns': [str(c) for c in table.columns], 'kinds': []}
+        for i, col in enumerate(table.columns):
+            kind, col_arrays = _encodeColumn(table[col])
+            meta[name]['kinds'].append(kind)
+            for k, arr in col_arrays.items():
+                arrays['%s:%s:%s'%(name,i,k)] = arr
+
+        index = table.index.to_series()
+        meta[name]['index'], index_arrays = _encodeColumn(index)
+        meta[name]['index_name'] = table.index.name
+        for k, arr in index_arrays.items():
+            arrays['%s:index:%s'%(name,k)] = arr
+
+    numpy.savez(filename, _meta=numpy.array(json.dumps(meta)), **arrays)
+
+def _loadTables(filename):
+    '''Load the dictionary of DataFrames saved by `_saveTables()`.'''
+    tables = OrderedDict()
+    with numpy.load(filename, allow_pickle=False) as f:
+        meta = json.loads(str(f['_meta']))
+        for name, table_meta in meta.items():
+            def _arrays(key):
+                prefix = '%s:%s:'%(name,key)
+                return {k[len(prefix):]: f[k] for k in f.files if k.startswith(prefix)}
+
+            index = pandas.Index(_decodeColumn(table_meta['index'], _arrays('index')), name=table_meta['index_name'])
+            if table_meta['index'] != 'array':
+                index = index.infer_objects()
+            tables[name] = pandas.DataFrame(OrderedDict(
+                (col, _decodeColumn(kind, _arrays(i))) for i, (col, kind) in enumerate(zip(table_meta['columns'], table_meta['kinds']))
+            ), index=index, columns=table_meta['columns'])
+    return tables
+
 def _runDirSetup(runDir):
     dirs_to_make = [
         runDir+'/',
@@ -791,118 +1269,175 @@ def _runDirSetup(runDir):
     
     return runDir
 
-def MakeCard(ledger, subtag, workspaceDir):
-    combine_idx_map = ledger._getCombineIdxMap()
+def MakeCard(ledger, subtag, workspaceDir, exportLedger=False):
+    '''Write the Combine card for the model in `ledger` to <subtag>/card.txt and
+    save the ledger in <subtag>/.
 
-    card_new = open('%s/card.txt'%subtag,'w')
-    # imax (bins), jmax (backgrounds+signals), kmax (systematics) 
-    imax = 3*len(ledger.GetRegions()) # pass, fail for each 'X' axis category    
+    The rate, process index and systematic blocks are built from a single pass over
+    the ledger tables (pivoted to process-region pair by systematic) and the card is
+    written at once.
+
+    Args:
+        ledger (Ledger): Model to write.
+        subtag (str): Directory to write the card (and ledger) to.
+        workspaceDir (str): Directory (relative to subtag) containing base.root.
+        exportLedger (bool, optional): Also save the ledger as csv/markdown (see `Ledger.Save()`). Defaults to False.
+
+    Returns:
+        None
+    '''
+    _writeCard(ledger, _cardRows(ledger.df), subtag, workspaceDir, exportLedger)
+
+def MakeCards(ledger, selections, workspaceDir, exportLedger=False):
+    '''Write the Combine cards (and save the ledgers) of several subsets of `ledger`.
+    The card entries of the ledger rows are computed once and shared by all of the subsets
+    so that only the selection itself is evaluated per subtag.
+
+    Each selection can be
+        - a function or a tuple of (function, *args) as passed to `Ledger.select()`,
+        - a dict of column criteria as passed to `Ledger.selectWhere()` (fastest),
+        - a Ledger (ex. an existing subset), written as is.
+
+    Args:
+        ledger (Ledger): Model to select the subsets from.
+        selections (list(tuple)): List of (subtag, selection) pairs. The subtag directories must exist.
+        workspaceDir (str): Directory (relative to the subtags) containing base.root.
+        exportLedger (bool, optional): Also save the ledgers as csv/markdown (see `Ledger.Save()`). Defaults to False.
+
+    Returns:
+        OrderedDict(str,Ledger): The subset Ledger of each subtag.
+    '''
+    rows = None
+    subledgers = OrderedDict()
+    for subtag, selection in selections:
+        if isinstance(selection, Ledger):
+            MakeCard(selection, subtag, workspaceDir, exportLedger)
+            subledgers[subtag] = selection
+            continue
+
+        if isinstance(selection, dict):
+            df_mask, alpha_mask = ledger._whereMasks(selection)
+        elif callable(selection):
+            df_mask, alpha_mask = ledger._selectMasks(selection, ())
+        else:
+            df_mask, alpha_mask = ledger._selectMasks(selection[0], tuple(selection[1:]))
+
+        if rows is None:
+            rows = _cardRows(ledger.df)
+        subledger = ledger.selectMask(df_mask, alpha_mask)
+        _writeCard(subledger, [rows[i] for i in numpy.flatnonzero(df_mask)], subtag, workspaceDir, exportLedger)
+        subledgers[subtag] = subledger
+
+    return subledgers
+
+def _cardRows(df):
+    '''Card entry of each row of `df` as a tuple of ((process, region), systematic, systematic type, effect).
+    Computed once per ledger and shared by the cards of all of its subsets (see `TwoDAlphabet.MakeCards()`).'''
+    return [
+        ((proc,region), syst, syst_type, row[syst_type] if isinstance(syst_type, str) and syst_type in row else None)
+        for proc, region, syst, syst_type, row in zip(df.process, df.region, df.variation, df.syst_type, df.to_dict('records'))
+    ]
+
+def _writeCard(ledger, rows, subtag, workspaceDir, exportLedger=False):
+    '''Write the card of `ledger` from the entries (`_cardRows()`) of the rows of `ledger.df`.'''
+    cats = ['LOW','SIG','HIGH']
+    combine_idx = {}
+    for proc, idx in zip(*[ledger._getCombineIdxMap()[c].tolist() for c in ['process','combine_idx']]):
+        combine_idx.setdefault(proc, idx)
+
+    # Pivot the rows to (process, region) -> {systematic: effect}
+    # keeping the first row of each group as in a groupby
+    syst_types = {}
+    effects = OrderedDict()
+    for pair, syst, syst_type, value in rows:
+        if syst != 'nominal' and syst not in syst_types:
+            syst_types[syst] = syst_type
+        effects.setdefault(pair, OrderedDict()).setdefault(syst, []).append(value)
+    systs = sorted(syst_types.keys())
+    template_pairs = sorted(effects.keys())
+    alpha_pairs = sorted(set(zip(ledger.alphaObjs.process, ledger.alphaObjs.region)))
+    alpha_procs = ledger._alphaProcesses()
+
+    regions = ledger.GetRegions()
+    imax = 3*len(regions) # pass, fail for each 'X' axis category
     jmax = ledger.nbkgs + ledger.nsignals -1
     kmax = len(ledger.GetShapeSystematics()) # does not include alphaParams
-    channels = ['_'.join(r) for r in itertools.product(ledger.GetRegions(),['LOW','SIG','HIGH'])]
-    
-    card_new.write('imax %s\n'%imax)      
-    card_new.write('jmax %s\n'%jmax)
-    card_new.write('kmax %s\n'%kmax)
-    card_new.write('-'*120+'\n')
+    channels = ['_'.join(r) for r in itertools.product(regions,cats)]
+
+    lines = [
+        'imax %s\n'%imax,
+        'jmax %s\n'%jmax,
+        'kmax %s\n'%kmax,
+        '-'*120+'\n'
+    ]
 
     # Shapes
-    shape_line = 'shapes  {p:20} {r} {file} w:{p}_{r} w:{p}_{r}_$SYSTEMATIC\n'
-    alpha_obj_title_map = {}
-    for proc,reg in ledger.GetProcRegPairs():
-        for cat in ['LOW','SIG','HIGH']:
-            if proc in ledger.alphaObjs.process.unique():
-                this_line = shape_line.replace(' w:{p}_{r}_$SYSTEMATIC','').replace('w:{p}','w:{hname_proc}')
-                title = ledger.alphaObjs[ledger.alphaObjs.process.eq(proc) & ledger.alphaObjs.region.eq(reg)].title.iloc[0]
-                alpha_obj_title_map[(proc,reg)] = proc
-                card_new.write(this_line.format(p=proc, r=reg+'_'+cat, file=workspaceDir+'base.root', hname_proc=proc))
+    base_file = workspaceDir+'base.root'
+    for proc,reg in template_pairs+alpha_pairs:
+        for cat in cats:
+            r = reg+'_'+cat
+            if proc in alpha_procs:
+                lines.append('shapes  {p:20} {r} {file} w:{p}_{r}\n'.format(p=proc, r=r, file=base_file))
             elif proc == 'data_obs':
-                this_line = shape_line.replace(' w:{p}_{r}_$SYSTEMATIC','')
-                card_new.write(this_line.format(p=proc, r=reg+'_'+cat, file=workspaceDir+'base.root'))
+                lines.append('shapes  {p:20} {r} {file} w:{p}_{r}\n'.format(p=proc, r=r, file=base_file))
             else:
-                this_line = shape_line
-                card_new.write(this_line.format(p=proc, r=reg+'_'+cat, file=workspaceDir+'base.root'))
+                lines.append('shapes  {p:20} {r} {file} w:{p}_{r} w:{p}_{r}_$SYSTEMATIC\n'.format(p=proc, r=r, file=base_file))
 
-    card_new.write('-'*120+'\n')
+    lines.append('-'*120+'\n')
 
     # Set bin observation values to -1
-    card_new.write('bin                 %s\n'%(unpack_to_line(channels)))
-    card_new.write('observation %s\n'%unpack_to_line([-1 for i in range(imax)]))
+    lines.append('bin                 %s\n'%(unpack_to_line(channels)))
+    lines.append('observation %s\n'%unpack_to_line([-1 for i in range(imax)]))
 
-    card_new.write('-'*120+'\n')
+    lines.append('-'*120+'\n')
 
     ######################################################
     # Tie processes to bins and rates and simultaneously #
     # create the systematic uncertainty rows             #
     ######################################################
-    bin_line         = '{0:20} {1:20}'.format('bin','')
-    processName_line = '{0:20} {1:20}'.format('process','')
-    processCode_line = '{0:20} {1:20}'.format('process','')
-    rate_line        = '{0:20} {1:20}'.format('rate','')
-    syst_lines = OrderedDict()
-
-    # Fill syst_lines with keys to initialized strings
-    for syst,syst_group in ledger.df.groupby(by='variation',sort=True):
-        if syst == 'nominal': continue
-        syst_type = syst_group.iloc[0].syst_type
-        syst_lines[syst] = '{0:20} {1:20} '.format(syst, syst_type)
-
-    # Work with template bkgs first
-    for pair, group in ledger.df.groupby(['process','region']):
-        proc, region = pair
-        if proc == 'data_obs': continue
-        combine_idx = combine_idx_map[combine_idx_map.process.eq(proc)].combine_idx.iloc[0]
-
-        for cat in ['LOW','SIG','HIGH']:
-            chan = '%s_%s'%(region,cat)
-
-            bin_line += '{0:20} '.format(chan)
-            processName_line += '{0:20} '.format(proc)
-            processCode_line += '{0:20} '.format(combine_idx)
-            rate_line += '{0:20} '.format('-1')
-
-            for syst in syst_lines.keys():
-                if syst in group.variation.unique():
-                    syst_effect = group.loc[group.variation.eq(syst)].apply(lambda row: row[row.syst_type],axis=1).iloc[0]
-                else:
-                    syst_effect = '-'
-
-                syst_lines[syst] += '{0:20} '.format(syst_effect)
-
-    # Now work with alpha objects
-    # NOTE: duplicated code but no good way to combine without making things confusing
-    for pair,group in ledger.alphaObjs.groupby(['process', 'region']):
-        proc,region = pair
-        combine_idx = combine_idx_map[combine_idx_map.process.eq(alpha_obj_title_map[pair])].combine_idx.iloc[0]
-        
-        for cat in ['LOW','SIG','HIGH']:
-            chan = '%s_%s'%(region, cat)
-
-            bin_line += '{0:20} '.format(chan)
-            processName_line += '{0:20} '.format(alpha_obj_title_map[pair])
-            processCode_line += '{0:20} '.format(combine_idx)
-            rate_line += '{0:20} '.format('1')
+    bin_cells, processName_cells, processCode_cells, rate_cells = [], [], [], []
+    syst_cells = {syst: [] for syst in systs}
 
-            for syst in syst_lines.keys():
-                syst_lines[syst] += '{0:20} '.format('-')
-
-    card_new.write(bin_line+'\n')
-    card_new.write(processName_line+'\n')
-    card_new.write(processCode_line+'\n')
-    card_new.write(rate_line+'\n')
-    card_new.write('-'*120+'\n')
-    for line_key in syst_lines.keys():
-        card_new.write(syst_lines[line_key]+'\n')
+    # Work with template bkgs first, then the alpha objects
+    columns = [(pair, '-1') for pair in template_pairs if pair[0] != 'data_obs'] + [(pair, '1') for pair in alpha_pairs]
+    for pair, rate in columns:
+        proc, region = pair
+        pair_effects = effects.get(pair, {}) if rate == '-1' else {}
+        for syst in systs:
+            cell = '{0:20} '.format(_card_effect(pair_effects[syst]) if syst in pair_effects else '-')
+            syst_cells[syst].append(cell*3)
+        bin_cells.extend('{0:20} '.format('%s_%s'%(region,cat)) for cat in cats)
+        processName_cells.append('{0:20} '.format(proc)*3)
+        processCode_cells.append('{0:20} '.format(combine_idx[proc])*3)
+        rate_cells.append('{0:20} '.format(rate)*3)
+
+    lines.append('{0:20} {1:20}'.format('bin','')+''.join(bin_cells)+'\n')
+    lines.append('{0:20} {1:20}'.format('process','')+''.join(processName_cells)+'\n')
+    lines.append('{0:20} {1:20}'.format('process','')+''.join(processCode_cells)+'\n')
+    lines.append('{0:20} {1:20}'.format('rate','')+''.join(rate_cells)+'\n')
+    lines.append('-'*120+'\n')
+    for syst in systs:
+        lines.append('{0:20} {1:20} '.format(syst, syst_types[syst])+''.join(syst_cells[syst])+'\n')
 
     ######################################################
     # Mark floating values as flatParams                 #
     # We float just the rpf params and the failing bins. #
     ######################################################
-    for param in ledger.alphaParams.itertuples():
-        card_new.write('{0:40} {1}\n'.format(param.name, param.constraint))
-    
-    card_new.close()
-    ledger.Save(subtag)
+    for name, constraint in zip(ledger.alphaParams.name, ledger.alphaParams.constraint):
+        lines.append('{0:40} {1}\n'.format(name, constraint))
+
+    with open('%s/card.txt'%subtag,'w') as card_new:
+        card_new.write(''.join(lines))
+    ledger.Save(subtag, export=exportLedger)
+
+def _card_effect(values):
+    '''Effect of a systematic on a process-region pair from the values of its rows (ex. Up and Down),
+    with the type pandas would infer for the column of values (ie. ints are upcast to float if any value is a float).'''
+    first = values[0]
+    numeric = all(v is None or (isinstance(v, numbers.Number) and not isinstance(v, bool)) for v in values)
+    if numeric and any(v is None or isinstance(v, float) for v in values) and len(values) > 1:
+        return float('nan') if first is None else float(first)
+    return first
 
 def _runMLfit(cardOrW, blinding, verbosity, rMin, rMax, setParams, usePreviousFit=False, defMinStrat=0, extra=''):
     '''
@@ -938,6 +1473,49 @@ def _runMLfit(cardOrW, blinding, verbosity, rMin, rMax, setParams, usePreviousFi
 
     execute_cmd(fit_cmd, out='FitDiagnostics.log')
 
+def _splitToys(ntoys, nshards):
+    '''Split `ntoys` into at most `nshards` non-empty groups whose sizes differ by at most one.'''
+    nshards = max(1, min(nshards, ntoys))
+    return [ntoys//nshards + (1 if i < ntoys%nshards else 0) for i in range(nshards)]
+
+def _runToyShards(name, toyCmd, nameOpt, ntoys, seed, nWorkers, outputs):
+    '''Run the toys of `toyCmd` locally, split across `nWorkers` combine processes, and
+    merge the output of the shards with hadd.
+
+    Shard `i` runs `toyCmd` with its share of the toys, the seed `seed+i` (so the shards never
+    overlap and reruns are reproducible) and `nameOpt` suffixed by `_shard<i>`.
+
+    Args:
+        name (str): Name of the group of jobs (for the logs).
+        toyCmd (str): Combine command with `{ntoys}` and `{seed}` placeholders.
+        nameOpt (str): The `-n` option in `toyCmd` (may contain `{seed}`).
+        ntoys (int): Total number of toys.
+        seed (int): Base seed.
+        nWorkers (int): Number of shards/processes.
+        outputs (list(tuple(str,str))): Pairs of merged file name and shard file name
+            template (formatted with `shard` and `seed`).
+
+    Raises:
+        RuntimeError: If any shard failed (the merged output would be missing toys).
+
+    Returns:
+        None
+    '''
+    shard_toys = _splitToys(ntoys, nWorkers)
+    shard_cmds = [
+        toyCmd.replace(nameOpt, nameOpt.format(seed=seed)+'_shard%s'%i).format(ntoys=n, seed=seed+i)
+        for i,n in enumerate(shard_toys)
+    ]
+    runner = LocalRunner(name, shard_cmds, nWorkers=nWorkers)
+    runner.submit()
+    if len(runner.failed) > 0:
+        raise RuntimeError('Toy shards %s failed. See the logs in %s.'%(runner.failed, runner.log_dir))
+
+    for merged, shard_template in outputs:
+        shard_files = [shard_template.format(shard=i, seed=seed+i) for i in range(len(shard_toys))]
+        execute_cmd('hadd -f %s %s'%(merged, ' '.join(shard_files)))
+        execute_cmd('rm %s'%' '.join(shard_files))
+
 def _runLimit(blindData, verbosity, setParams, card_or_w='card.txt', condor=False):
     # card_or_w could be `morphedWorkspace.root --snapshotName morphedModel`
     param_options = ''
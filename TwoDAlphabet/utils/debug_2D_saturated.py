@@ -1,8 +1,9 @@
 '''Script to use 2D Alphabet output to calculate the pull and saturated test statistic
 per-bin over the full 2D space.'''
 
-import sys,os,ROOT,math,array
+import sys,os,ROOT,math,array,numpy
 import header
+from TwoDAlphabet.helpers import hist_to_array, set_hist_from_array
 
 def stitchHists(name,thisHistList,blinded=[]):
     # Required that thisHistList be in order of desired stitching
@@ -24,20 +25,16 @@ def stitchHists(name,thisHistList,blinded=[]):
     aybins = array.array('d',ybins)
     stitched_hist = ROOT.TH2F(name,name,len(xbins)-1,axbins,len(ybins)-1,aybins)
 
-    bin_jump = 0
+    # Arrays indexed [ybin][xbin], blinded regions are left empty
+    contents, sumw2s = [], []
     for i,h in enumerate(thisHistList):
+        content, sumw2 = hist_to_array(h, flow=False)
         if i in blinded:
-            bin_jump += thisHistList[i].GetNbinsX()
-            continue
-        
-        for ybin in range(1,h.GetNbinsY()+1):
-            for xbin in range(1,h.GetNbinsX()+1):
-                stitched_xindex = xbin + bin_jump
+            content, sumw2 = numpy.zeros_like(content), numpy.zeros_like(sumw2)
+        contents.append(content)
+        sumw2s.append(sumw2)
 
-                stitched_hist.SetBinContent(stitched_xindex,ybin,h.GetBinContent(xbin,ybin))
-                stitched_hist.SetBinError(stitched_xindex,ybin,h.GetBinError(xbin,ybin))
-
-        bin_jump += thisHistList[i].GetNbinsX()
+    set_hist_from_array(stitched_hist, numpy.hstack(contents), numpy.hstack(sumw2s))
 
     return stitched_hist
 
@@ -46,17 +43,13 @@ def getSaturated(h_data,h_bkg):
     h_saturated.Reset()
     h_saturated.SetName(h_saturated.GetName().replace('_data','_saturated'))
     
-    for ix in range(1,h_saturated.GetNbinsX()+1):
-        for iy in range(1,h_saturated.GetNbinsY()+1):
-            f = h_bkg.GetBinContent(ix,iy)
-            d = h_data.GetBinContent(ix,iy)
-
-            if f > 0 and d > 0 :
-                s = f - d + d * math.log(d/f)
-            else:
-                s = 0
+    f = hist_to_array(h_bkg, flow=False)[0]
+    d = hist_to_array(h_data, flow=False)[0]
+    filled = (f > 0) & (d > 0)
+    s = numpy.zeros_like(d)
+    s[filled] = f[filled] - d[filled] + d[filled] * numpy.log(d[filled]/f[filled])
 
-            h_saturated.SetBinContent(ix,iy,s)
+    set_hist_from_array(h_saturated, s)
 
     name_parts = h_saturated.GetName().split('_')
     new_title = '%s %s %s'%(name_parts[0],name_parts[1],'saturated')
@@ -69,19 +62,13 @@ def getPull(h_data,h_bkg):
     h_pull.Reset()
     h_pull.SetName(h_pull.GetName().replace('_data','_pull'))
     
-    for ix in range(1,h_pull.GetNbinsX()+1):
-        for iy in range(1,h_pull.GetNbinsY()+1):
-            f = h_bkg.GetBinContent(ix,iy)
-            d = h_data.GetBinContent(ix,iy)
-            ferr = h_bkg.GetBinError(ix,iy)
-            derr = h_data.GetBinError(ix,iy)
-
-            if ferr > 0 or derr > 0:
-                p = (d-f)/math.sqrt(ferr**2+derr**2)
-            else:
-                p = 0
-            
-            h_pull.SetBinContent(ix,iy,p)
+    f, ferr2 = hist_to_array(h_bkg, flow=False)
+    d, derr2 = hist_to_array(h_data, flow=False)
+    err2 = ferr2 + derr2
+    p = numpy.zeros_like(d)
+    p[err2 > 0] = (d-f)[err2 > 0]/numpy.sqrt(err2[err2 > 0])
+
+    set_hist_from_array(h_pull, p)
 
     name_parts = h_pull.GetName().split('_')
     new_title = '%s %s %s'%(name_parts[0],name_parts[1],'pull')
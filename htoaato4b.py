@@ -329,6 +329,8 @@ def test_make(SRorCR):
         # We only want to include one of these at the time of fitting but we want to construct
         # them all right now so we can pick and choose later.
         rpf_options = _get_rpf_options()
+        # The pass objects of all TF options are registered together after the loop.
+        pass_objs = []
         for opt_name in rpf_options.keys():
             # We have two regions determined by a TF, "pass" and "fail" with the "pass"
             # being a parametric scaling of the "fail". The functional form and the
@@ -350,7 +352,8 @@ def test_make(SRorCR):
             qcd_rpf = ParametricFunction(
                        (fail_name.replace('Fail','rpfL')).replace('fail','rpfL')+'_'+opt_name,
                        binning_f, opt_fit['form'],
-                       constraints=opt_fit['constraints'], forcePositive=True
+                       constraints=opt_fit['constraints'], forcePositive=True,
+                       sharedFormula=True
                    )
             
             # Of course, what we actually need is these TFs multiplied by something else:
@@ -364,7 +367,9 @@ def test_make(SRorCR):
             # Note that we have unique process names so they are identifiable
             # but we give them different titles so that they look pretty in
             # the final plot legends. First two args are just strings (process and region).
-            twoD.AddAlphaObj('Background_'+opt_name, ps, qcd_p, title='Background')
+            pass_objs.append({'process': 'Background_'+opt_name, 'region': ps, 'obj': qcd_p, 'title': 'Background'})
+
+        twoD.AddAlphaObjs(pass_objs)
 
     # Save() will save the RooWorkspace and the ledgers and other associated pieces
     # so the twoD object can be reconstructed later. If this line doesn't run or
@@ -455,15 +460,18 @@ def test_limit(SRorCR):
     if VERBOSE: print ('Possible signals: %s' % twoD.iterWorkspaceObjs['SIGNAME'])
 
     ## for signame in twoD.iterWorkspaceObjs['SIGNAME']:
+    # Make the subsets and cards of all mass points at once (as in test_fit() for each).
+    # The parts shared by the cards are only computed once.
+    twoD.MakeCards([
+        ('mA_%s_area' % massA, (_select_signal, 'Htoaato4b_mA_%s_%s' % (massA, YEAR), FIT)) for massA in MASSESA
+    ])
+
     areaname = None
     for massA in MASSESA:
         signame = 'Htoaato4b_mA_%s_%s' % (massA, YEAR)
         areaname = 'mA_%s_area' % massA
         print ('Performing limit for %s in %s' % (signame, areaname))
 
-        # Make a subset and card as in test_fit()
-        subset = twoD.ledger.select(_select_signal, signame, FIT)
-        twoD.MakeCard(subset, areaname)
         # Run the blinded limit with our dictionary of TF parameters
         twoD.Limit(
             subtag=areaname,
@@ -174,8 +174,8 @@ def _select_signal(row, args):
 def _load_rpf(poly_order):
     if UseMCToy:
         twoD_for_rpf = TwoDAlphabet('fits_%s_Htoaato4b_mH_%s_mA_%s_%s_%s' % (CAT, MASSH, MASSA, WP, YEAR),
-                                'mctoysjson/%s_Htoaato4b_mctoy%s.json' % (CATL, str(toys)), loadPrevious=True,
-                                findreplace={'path':PATH, 'SIGNAME':_sig_names(),
+                                'mctoysjson/%s_Htoaato4b_mctoy.json' % CATL, loadPrevious=True,
+                                findreplace={'path':PATH, 'SIGNAME':_sig_names(), 'TOYIDX':str(toys),
                                              'HIST':'$process_%s_%s_$region_Nom' % (MASSH, WP)})
     else:
         twoD_for_rpf = TwoDAlphabet('fits_%s_Htoaato4b_mH_%s_mA_%s_%s_%s' % (CAT, MASSH, MASSA, WP, YEAR),
@@ -288,8 +288,8 @@ def test_make(SRorCR):
     # 'SIGNAME' also gets used as the $process in _batch_replace
     if UseMCToy:
         twoD = TwoDAlphabet('fits_%s_Htoaato4b_mH_%s_mA_%s_%s_%s' % (CAT, MASSH, MASSA, WP, YEAR),
-                        'mctoysjson/%s_Htoaato4b_mctoy%s.json' % (CATL, str(toys)), loadPrevious=False, verbose=VERBOSE,
-                        findreplace={'path':PATH, 'SIGNAME':_sig_names(),
+                        'mctoysjson/%s_Htoaato4b_mctoy.json' % CATL, loadPrevious=False, verbose=VERBOSE,
+                        findreplace={'path':PATH, 'SIGNAME':_sig_names(), 'TOYIDX':str(toys),
                                      'HIST':'$process_%s_%s_$region_Nom' % (MASSH, WP)})
     else:
         twoD = TwoDAlphabet('fits_%s_Htoaato4b_mH_%s_mA_%s_%s_%s' % (CAT, MASSH, MASSA, WP, YEAR),
@@ -0,0 +1,77 @@
+'''Regression benchmark for OrganizedHists.BinningLookup. As in
+TwoDAlphabet._makeWorkspace, the binning of every template is looked up once
+and the total time is compared against the previous implementation (which
+concatenated and filtered the full histogram map on every call) for an
+increasing number of templates. The results are checked to be identical.
+
+The lookup time per template must stay flat as the number of templates grows.
+A RuntimeError is raised if it grows by more than `--max-growth` between the
+smallest and the largest map (ie. if the lookups become quadratic again).
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_binning_lookup [--max-growth 5]
+'''
+import argparse, os, shutil, tempfile, time
+import pandas
+import ROOT
+from TwoDAlphabet.config import OrganizedHists
+
+# (number of source files, templates per file)
+_sizes = [(10,50), (20,100), (40,200)]
+_nreference = 500 # the previous implementation is only timed on a subset of the lookups
+
+def make_hist_map(nfiles, nhists):
+    hist_map = {}
+    for f in range(nfiles):
+        names = ['proc%s_region%s_FULL_syst%s'%(f, h%4, h) for h in range(nhists)]
+        hist_map['file_%s.root'%f] = pandas.DataFrame({
+            'source_histname': names,
+            'out_histname': names,
+            'binning': ['binning%s'%(h%3) for h in range(nhists)]
+        })
+    return hist_map
+
+def reference_lookup(hist_map, histname):
+    all_hists = pandas.concat([v[['out_histname','binning']] for v in hist_map.values()])
+    return all_hists.loc[all_hists.out_histname.eq(histname)].iloc[0].binning
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-growth', type=float, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ROOT.TFile.Open(os.path.join(tmpdir,'organized_hists.root'),'RECREATE').Close()
+        print('%10s %12s %14s %14s %16s'%('templates','index [s]','lookups [s]','per lookup [us]','previous [us]'))
+        per_lookup = []
+        for nfiles, nhists in _sizes:
+            hist_map = make_hist_map(nfiles, nhists)
+            names = [n for df in hist_map.values() for n in df.out_histname]
+
+            start = time.perf_counter()
+            organized_hists = OrganizedHists(tmpdir+'/', {}, hist_map, readOnly=True)
+            t_index = time.perf_counter()-start
+
+            t_lookup = float('inf')
+            for _ in range(5):
+                start = time.perf_counter()
+                binnings = [organized_hists.BinningLookup(n) for n in names]
+                t_lookup = min(t_lookup, time.perf_counter()-start)
+
+            subset = names[::max(1,len(names)//_nreference)]
+            start = time.perf_counter()
+            reference = [reference_lookup(hist_map, n) for n in subset]
+            t_reference = time.perf_counter()-start
+
+            if reference != [organized_hists.BinningLookup(n) for n in subset]:
+                raise RuntimeError('Binning lookups differ from the previous implementation for %s templates'%len(names))
+            per_lookup.append(t_lookup/len(names))
+            print('%10s %12.4f %14.4f %14.2f %16.1f'%(len(names), t_index, t_lookup, 1e6*per_lookup[-1], 1e6*t_reference/len(subset)))
+
+        if per_lookup[-1] > args.max_growth*per_lookup[0]:
+            raise RuntimeError('Lookup time per template grew by %.1fx between %s and %s templates'%(
+                per_lookup[-1]/per_lookup[0], _sizes[0][0]*_sizes[0][1], _sizes[-1][0]*_sizes[-1][1]))
+        print('Lookups are identical and their cost per template does not grow with the number of templates')
+    finally:
+        shutil.rmtree(tmpdir)
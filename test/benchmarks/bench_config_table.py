@@ -0,0 +1,60 @@
+'''Benchmark the construction of Config.FullTable() with synthetic configs
+of increasing numbers of process/systematic combinations.
+
+Each synthetic config has one region, `nproc` background processes and
+`nsyst` shape systematics applied to every process so that the number of
+process/systematic combinations is nproc*(nsyst+1).
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_config_table [--repeat N]
+'''
+import argparse, json, os, shutil, tempfile, time
+from TwoDAlphabet.config import Config
+
+# (nproc, nsyst) giving roughly 10 to 10,000 process/systematic combinations
+_sizes = [(5,1), (20,4), (100,9), (500,19), (1000,9)]
+
+def make_config(nproc, nsyst):
+    systs = ['syst%s'%i for i in range(nsyst)]
+    processes = {
+        'data_obs': {'TYPE': 'DATA', 'SYSTEMATICS': [], 'LOC': 'path/data.root:data_$region'}
+    }
+    for i in range(nproc):
+        processes['bkg%s'%i] = {
+            'TYPE': 'BKG', 'COLOR': i%50, 'SYSTEMATICS': systs,
+            'LOC': 'path/FILE:HIST', 'SCALE': 1.0
+        }
+    return {
+        'GLOBAL': {'path': '/tmp', 'FILE': '$process.root', 'HIST': '$process_$region',
+                   'FILE_UP': '$process_$syst_up.root', 'FILE_DOWN': '$process_$syst_down.root'},
+        'REGIONS': {'SR': {'PROCESSES': ['bkg%s'%i for i in range(nproc)], 'BINNING': 'default'}},
+        'PROCESSES': processes,
+        'SYSTEMATICS': {s: {'UP': 'path/FILE_UP:HIST', 'DOWN': 'path/FILE_DOWN:HIST', 'SIGMA': 1.0} for s in systs},
+        'BINNING': {'default': {}},
+        'OPTIONS': {}
+    }
+
+def time_full_table(json_path, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        table = Config(json_path).FullTable()
+        best = min(best, time.perf_counter()-start)
+    return best, table.shape[0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print('%8s %8s %12s %10s %12s'%('nproc','nsyst','combinations','time [s]','us/row'))
+        for nproc, nsyst in _sizes:
+            json_path = os.path.join(tmpdir, 'config_%s_%s.json'%(nproc,nsyst))
+            with open(json_path,'w') as f:
+                json.dump(make_config(nproc,nsyst), f)
+            t, nrows = time_full_table(json_path, args.repeat)
+            print('%8s %8s %12s %10.3f %12.1f'%(nproc, nsyst, nproc*(nsyst+1), t, 1e6*t/nrows))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,80 @@
+'''Microbenchmark the numpy bridge in TwoDAlphabet.helpers against the per-bin
+PyROOT path (GetBinContent/SetBinContent and RooDataHist.get(i)/weight()) for
+reading and writing TH2F histograms of increasing size. The results of the two
+paths are checked to be identical.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_hist_bridge [--repeat N]
+'''
+import argparse, time
+import numpy
+import ROOT
+from TwoDAlphabet.helpers import hist_to_array, set_hist_from_array, rdh_to_array, make_RDH
+
+ROOT.TH1.AddDirectory(False)
+ROOT.RooMsgService.instance().setGlobalKillBelow(ROOT.RooFit.WARNING)
+
+_sizes = [(10,10), (40,40), (100,100), (300,300)]
+
+def read_perbin(h):
+    out = numpy.empty((h.GetNbinsY()+2, h.GetNbinsX()+2))
+    for y in range(h.GetNbinsY()+2):
+        for x in range(h.GetNbinsX()+2):
+            out[y,x] = h.GetBinContent(x,y)
+    return out
+
+def write_perbin(h, content):
+    for y in range(h.GetNbinsY()+2):
+        for x in range(h.GetNbinsX()+2):
+            h.SetBinContent(x,y,float(content[y,x]))
+
+def read_rdh_perbin(rdh):
+    out = numpy.empty(rdh.numEntries())
+    for i in range(rdh.numEntries()):
+        rdh.get(i)
+        out[i] = rdh.weight()
+    return out
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter()-start)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    numpy.random.seed(1234)
+    print('%10s %-10s %12s %12s %9s'%('bins','operation','per-bin [s]','numpy [s]','speedup'))
+    for nx, ny in _sizes:
+        h = ROOT.TH2F('bench_%sx%s'%(nx,ny),'',nx,0,nx,ny,0,ny)
+        content = numpy.random.poisson(100, size=(ny+2,nx+2)).astype('f8')
+        set_hist_from_array(h, content)
+        if not numpy.array_equal(read_perbin(h), hist_to_array(h)[0]):
+            raise RuntimeError('Read mismatch for %sx%s'%(nx,ny))
+
+        h_perbin, h_numpy = h.Clone('perbin'), h.Clone('numpy')
+        write_perbin(h_perbin, content[::-1])
+        set_hist_from_array(h_numpy, content[::-1])
+        if not numpy.array_equal(hist_to_array(h_perbin)[0], hist_to_array(h_numpy)[0]):
+            raise RuntimeError('Write mismatch for %sx%s'%(nx,ny))
+
+        x, y = ROOT.RooRealVar('x','x',0,nx), ROOT.RooRealVar('y','y',0,ny)
+        x.setBins(nx)
+        y.setBins(ny)
+        rdh = make_RDH(h, ROOT.RooArgList(x,y))
+        if not numpy.allclose(read_rdh_perbin(rdh).reshape(nx,ny).T, rdh_to_array(rdh)[0]):
+            raise RuntimeError('RooDataHist mismatch for %sx%s'%(nx,ny))
+
+        timings = [
+            ('read', best_of(lambda: read_perbin(h), args.repeat), best_of(lambda: hist_to_array(h), args.repeat)),
+            ('write', best_of(lambda: write_perbin(h_perbin, content), args.repeat), best_of(lambda: set_hist_from_array(h_numpy, content), args.repeat)),
+            ('read RDH', best_of(lambda: read_rdh_perbin(rdh), args.repeat), best_of(lambda: rdh_to_array(rdh), args.repeat)),
+        ]
+        for operation, t_perbin, t_numpy in timings:
+            print('%10s %-10s %12.4f %12.4f %8.1fx'%('%sx%s'%(nx,ny), operation, t_perbin, t_numpy, t_perbin/t_numpy if t_numpy > 0 else float('inf')))
+    print('Per-bin and numpy paths give identical results')
@@ -0,0 +1,54 @@
+'''Benchmark the start-up time of TwoDAlphabet. Each snippet is run in a fresh
+interpreter (`python -c ...`) and the wall time of the whole process is reported,
+together with whether ROOT ended up being imported. Only the snippets that use
+a ROOT-backed function should load ROOT.
+
+The ledger workflow reads test/twoDtest.json.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_import [--repeat N]
+'''
+import argparse, subprocess, sys, time
+
+_check = '\nimport sys; print("ROOT" in sys.modules)'
+_ledger_workflow = '''
+import tempfile
+from TwoDAlphabet.config import Config
+from TwoDAlphabet.twoDalphabet import Ledger, LoadLedger, MakeCard
+ledger = Ledger(Config("test/twoDtest.json").FullTable())
+ledger.GetProcesses(); ledger.GetShapeSystematics()
+outdir = tempfile.mkdtemp()
+MakeCard(ledger, outdir, "../", exportLedger=False)
+LoadLedger(outdir+"/").GetRegions()
+'''
+
+_snippets = [
+    # (name, code, expect ROOT to be loaded)
+    ('python', 'pass', False),
+    ('import ROOT', 'import ROOT; ROOT.gROOT', True),
+    ('import TwoDAlphabet', 'import TwoDAlphabet', False),
+    ('import twoDalphabet', 'import TwoDAlphabet.twoDalphabet', False),
+    ('import plot', 'import TwoDAlphabet.plot', False),
+    ('ledger workflow', _ledger_workflow, False),
+    ('first ROOT call', 'from TwoDAlphabet.helpers import ROOT; ROOT.TH1F("h","",1,0,1)', True),
+]
+
+def run(code):
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, '-c', code+_check], stderr=subprocess.DEVNULL)
+    return time.perf_counter()-start, out.decode().strip().split('\n')[-1] == 'True'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('%-20s %10s %12s'%('snippet','time [s]','ROOT loaded'))
+    for name, code, expect_root in _snippets:
+        best, loaded = float('inf'), None
+        for _ in range(args.repeat):
+            elapsed, loaded = run(code)
+            best = min(best, elapsed)
+        print('%-20s %10.3f %12s'%(name, best, loaded))
+        if loaded != expect_root:
+            raise RuntimeError('ROOT was%s loaded by "%s"'%('' if loaded else ' not', name))
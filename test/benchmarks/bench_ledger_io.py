@@ -0,0 +1,62 @@
+'''Benchmark saving and loading ledgers with the binary store (ledger.npz)
+against the csv tables (read back with type inference by pandas.read_csv)
+on the synthetic models of bench_make_card.py. The card written from the
+ledger loaded from ledger.npz is checked to be byte-identical to the card
+of the original ledger.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_ledger_io [--repeat N]
+'''
+import argparse, json, os, shutil, tempfile, time
+from TwoDAlphabet.twoDalphabet import LoadLedger, MakeCard
+from test.benchmarks.bench_make_card import make_config, make_ledger
+
+# (nsig, nbkg, nsyst)
+_sizes = [(5,2,20), (20,3,100), (50,3,300), (100,5,500)]
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter()-start)
+    return best
+
+def read_card(ledger, outdir):
+    MakeCard(ledger, outdir, '../', exportLedger=False)
+    with open(outdir+'/card.txt') as f:
+        return f.read()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print('%8s %12s %12s %12s %12s %12s %12s'%('rows','csv [kB]','npz [kB]','save csv [s]','save npz [s]','load csv [s]','load npz [s]'))
+        for nsig, nbkg, nsyst in _sizes:
+            json_path = os.path.join(tmpdir, 'config_%s_%s_%s.json'%(nsig,nbkg,nsyst))
+            with open(json_path,'w') as f:
+                json.dump(make_config(nsig,nbkg,nsyst), f)
+            ledger = make_ledger(json_path)
+            del ledger.Save # use the class method
+
+            csv_dir, npz_dir = os.path.join(tmpdir,'csv_%s'%nsig), os.path.join(tmpdir,'npz_%s'%nsig)
+            os.makedirs(csv_dir)
+            os.makedirs(npz_dir)
+            t_save_csv = best_of(lambda: ledger.Export(csv_dir), args.repeat)
+            t_save_npz = best_of(lambda: ledger.Save(npz_dir, export=False), args.repeat)
+            csv_size = sum(os.path.getsize(os.path.join(csv_dir,f)) for f in os.listdir(csv_dir) if f.endswith('.csv'))
+            npz_size = os.path.getsize(os.path.join(npz_dir,'ledger.npz'))
+
+            t_load_csv = best_of(lambda: LoadLedger(csv_dir+'/'), args.repeat)
+            t_load_npz = best_of(lambda: LoadLedger(npz_dir+'/'), args.repeat)
+
+            if read_card(ledger, npz_dir) != read_card(LoadLedger(npz_dir+'/'), npz_dir):
+                raise RuntimeError('Card of the loaded ledger differs for nsig=%s, nbkg=%s, nsyst=%s'%(nsig,nbkg,nsyst))
+            print('%8s %12.1f %12.1f %12.3f %12.3f %12.3f %12.3f'%(ledger.df.shape[0], csv_size/1024., npz_size/1024.,
+                                                                  t_save_csv, t_save_npz, t_load_csv, t_load_npz))
+        print('Cards of the ledgers loaded from ledger.npz are byte-identical')
+    finally:
+        shutil.rmtree(tmpdir)
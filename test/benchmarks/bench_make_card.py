@@ -0,0 +1,86 @@
+'''Benchmark MakeCard against the line-by-line reference implementation
+(MakeCard_perline) on synthetic ledgers with hundreds of systematics and
+dozens of signal mass points. The two cards are checked to be byte-identical.
+
+Each synthetic model has two regions, `nbkg` template backgrounds, `nsig` signal
+processes, one alphabet (QCD) object per region and `nsyst` systematics (half
+lnN, half shape) applied to every template process.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_make_card [--repeat N]
+'''
+import argparse, json, os, shutil, tempfile, time
+import pandas
+from TwoDAlphabet.config import Config
+from TwoDAlphabet.twoDalphabet import Ledger, MakeCard
+from test.benchmarks.reference import MakeCard_perline
+
+# (nsig, nbkg, nsyst)
+_sizes = [(5,2,20), (20,3,100), (50,3,300)]
+
+def make_config(nsig, nbkg, nsyst):
+    systs = {}
+    for i in range(nsyst):
+        if i%2 == 0:
+            systs['lnN%s'%i] = {'VAL': 1.0+0.001*i}
+        else:
+            systs['shape%s'%i] = {'UP': 'path/FILE_UP:HIST', 'DOWN': 'path/FILE_DOWN:HIST', 'SIGMA': 1.0}
+    processes = {'data_obs': {'TYPE': 'DATA', 'SYSTEMATICS': [], 'LOC': 'path/FILE:HIST'}}
+    for i in range(nbkg):
+        processes['bkg%s'%i] = {'TYPE': 'BKG', 'COLOR': i, 'SYSTEMATICS': list(systs), 'LOC': 'path/FILE:HIST'}
+    for i in range(nsig):
+        processes['sig_mA_%s'%(10+i)] = {'TYPE': 'SIGNAL', 'COLOR': 0, 'SYSTEMATICS': list(systs), 'LOC': 'path/FILE:HIST'}
+    return {
+        'GLOBAL': {'path': '/tmp', 'FILE': '$process.root', 'HIST': '$process_$region',
+                   'FILE_UP': '$process_$syst_up.root', 'FILE_DOWN': '$process_$syst_down.root'},
+        'REGIONS': {r: {'PROCESSES': [p for p in processes if p != 'data_obs'], 'BINNING': 'default'} for r in ['SR_pass','SR_fail']},
+        'PROCESSES': processes,
+        'SYSTEMATICS': systs,
+        'BINNING': {'default': {}},
+        'OPTIONS': {}
+    }
+
+def make_ledger(json_path):
+    ledger = Ledger(Config(json_path).FullTable())
+    regions = ledger.GetRegions()
+    ledger.alphaObjs = pandas.DataFrame(
+        [{'process':'qcd', 'region':r, 'process_type':'BKG', 'color':2, 'title':'QCD'} for r in regions],
+        columns=ledger.alphaObjs.columns)
+    ledger.alphaParams = pandas.DataFrame(
+        [{'name':'qcd_%s_bin_%s-1'%(r,i), 'constraint':'flatParam', 'owner':'qcd_'+r} for r in regions for i in range(100)],
+        columns=ledger.alphaParams.columns)
+    ledger.Save = lambda outDir, export=False: None # only time the card writing
+    return ledger
+
+def time_writer(writer, ledger, outdir, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        writer(ledger, outdir, '../')
+        best = min(best, time.perf_counter()-start)
+    with open(outdir+'/card.txt') as f:
+        return best, f.read()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print('%6s %6s %6s %8s %14s %12s %9s'%('nsig','nbkg','nsyst','rows','per-line [s]','pivot [s]','speedup'))
+        for nsig, nbkg, nsyst in _sizes:
+            json_path = os.path.join(tmpdir, 'config_%s_%s_%s.json'%(nsig,nbkg,nsyst))
+            with open(json_path,'w') as f:
+                json.dump(make_config(nsig,nbkg,nsyst), f)
+            ledger = make_ledger(json_path)
+            for d in ['ref','new']:
+                os.makedirs(os.path.join(tmpdir,d), exist_ok=True)
+            t_ref, card_ref = time_writer(MakeCard_perline, ledger, os.path.join(tmpdir,'ref'), args.repeat)
+            t_new, card_new = time_writer(MakeCard, ledger, os.path.join(tmpdir,'new'), args.repeat)
+            if card_ref != card_new:
+                raise RuntimeError('Cards differ for nsig=%s, nbkg=%s, nsyst=%s'%(nsig,nbkg,nsyst))
+            print('%6s %6s %6s %8s %14.3f %12.3f %8.1fx'%(nsig, nbkg, nsyst, ledger.df.shape[0], t_ref, t_new, t_ref/t_new))
+        print('Cards are byte-identical')
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,70 @@
+'''Benchmark the batch card writer (MakeCards) against a loop of Ledger.select()
+and MakeCard() per signal mass point, as in test_limit() of htoaato4b.py. The
+synthetic models are those of bench_make_card.py. The batch is timed both with
+the selection function (as passed to Ledger.select()) and with the equivalent
+column criteria (as passed to Ledger.selectWhere()). All cards are checked to
+be byte-identical to those of the loop.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_make_cards [--nsyst 100]
+'''
+import argparse, json, os, shutil, tempfile, time
+from TwoDAlphabet.twoDalphabet import Ledger, MakeCard, MakeCards
+from test.benchmarks.bench_make_card import make_config, make_ledger
+
+Ledger.Save = lambda self, outDir, export=False: None # only time the card writing
+
+_nsigs = [10, 40, 100]
+
+def _select_signal(row, args):
+    return row.process_type != 'SIGNAL' or row.process == args[0]
+
+def make_dirs(outdir, subtags):
+    for subtag in subtags:
+        os.makedirs(os.path.join(outdir, subtag))
+
+def run_loop(ledger, outdir, signals):
+    for sig in signals:
+        MakeCard(ledger.select(_select_signal, sig), os.path.join(outdir, sig), '../')
+
+def run_batch(ledger, outdir, signals):
+    MakeCards(ledger, [(os.path.join(outdir, sig), (_select_signal, sig)) for sig in signals], '../')
+
+def run_batch_where(ledger, outdir, signals):
+    others = [p for p in ledger.GetProcesses() if p not in signals]
+    MakeCards(ledger, [(os.path.join(outdir, sig), {'process': others+[sig]}) for sig in signals], '../')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nsyst', type=int, default=100)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print('%6s %6s %10s %11s %11s %11s'%('nsig','nsyst','loop [s]','batch [s]','where [s]','speedup'))
+        for nsig in _nsigs:
+            json_path = os.path.join(tmpdir, 'config_%s.json'%nsig)
+            with open(json_path,'w') as f:
+                json.dump(make_config(nsig,3,args.nsyst), f)
+            signals = ['sig_mA_%s'%(10+i) for i in range(nsig)]
+
+            timings, cards = {}, {}
+            for name, runner in [('loop',run_loop), ('batch',run_batch), ('where',run_batch_where)]:
+                ledger = make_ledger(json_path) # fresh ledger so that no selection is cached
+                outdir = os.path.join(tmpdir, '%s_%s'%(name,nsig))
+                make_dirs(outdir, signals)
+                start = time.perf_counter()
+                runner(ledger, outdir, signals)
+                timings[name] = time.perf_counter()-start
+                cards[name] = []
+                for sig in signals:
+                    with open(os.path.join(outdir, sig, 'card.txt')) as f:
+                        cards[name].append(f.read())
+
+            if not (cards['loop'] == cards['batch'] == cards['where']):
+                raise RuntimeError('Cards differ for nsig=%s'%nsig)
+            print('%6s %6s %10.2f %11.2f %11.2f %10.1fx'%(nsig, args.nsyst, timings['loop'], timings['batch'], timings['where'],
+                                                          timings['loop']/timings['where']))
+        print('Cards are byte-identical')
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,84 @@
+'''Compare the RooProduct/RooAddition backend of Generic2D._manipulate against
+the per-bin RooFormulaVar backend (useFormula=True) on a representative
+model: a pass region built as (fail template) x (2x2 polynomial transfer function),
+as in htoaato4b.py ("multiply"), and the same pass region with the fail template
+subtracted through Add(factor='-1') ("subtract").
+
+Reported for each backend: construction time, number of nodes in the
+workspace, workspace file size and the time to re-evaluate all bins
+after changing the transfer function parameters. The bin values of the
+two backends are checked to be identical.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_manipulate [--nx 40] [--ny 40] [--nevals 200]
+'''
+import argparse, os, random, tempfile, time
+import ROOT
+from TwoDAlphabet.binning import Binning
+from TwoDAlphabet.alphawrap import BinnedDistribution, ParametricFunction
+
+ROOT.gROOT.SetBatch(True)
+ROOT.RooMsgService.instance().setGlobalKillBelow(ROOT.RooFit.WARNING)
+
+_form = '@0*((1+@1*x+@4*x*x)*(1+@2*y+@5*y*y)+@3*x*y+@6*x*x*y+@7*x*y*y+@8*x*x*y*y)'
+
+def make_model(nx, ny):
+    template = ROOT.TH2F('bench_fail','',nx,0,nx,ny,0,ny)
+    random.seed(1234)
+    for b in range(template.GetNcells()):
+        template.SetBinContent(b, random.uniform(10,100))
+    binning_dict = {
+        'X': {'NAME': 'x', 'TITLE': 'x', 'MIN': 0, 'MAX': nx, 'NBINS': nx, 'SIGSTART': int(nx/3), 'SIGEND': int(2*nx/3)},
+        'Y': {'NAME': 'y', 'TITLE': 'y', 'MIN': 0, 'MAX': ny, 'NBINS': ny}
+    }
+    binning = Binning('bench', binning_dict, template)
+    fail = BinnedDistribution('fail', template, binning)
+    rpf = ParametricFunction('rpf', binning, _form, sharedFormula=True)
+    return fail, rpf
+
+def benchmark(fail, rpf, op, useFormula, nevals):
+    tag = '%s_%s'%(op, 'formula' if useFormula else 'arithmetic')
+    start = time.perf_counter()
+    passing = fail.Multiply('pass_'+tag, rpf, useFormula=useFormula)
+    if op == 'subtract':
+        passing = passing.Add('sub_'+tag, fail, factor='-1', useFormula=useFormula)
+    t_build = time.perf_counter() - start
+
+    w = ROOT.RooWorkspace('w_'+tag)
+    for cat, rph in passing.RooParametricHist()[0].items():
+        getattr(w,'import')(rph, ROOT.RooFit.RecycleConflictNodes(), ROOT.RooFit.Silence())
+    nnodes = w.components().getSize()
+    fname = os.path.join(tempfile.mkdtemp(), 'w_%s.root'%tag)
+    w.writeToFile(fname)
+    size = os.path.getsize(fname)
+
+    random.seed(42)
+    start = time.perf_counter()
+    for _ in range(nevals):
+        for n in rpf.nuisances:
+            n['obj'].setVal(random.uniform(-1,1))
+        values = [v.getVal() for v in passing.binVars.values()]
+    t_eval = time.perf_counter() - start
+    return passing, values, (t_build, nnodes, size, t_eval)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nx', type=int, default=40)
+    parser.add_argument('--ny', type=int, default=40)
+    parser.add_argument('--nevals', type=int, default=200)
+    args = parser.parse_args()
+
+    fail, rpf = make_model(args.nx, args.ny)
+    results, keep = {}, []
+    print('%-9s %-11s %10s %8s %12s %10s'%('op','backend','build [s]','nodes','file [kB]','eval [s]'))
+    for op in ['multiply','subtract']:
+        for useFormula in [True, False]:
+            tag = 'formula' if useFormula else 'arithmetic'
+            passing, values, (t_build, nnodes, size, t_eval) = benchmark(fail, rpf, op, useFormula, args.nevals)
+            keep.append(passing)
+            results[tag] = values
+            print('%-9s %-11s %10.2f %8s %12.1f %10.2f'%(op, tag, t_build, nnodes, size/1024., t_eval))
+
+        if results['formula'] != results['arithmetic']:
+            raise RuntimeError('Bin values differ between the formula and arithmetic backends (%s).'%op)
+    print('Bin values are identical between the two backends')
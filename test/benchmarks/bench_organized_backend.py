@@ -0,0 +1,81 @@
+'''Benchmark reading organized histograms with the "root" (organized_hists.root) and
+"array" (memory-mapped organized_hists.arrays) backends of OrganizedHists. For an
+increasing number of templates, a random subset is read back from a freshly opened
+store as arrays (OrganizedHists.GetArrays - a TKey read and a TH2 copy for "root",
+a slice of the memory map for "array") and as TH2s (OrganizedHists.Get - the export
+to ROOT of the array backend). The contents are checked to be identical.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_organized_backend [--nx 60] [--ny 40] [--read 200]
+'''
+import argparse, os, random, shutil, tempfile, time
+import numpy, pandas
+import ROOT
+from TwoDAlphabet.config import OrganizedHists
+from TwoDAlphabet.binning import Binning
+
+_ntemplates = [200, 1000, 4000]
+_nfiles = 10
+
+def make_inputs(tmpdir, ntemplates, nx, ny):
+    binning_dict = {
+        "X": {"NAME": "xaxis", "TITLE": "xaxis", "MIN": 0, "MAX": nx, "NBINS": nx, "SIGSTART": nx//3, "SIGEND": 2*(nx//3)},
+        "Y": {"NAME": "yaxis", "TITLE": "yaxis", "MIN": 0, "MAX": ny, "NBINS": ny}
+    }
+    template = ROOT.TH2F('bench_template','',nx,0,nx,ny,0,ny)
+    rng = numpy.random.RandomState(1)
+    hist_map, per_file = {}, ntemplates//_nfiles
+    for ifile in range(_nfiles):
+        fname = os.path.join(tmpdir, 'input_%s.root'%ifile)
+        f = ROOT.TFile.Open(fname,'RECREATE')
+        rows = []
+        for ihist in range(per_file):
+            h = template.Clone('h%s'%ihist)
+            h.FillN(nx*ny, rng.uniform(0,nx,nx*ny), rng.uniform(0,ny,nx*ny), numpy.ones(nx*ny))
+            f.WriteTObject(h,h.GetName())
+            rows.append({'source_histname':h.GetName(),'out_histname':'p%s_r0_FULL_s%s'%(ifile,ihist),
+                         'scale':1.,'color':2,'binning':'default'})
+        f.Close()
+        hist_map[fname] = pandas.DataFrame(rows)
+    return {'default': Binning('default',binning_dict,template)}, hist_map
+
+def timed(func):
+    start = time.perf_counter()
+    out = func()
+    return time.perf_counter()-start, out
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nx', type=int, default=60)
+    parser.add_argument('--ny', type=int, default=40)
+    parser.add_argument('--read', type=int, default=200, help='Number of templates read back.')
+    args = parser.parse_args()
+
+    print('%10s %8s %10s %10s %14s %14s %12s'%('templates','backend','build [s]','size [MB]','arrays [ms]','TH2s [ms]','open [ms]'))
+    for ntemplates in _ntemplates:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            binnings, hist_map = make_inputs(tmpdir, ntemplates, args.nx, args.ny)
+            results = {}
+            for backend in ['root','array']:
+                projPath = os.path.join(tmpdir, backend)+'/'
+                os.mkdir(projPath)
+                t_build, organized = timed(lambda: OrganizedHists(projPath, binnings, hist_map, backend=backend))
+                organized.file.Close()
+                size = sum(os.path.getsize(projPath+f) for f in os.listdir(projPath) if f.startswith('organized_hists'))
+
+                t_open, organized = timed(lambda: OrganizedHists(projPath, binnings, hist_map, readOnly=True, backend=backend))
+                names = random.Random(2).sample(organized.GetHistNames(), min(args.read, len(organized.GetHistNames())))
+                t_arrays, arrays = timed(lambda: [organized.GetArrays(n) for n in names])
+                t_hists, _ = timed(lambda: [organized.Get(n) for n in names])
+                results[backend] = [(numpy.array(c), numpy.array(w)) for c,w in arrays]
+                print('%10s %8s %10.2f %10.1f %14.1f %14.1f %12.1f'%(ntemplates*4, backend, t_build, size/1024.**2,
+                                                                     1e3*t_arrays, 1e3*t_hists, 1e3*t_open))
+                organized.file.Close()
+
+            for (cr,wr), (ca,wa) in zip(results['root'], results['array']):
+                if not (numpy.array_equal(cr,ca) and numpy.array_equal(wr,wa)):
+                    raise RuntimeError('Contents differ between the backends for %s templates'%(ntemplates*4))
+        finally:
+            shutil.rmtree(tmpdir)
+    print('Contents are identical between the backends')
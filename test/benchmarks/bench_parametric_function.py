@@ -0,0 +1,71 @@
+'''Benchmark the construction of ParametricFunction with per-bin formulas
+(default) against the shared formula mode (sharedFormula=True) for 2x2
+and 3x3 polynomial transfer functions. Each configuration is built in a
+fresh process to measure the construction time and the growth of the
+resident memory. The bin values of the two modes are checked to be identical.
+
+Usage (from the top directory of the repository):
+    python -m test.benchmarks.bench_parametric_function [--nx 40] [--ny 40]
+'''
+import argparse, multiprocessing, random, resource, time
+import ROOT
+from TwoDAlphabet.binning import Binning
+from TwoDAlphabet.alphawrap import ParametricFunction
+
+ROOT.gROOT.SetBatch(True)
+ROOT.RooMsgService.instance().setGlobalKillBelow(ROOT.RooFit.WARNING)
+
+# 2x2 as in htoaato4b._generate_poly and its 3x3 extension
+_forms = {
+    '2x2': '@0*((1+@1*x+@4*x*x)*(1+@2*y+@5*y*y)+@3*x*y+@6*x*x*y+@7*x*y*y+@8*x*x*y*y)',
+    '3x3': '@0*((1+@1*x+@4*x*x+@9*x*x*x)*(1+@2*y+@5*y*y+@10*y*y*y)+@3*x*y+@6*x*x*y+@7*x*y*y+@8*x*x*y*y'+
+           '+@11*x*x*x*y+@12*x*y*y*y+@13*x*x*x*y*y+@14*x*x*y*y*y+@15*x*x*x*y*y*y)'
+}
+
+def make_binning(nx, ny):
+    template = ROOT.TH2F('bench_template','',nx,0,nx,ny,0,ny)
+    binning_dict = {
+        'X': {'NAME': 'x', 'TITLE': 'x', 'MIN': 0, 'MAX': nx, 'NBINS': nx, 'SIGSTART': int(nx/3), 'SIGEND': int(2*nx/3)},
+        'Y': {'NAME': 'y', 'TITLE': 'y', 'MIN': 0, 'MAX': ny, 'NBINS': ny}
+    }
+    return Binning('bench', binning_dict, template)
+
+def _build(queue, form, shared, nx, ny):
+    binning = make_binning(nx, ny)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    rpf = ParametricFunction('rpf', binning, _forms[form], sharedFormula=shared)
+    elapsed = time.perf_counter() - start
+    rss_delta = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start
+
+    random.seed(1234)
+    for n in rpf.nuisances:
+        n['obj'].setVal(random.uniform(-1,1))
+    values = [v.getValV() for v in rpf.binVars.values()]
+    queue.put((elapsed, rss_delta, values))
+
+def run(form, shared, nx, ny):
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_build, args=(queue, form, shared, nx, ny))
+    proc.start()
+    out = queue.get()
+    proc.join()
+    return out
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nx', type=int, default=40)
+    parser.add_argument('--ny', type=int, default=40)
+    args = parser.parse_args()
+
+    print('%-6s %-10s %10s %12s'%('form','mode','time [s]','RSS [MB]'))
+    for form in _forms:
+        results = {}
+        for shared in [False, True]:
+            mode = 'shared' if shared else 'per-bin'
+            elapsed, rss_delta, values = run(form, shared, args.nx, args.ny)
+            results[mode] = values
+            print('%-6s %-10s %10.2f %12.1f'%(form, mode, elapsed, rss_delta/1024.))
+        if results['per-bin'] != results['shared']:
+            raise RuntimeError('Bin values differ between per-bin and shared formula modes for %s.'%form)
+    print('Bin values are identical between the two modes (%s bins)'%(args.nx*args.ny))
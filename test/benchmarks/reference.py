@@ -0,0 +1,209 @@
+'''Reference implementations that the optimized code of TwoDAlphabet replaced. They are
+kept for the benchmarks and tests that check the optimized code gives identical results.
+'''
+import array, itertools
+from collections import OrderedDict
+from math import sqrt
+from TwoDAlphabet.helpers import ROOT, unpack_to_line
+from TwoDAlphabet.binning import get_bins_from_hist
+
+def copy_hist_with_new_bins_perbin(copyName,XorY,inHist,new_bins):
+    '''Per-bin implementation of `copy_hist_with_new_bins`. Make a copy of a 2D histogram with new bins specified for a given axis (X or Y).
+    New bins must be larger than the old bins and the edges of new bins must line up with 
+    existing edges (no finer binning and no splitting bins).
+
+    Args:
+        copyName (str): Name of copy.
+        XorY (str): "X" or "Y" to change which axis is rebinned.
+        inHist (TH2): Input histogram to rebin.
+        new_bins (list): New list of bin edges.
+
+    Raises:
+        ValueError: If XorY is not "X" or "Y".
+        ValueError: If the requested rebinning does not align bin edges with the available input bin edges.
+
+    Returns:
+        TH2: Copy of histogram with new binning scheme. Note that the number of entries
+            will not be correct but integrated yield will be. 
+    '''
+    if XorY not in ["X","Y"]:
+        raise ValueError('Arg XorY is not "X" or "Y".')
+    axis_to_rebin = XorY
+    axis_to_hold = "X" if XorY=="Y" else "Y"
+    
+    static_array = array.array('f',get_bins_from_hist(axis_to_hold,inHist))
+    static_nbins = len(static_array)-1
+    rebin_array = array.array('f',new_bins)
+    rebin_nbins = len(rebin_array)-1 
+
+    # Use copyName with _temp to avoid overwriting if inHist has the same name
+    # We can do this at the end but not before we're finished with inHist
+    if XorY == "X":
+        hist_copy = ROOT.TH2F(copyName+'_temp',copyName+'_temp',rebin_nbins,rebin_array,static_nbins,static_array)
+    else:
+        hist_copy = ROOT.TH2F(copyName+'_temp',copyName+'_temp',static_nbins,static_array,rebin_nbins,rebin_array)
+    hist_copy.Sumw2()
+    hist_copy.GetXaxis().SetName(inHist.GetXaxis().GetName())
+    hist_copy.GetYaxis().SetName(inHist.GetYaxis().GetName())
+    old_axis = getattr(inHist,'Get%saxis'%axis_to_rebin)()
+    rebin_axis = getattr(hist_copy,'Get%saxis'%axis_to_rebin)()
+
+    # Loop through the old bins
+    for static_bin in range(1,static_nbins+1):
+        # print 'Bin y: ' + str(binY)
+        for rebin in range(1,rebin_nbins+1):
+            new_bin_content = 0
+            new_bin_errorsq = 0
+            new_bin_min = rebin_axis.GetBinLowEdge(rebin)
+            new_bin_max = rebin_axis.GetBinUpEdge(rebin)
+
+            # print '\t New bin x: ' + str(newBinX) + ', ' + str(newBinXlow) + ', ' + str(newBinXhigh)
+            for old_bin in range(1,old_axis.GetNbins()+1):
+                old_bin_min = old_axis.GetBinLowEdge(old_bin)
+                old_bin_max = old_axis.GetBinUpEdge(old_bin)
+                if old_bin_min >= new_bin_max:
+                    break
+                elif old_bin_min >= new_bin_min and old_bin_min < new_bin_max:
+                    if old_bin_max <= new_bin_max:
+                        if axis_to_rebin == "X":
+                            new_bin_content += inHist.GetBinContent(old_bin,static_bin)
+                            new_bin_errorsq += inHist.GetBinError(old_bin,static_bin)**2
+                        else:
+                            new_bin_content += inHist.GetBinContent(static_bin,old_bin)
+                            new_bin_errorsq += inHist.GetBinError(static_bin,old_bin)**2
+                    elif old_bin_max > new_bin_max:
+                        raise ValueError(
+                            '''The requested %s rebinning does not align bin edges with the input bin edge.
+                            Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_to_rebin,old_bin_min,old_bin_max,new_bin_min,new_bin_max))
+                elif old_bin_min <= new_bin_min and old_bin_max > new_bin_min:
+                    raise ValueError(
+                        '''The requested %s rebinning does not align bin edges with the input bin edge.
+                        Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_to_rebin,old_bin_min,old_bin_max,new_bin_min,new_bin_max))
+
+            # print '\t Setting content ' + str(newBinContent) + '+/-' + str(sqrt(newBinErrorSq))
+            if new_bin_content > 0:
+                if axis_to_rebin == "X":
+                    hist_copy.SetBinContent(rebin,static_bin,new_bin_content)
+                    hist_copy.SetBinError(rebin,static_bin,sqrt(new_bin_errorsq))
+                else:
+                    hist_copy.SetBinContent(static_bin,rebin,new_bin_content)
+                    hist_copy.SetBinError(static_bin,rebin,sqrt(new_bin_errorsq))
+
+    # Will now set the copyName which will overwrite inHist if it has the same name
+    hist_copy.SetName(copyName)
+    hist_copy.SetTitle(copyName)
+    return hist_copy
+
+def MakeCard_perline(ledger, subtag, workspaceDir):
+    '''Line-by-line implementation of `MakeCard`.'''
+    combine_idx_map = ledger._getCombineIdxMap()
+
+    card_new = open('%s/card.txt'%subtag,'w')
+    # imax (bins), jmax (backgrounds+signals), kmax (systematics) 
+    imax = 3*len(ledger.GetRegions()) # pass, fail for each 'X' axis category    
+    jmax = ledger.nbkgs + ledger.nsignals -1
+    kmax = len(ledger.GetShapeSystematics()) # does not include alphaParams
+    channels = ['_'.join(r) for r in itertools.product(ledger.GetRegions(),['LOW','SIG','HIGH'])]
+    
+    card_new.write('imax %s\n'%imax)      
+    card_new.write('jmax %s\n'%jmax)
+    card_new.write('kmax %s\n'%kmax)
+    card_new.write('-'*120+'\n')
+
+    # Shapes
+    shape_line = 'shapes  {p:20} {r} {file} w:{p}_{r} w:{p}_{r}_$SYSTEMATIC\n'
+    alpha_obj_title_map = {}
+    for proc,reg in ledger.GetProcRegPairs():
+        for cat in ['LOW','SIG','HIGH']:
+            if proc in ledger._alphaProcesses():
+                this_line = shape_line.replace(' w:{p}_{r}_$SYSTEMATIC','').replace('w:{p}','w:{hname_proc}')
+                title = ledger.alphaObjs[ledger.alphaObjs.process.eq(proc) & ledger.alphaObjs.region.eq(reg)].title.iloc[0]
+                alpha_obj_title_map[(proc,reg)] = proc
+                card_new.write(this_line.format(p=proc, r=reg+'_'+cat, file=workspaceDir+'base.root', hname_proc=proc))
+            elif proc == 'data_obs':
+                this_line = shape_line.replace(' w:{p}_{r}_$SYSTEMATIC','')
+                card_new.write(this_line.format(p=proc, r=reg+'_'+cat, file=workspaceDir+'base.root'))
+            else:
+                this_line = shape_line
+                card_new.write(this_line.format(p=proc, r=reg+'_'+cat, file=workspaceDir+'base.root'))
+
+    card_new.write('-'*120+'\n')
+
+    # Set bin observation values to -1
+    card_new.write('bin                 %s\n'%(unpack_to_line(channels)))
+    card_new.write('observation %s\n'%unpack_to_line([-1 for i in range(imax)]))
+
+    card_new.write('-'*120+'\n')
+
+    ######################################################
+    # Tie processes to bins and rates and simultaneously #
+    # create the systematic uncertainty rows             #
+    ######################################################
+    bin_line         = '{0:20} {1:20}'.format('bin','')
+    processName_line = '{0:20} {1:20}'.format('process','')
+    processCode_line = '{0:20} {1:20}'.format('process','')
+    rate_line        = '{0:20} {1:20}'.format('rate','')
+    syst_lines = OrderedDict()
+
+    # Fill syst_lines with keys to initialized strings
+    for syst,syst_group in ledger.df.groupby(by='variation',sort=True):
+        if syst == 'nominal': continue
+        syst_type = syst_group.iloc[0].syst_type
+        syst_lines[syst] = '{0:20} {1:20} '.format(syst, syst_type)
+
+    # Work with template bkgs first
+    for pair, group in ledger.df.groupby(['process','region']):
+        proc, region = pair
+        if proc == 'data_obs': continue
+        combine_idx = combine_idx_map[combine_idx_map.process.eq(proc)].combine_idx.iloc[0]
+
+        for cat in ['LOW','SIG','HIGH']:
+            chan = '%s_%s'%(region,cat)
+
+            bin_line += '{0:20} '.format(chan)
+            processName_line += '{0:20} '.format(proc)
+            processCode_line += '{0:20} '.format(combine_idx)
+            rate_line += '{0:20} '.format('-1')
+
+            for syst in syst_lines.keys():
+                if syst in group.variation.unique():
+                    syst_effect = group.loc[group.variation.eq(syst)].apply(lambda row: row[row.syst_type],axis=1).iloc[0]
+                else:
+                    syst_effect = '-'
+
+                syst_lines[syst] += '{0:20} '.format(syst_effect)
+
+    # Now work with alpha objects
+    # NOTE: duplicated code but no good way to combine without making things confusing
+    for pair,group in ledger.alphaObjs.groupby(['process', 'region']):
+        proc,region = pair
+        combine_idx = combine_idx_map[combine_idx_map.process.eq(alpha_obj_title_map[pair])].combine_idx.iloc[0]
+        
+        for cat in ['LOW','SIG','HIGH']:
+            chan = '%s_%s'%(region, cat)
+
+            bin_line += '{0:20} '.format(chan)
+            processName_line += '{0:20} '.format(alpha_obj_title_map[pair])
+            processCode_line += '{0:20} '.format(combine_idx)
+            rate_line += '{0:20} '.format('1')
+
+            for syst in syst_lines.keys():
+                syst_lines[syst] += '{0:20} '.format('-')
+
+    card_new.write(bin_line+'\n')
+    card_new.write(processName_line+'\n')
+    card_new.write(processCode_line+'\n')
+    card_new.write(rate_line+'\n')
+    card_new.write('-'*120+'\n')
+    for line_key in syst_lines.keys():
+        card_new.write(syst_lines[line_key]+'\n')
+
+    ######################################################
+    # Mark floating values as flatParams                 #
+    # We float just the rpf params and the failing bins. #
+    ######################################################
+    for param in ledger.alphaParams.itertuples():
+        card_new.write('{0:40} {1}\n'.format(param.name, param.constraint))
+    
+    card_new.close()
+    ledger.Save(subtag)
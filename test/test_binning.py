@@ -1,4 +1,4 @@
-import itertools
+import itertools, json, pickle
 from TwoDAlphabet.binning import *
 from ROOT import TH2F
 import pytest
@@ -75,6 +75,45 @@ def test_BinningVariableY():
     b = Binning('test',basedict,template)
     assert(b.ybinList == [0,2,4,6,8,10,12,14,16,18,20])
 
+def test_BinningToDict():
+    b = Binning('test',basedict,template)
+    loaded = Binning.FromDict(json.loads(json.dumps(b.ToDict())))
+    assert(loaded.ToDict() == b.ToDict())
+    assert(loaded.xbinList == b.xbinList)
+    assert(loaded.xSlices == b.xSlices)
+    assert(loaded._rrvs is None)
+    assert(loaded.yVar.GetName() == b.yVar.GetName() == 'yaxis_test')
+    assert(loaded.xVars['SIG'].GetName() == 'xaxis_SIG_test')
+    assert(loaded.xVars['LOW'].getBinning().numBins() == 7)
+
+def test_BinningPickle():
+    b = Binning('test',basedict,template)
+    b.xVars # create the RooRealVars
+    loaded = pickle.loads(pickle.dumps(b))
+    assert(loaded._rrvs is None)
+    assert(loaded.ToDict() == b.ToDict())
+    assert(loaded.yVar.getBinning().numBins() == 10)
+
+def test_BinningIndex():
+    b = Binning('test',basedict,template)
+    for c in ['LOW','SIG','HIGH']:
+        for xbin in range(len(b.xbinByCat[c])):
+            assert(b.xbinList[b.GlobalXbinIdx(xbin,c)] == b.xbinByCat[c][xbin])
+    assert([b.xcatFromGlobal(i) for i in [0,7,8,9]] == [(0,'LOW'),(7,'LOW'),(1,'SIG'),(1,'HIGH')])
+    assert(b.xSliceIdx == [0,7,8,12])
+    assert(list(b.xEdges) == b.xbinList)
+    with pytest.raises(ValueError):
+        b.xEdges[0] = 1
+
+def test_BinningFindBin():
+    b = Binning('test',basedict,template)
+    assert([b.FindBinX(v) for v in [-1,0,1,14,15,23.9,24]] == [0,1,1,8,8,12,13])
+    assert([b.FindBinX(v,'SIG') for v in [13,14,15,16]] == [0,1,1,2])
+    assert([b.FindBinY(v) for v in [-1,0,19,20]] == [0,1,10,11])
+    b.xbinList.append(30)
+    b.xbinList.sort(reverse=True)
+    assert([b.FindBinX(v) for v in [-1,0,1,14,15,23.9,24]] == [0,1,1,8,8,12,13])
+
 def test_BinningBreakLowerX():
     test_dict = deepcopy(basedict)
     test_dict['X']['MIN'] = -2
@@ -210,4 +249,18 @@ def test__remap_to_unity():
     assert(h.GetXaxis().GetXmin() == 0)
     assert(h.GetXaxis().GetXmax() == 1)
     assert(h.GetYaxis().GetXmin() == 0)
-    assert(h.GetYaxis().GetXmax() == 1)
\ No newline at end of file
+    assert(h.GetYaxis().GetXmax() == 1)
+
+def test__copy_hist_with_new_bins_matches_perbin():
+    from test.benchmarks.reference import copy_hist_with_new_bins_perbin
+    weighted = template.Clone('weighted_test')
+    weighted.Sumw2()
+    for x,y in itertools.product(range(1,weighted.GetNbinsX()+1),range(1,weighted.GetNbinsY()+1)):
+        weighted.SetBinContent(x,y,0.1*x*y-2)
+        weighted.SetBinError(x,y,0.3*x+0.01*y)
+    for XorY, new_bins in [('X',[0,4,6,12,24]),('Y',[2,4,10,20]),('X',[8,10])]:
+        vec = copy_hist_with_new_bins('vec',XorY,weighted,new_bins)
+        ref = copy_hist_with_new_bins_perbin('ref',XorY,weighted,new_bins)
+        for x,y in itertools.product(range(0,vec.GetNbinsX()+2),range(0,vec.GetNbinsY()+2)):
+            assert(vec.GetBinContent(x,y) == ref.GetBinContent(x,y))
+            assert(vec.GetBinError(x,y) == ref.GetBinError(x,y))
@@ -320,4 +320,176 @@ def test_config_loop_replace():
     assert config_loop_replace(config, "is", "IS")["THIS"] == "IS"
     assert "DICTIONARY" in config_loop_replace(config, "dictionary", "DICTIONARY")['a']
     with pytest.raises(TypeError):
-        config_loop_replace("dummy",1,2)
\ No newline at end of file
+        config_loop_replace("dummy",1,2)
+
+def test_config_multi_replace():
+    findreplace = {'path': 'test/data', 'FILE': 'path/THselection_$process.root', 'N': 2}
+    config = {
+        'GLOBAL': dict(findreplace),
+        'PROCESSES': {'ttbar': {'LOC': 'path/FILE:HIST', 'NBINS': 'N', 'LIST': ['FILE', 'path']}}
+    }
+    out = config_multi_replace(config, findreplace)
+    assert out['GLOBAL'] == {'path': 'test/data', 'FILE': 'test/data/THselection_$process.root', 'N': 2}
+    assert out['PROCESSES']['ttbar']['LOC'] == 'test/data/test/data/THselection_$process.root:HIST'
+    assert out['PROCESSES']['ttbar']['NBINS'] == 2
+    assert out['PROCESSES']['ttbar']['LIST'] == ['test/data/THselection_$process.root', 'test/data']
+    with pytest.raises(TypeError):
+        config_multi_replace("dummy", {'a': 'b'})
+
+def test_config_multi_replace_VALUE():
+    with pytest.raises(ValueError):
+        config_multi_replace({'a': 'x'}, {'x': 'y', 'y': 'z x'})
+    with pytest.raises(ValueError):
+        config_multi_replace({'a': 'N bins'}, {'N': 2})
+
+def _make_ingest_inputs(tmp_path):
+    from ROOT import TFile, TH2F
+    from TwoDAlphabet.binning import Binning
+    binning_dict = {
+        "X": {"NAME": "xaxis", "TITLE": "xaxis", "MIN": 0, "MAX": 24, "NBINS": 6, "SIGSTART": 8, "SIGEND": 16},
+        "Y": {"NAME": "yaxis", "TITLE": "yaxis", "MIN": 0, "MAX": 20, "NBINS": 5}
+    }
+    template = TH2F('ingest_template','',12,0,24,10,0,20)
+    hist_map = {}
+    for ifile in range(3):
+        fname = str(tmp_path/('input_%s.root'%ifile))
+        f = TFile.Open(fname,'RECREATE')
+        rows = []
+        for ihist in range(2):
+            h = template.Clone('h%s'%ihist)
+            for b in range(h.GetNcells()):
+                h.SetBinContent(b, 0.37*b*(ifile+1)+ihist)
+            f.WriteTObject(h,h.GetName())
+            rows.append({'source_histname':h.GetName(),'out_histname':'p%s_r%s_FULL'%(ifile,ihist),
+                         'scale':1.5,'color':2,'binning':'default'})
+        f.Close()
+        hist_map[fname] = pandas.DataFrame(rows)
+    return {'default': Binning('default',binning_dict,template)}, hist_map
+
+def _organize(tmp_path, project, binnings, hist_map, **kwargs):
+    projPath = str(tmp_path/project)+'/'
+    if not os.path.isdir(projPath):
+        os.mkdir(projPath)
+    return OrganizedHists(projPath, binnings, hist_map, **kwargs)
+
+def _assert_same_hists(expected, actual, ordered=True):
+    from TwoDAlphabet.helpers import hist_to_array
+    import numpy
+    names = expected.GetHistNames()
+    assert names == actual.GetHistNames() if ordered else sorted(names) == sorted(actual.GetHistNames())
+    for name in names:
+        he, ha = expected.Get(name), actual.Get(name)
+        assert (he.GetName(), he.GetTitle(), he.GetFillColor(), he.GetEntries()) == (ha.GetName(), ha.GetTitle(), ha.GetFillColor(), ha.GetEntries())
+        for axis in ['X','Y']:
+            assert get_bins_from_hist(axis, he) == get_bins_from_hist(axis, ha)
+        for ae, aa in zip(hist_to_array(he), hist_to_array(ha)):
+            assert numpy.array_equal(ae, aa)
+
+def test_OrganizedHists_parallel(tmp_path):
+    binnings, hist_map = _make_ingest_inputs(tmp_path)
+    serial = _organize(tmp_path, 'serial', binnings, hist_map)
+    _assert_same_hists(serial, _organize(tmp_path, 'parallel', binnings, hist_map, nWorkers=2))
+    assert not [f for f in os.listdir(str(tmp_path/'parallel')) if 'shard' in f]
+
+def test_OrganizedHists_cache(tmp_path):
+    from TwoDAlphabet.cache import IngestCache
+    binnings, hist_map = _make_ingest_inputs(tmp_path)
+    cache = IngestCache(str(tmp_path/'cache'))
+    first = _organize(tmp_path, 'first', binnings, hist_map, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 6)
+    cache = IngestCache(str(tmp_path/'cache'))
+    _assert_same_hists(first, _organize(tmp_path, 'second', binnings, hist_map, cache=cache))
+    assert (cache.hits, cache.misses) == (6, 0)
+    assert cache.Prune(maxSize=1)[0] == 6
+    assert cache.Entries() == []
+
+def test_OrganizedHists_cache_pruned(tmp_path, monkeypatch):
+    from ROOT import TFile
+    from TwoDAlphabet.cache import IngestCache
+    binnings, hist_map = _make_ingest_inputs(tmp_path)
+    cache = IngestCache(str(tmp_path/'cache'))
+    reference = _organize(tmp_path, 'reference', binnings, hist_map, cache=cache)
+    truncated, removed = sorted(path for path, _, _ in cache.Entries())[:2]
+    f = TFile.Open(truncated)
+    full = f.Get('FULL'); full.SetDirectory(0)
+    f.Close()
+    f = TFile.Open(truncated, 'RECREATE') # entry with only the full histogram left
+    f.WriteTObject(full, 'FULL')
+    f.Close()
+    os.remove(removed)
+
+    cache = IngestCache(str(tmp_path/'cache'))
+    _assert_same_hists(reference, _organize(tmp_path, 'pruned', binnings, hist_map, cache=cache))
+    assert (cache.hits, cache.misses) == (4, 2)
+
+    def _removed(path, times):
+        raise OSError('removed')
+    monkeypatch.setattr(os, 'utime', _removed)
+    cache = IngestCache(str(tmp_path/'cache'))
+    _assert_same_hists(reference, _organize(tmp_path, 'removed', binnings, hist_map, cache=cache))
+    assert (cache.hits, cache.misses) == (0, 6)
+
+def test_OrganizedHists_incremental(tmp_path):
+    binnings, hist_map = _make_ingest_inputs(tmp_path)
+    first = _organize(tmp_path, 'project', binnings, hist_map)
+    assert first.report['kept'] == 0 and len(first.report['rebuilt']) == 6
+    first.file.Close()
+
+    files = list(hist_map.keys())
+    hist_map[files[0]].loc[1,'scale'] = 3.0
+    hist_map[files[2]] = hist_map[files[2]].iloc[:1]
+    rebuilt = _organize(tmp_path, 'project', binnings, hist_map)
+    assert rebuilt.report['rebuilt'] == ['p0_r1_FULL']
+    assert rebuilt.report['removed'] == ['p2_r1_FULL','p2_r1_HIGH','p2_r1_LOW','p2_r1_SIG']
+    assert rebuilt.report['kept'] == 4
+    _assert_same_hists(_organize(tmp_path, 'fresh', binnings, hist_map), rebuilt, ordered=False)
+    rebuilt.file.Close()
+    assert _organize(tmp_path, 'project', binnings, hist_map).report['rebuilt'] == []
+
+def test_OrganizedHists_lazy(tmp_path):
+    binnings, hist_map = _make_ingest_inputs(tmp_path)
+    lazy = _organize(tmp_path, 'lazy', binnings, hist_map, lazySubRegions=True, viewCacheSize=2)
+    assert lazy.keys.Names() == ['p%s_r%s_FULL'%(f,h) for f in range(3) for h in range(2)]
+    _assert_same_hists(_organize(tmp_path, 'eager', binnings, hist_map), lazy)
+    assert len(lazy._viewCache) == 2
+    assert lazy.Get('p0_r0_SIG') is lazy.Get('p0_r0_SIG')
+    with pytest.raises(NameError):
+        lazy.Get('p9_r0_SIG')
+
+def test_OrganizedHists_array(tmp_path):
+    import numpy
+    binnings, hist_map = _make_ingest_inputs(tmp_path)
+    root = _organize(tmp_path, 'root', binnings, hist_map)
+    arrays = _organize(tmp_path, 'array', binnings, hist_map, backend='array')
+    assert arrays.filename.endswith('organized_hists.arrays')
+    _assert_same_hists(root, arrays)
+    for name in root.GetHistNames():
+        content, sumw2 = arrays.GetArrays(name)
+        assert isinstance(content, numpy.memmap)
+        assert numpy.array_equal(content, root.GetArrays(name)[0]) and numpy.array_equal(sumw2, root.GetArrays(name)[1])
+
+    arrays.file.Close()
+    files = list(hist_map.keys())
+    hist_map[files[0]].loc[1,'scale'] = 3.0
+    rebuilt = _organize(tmp_path, 'array', binnings, hist_map, backend='array')
+    assert rebuilt.report['rebuilt'] == ['p0_r1_FULL']
+    assert rebuilt.Get('p0_r1_FULL').Integral() == pytest.approx(2*root.Get('p0_r1_FULL').Integral())
+    with pytest.raises(ValueError):
+        _organize(tmp_path, 'array', binnings, hist_map, backend='hdf5')
+
+def test_OrganizedHists_array_interrupted_compaction(tmp_path):
+    from TwoDAlphabet.arraystore import ArrayStore, store_exists
+    binnings, hist_map = _make_ingest_inputs(tmp_path)
+    root = _organize(tmp_path, 'root', binnings, hist_map)
+    arrays = _organize(tmp_path, 'array', binnings, hist_map, backend='array')
+    arrays.file.Close()
+
+    store = ArrayStore(arrays.filename, 'UPDATE')
+    for name in store.Names():
+        store.WriteTObject(store.Get(name), name)
+    store.Compact() # interrupted before Close() writes the new index
+    assert not store_exists(arrays.filename)
+
+    reloaded = _organize(tmp_path, 'array', binnings, hist_map, readOnly=True, backend='array')
+    assert reloaded.report['kept'] == 0
+    _assert_same_hists(root, reloaded)
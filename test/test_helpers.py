@@ -1,9 +1,10 @@
 
 from argparse import ArgumentParser
 from typing import Type
-from ROOT import TH2F, RooArgList, RooRealVar, TH1F
+from ROOT import TH2F, RooArgList, RooRealVar, TH1F, TFile
 import pytest
-from TwoDAlphabet.helpers import is_filled_list, open_json, arg_dict_to_list, parse_arg_dict, make_RDH, dict_copy, nested_dict, roofit_form_to_TF1, set_hist_maximums
+from TwoDAlphabet.helpers import is_filled_list, open_json, arg_dict_to_list, parse_arg_dict, make_RDH, dict_copy, nested_dict, roofit_form_to_TF1, set_hist_maximums, KeyIndex, LocalRunner, run_cmds, hist_to_array, set_hist_from_array, array_to_hist, rdh_to_array, array_to_rdh
+import numpy
 
 test_dict = {
     "NAME": "bare",
@@ -87,4 +88,99 @@ def test__is_filled_list():
         is_filled_list('not a dict','test_key')
     assert is_filled_list({'test_key':'test_val'},'test_key') == False
     assert is_filled_list({'test_key':[]},'test_key') == False
-    assert is_filled_list({'test_key':['test_val']},'test_key') == True
\ No newline at end of file
+    assert is_filled_list({'test_key':['test_val']},'test_key') == True
+
+def test__KeyIndex(tmp_path):
+    f = TFile.Open(str(tmp_path/'keyindex.root'),'RECREATE')
+    keys = KeyIndex(f)
+    h = TH1F('h1','',10,0,10)
+    f.WriteTObject(h,'h1')
+    assert 'h1' in keys
+    assert keys.Get('h1').GetName() == 'h1'
+    f.WriteTObject(h,'h2')
+    assert 'h2' not in keys # not invalidated yet
+    keys.Invalidate()
+    assert 'h2' in keys
+    assert len(keys) == 2
+    with pytest.raises(NameError):
+        keys.Get('h3')
+    f.Close()
+
+def test__LocalRunner(tmp_path):
+    (tmp_path/'a').mkdir()
+    (tmp_path/'b').mkdir()
+    runner = LocalRunner('test', ['echo a > out.txt', 'exit 3', 'echo b > out.txt'],
+                         runIn=[str(tmp_path/'a'), str(tmp_path/'b'), str(tmp_path/'b')],
+                         nWorkers=2, retries=1, logDir=str(tmp_path/'logs'))
+    assert runner.submit() == [0, 3, 0]
+    assert runner.failed == [1]
+    assert runner.attempts == [1, 2, 1]
+    assert (tmp_path/'a'/'out.txt').read_text() == 'a\n'
+    assert (tmp_path/'b'/'out.txt').read_text() == 'b\n'
+    assert (tmp_path/'logs'/'test_1.log').read_text().count('# attempt') == 2
+
+def test__run_cmds_failed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # logs go to notneeded/
+    with pytest.raises(RuntimeError):
+        run_cmds('test', ['exit 0', 'exit 2'], nWorkers=2)
+
+def _filled_TH2F(name):
+    h = TH2F(name,'',4,0,4,3,0,3)
+    h.Sumw2()
+    for x in range(0,6):
+        for y in range(0,5):
+            h.SetBinContent(x,y,10*x+y+0.5)
+            h.SetBinError(x,y,0.1*x+y)
+    return h
+
+def test__hist_to_array():
+    h = _filled_TH2F('h_to_array')
+    content, sumw2 = hist_to_array(h)
+    assert content.shape == (5,6)
+    for x in range(0,6):
+        for y in range(0,5):
+            assert content[y,x] == h.GetBinContent(x,y)
+            assert sumw2[y,x] == h.GetSumw2()[h.GetBin(x,y)]
+    content, sumw2 = hist_to_array(h, flow=False)
+    assert content.shape == (3,4)
+    assert content[0,0] == h.GetBinContent(1,1)
+
+    view, _ = hist_to_array(h, copy=False)
+    view[2,3] = 42
+    assert h.GetBinContent(3,2) == 42
+
+    h1 = TH1F('h1_to_array','',5,0,5)
+    h1.SetBinContent(2,7)
+    content, sumw2 = hist_to_array(h1, flow=False)
+    assert content.tolist() == [0,7,0,0,0]
+    assert sumw2.tolist() == [0,7,0,0,0] # no Sumw2 stored
+
+def test__array_to_hist_roundtrip():
+    h = _filled_TH2F('h_roundtrip')
+    content, sumw2 = hist_to_array(h)
+    new = array_to_hist('h_roundtrip_copy', content, h, sumw2)
+    for x in range(0,6):
+        for y in range(0,5):
+            assert new.GetBinContent(x,y) == h.GetBinContent(x,y)
+            assert new.GetBinError(x,y) == h.GetBinError(x,y)
+
+    in_range = array_to_hist('h_inrange', numpy.ones((3,4)), h)
+    assert in_range.GetBinContent(0,0) == 0
+    assert in_range.Integral() == 12
+    with pytest.raises(ValueError):
+        set_hist_from_array(in_range, numpy.ones((4,3)))
+
+def test__rdh_to_array_roundtrip():
+    var1 = RooRealVar('bridge_x','',0,4)
+    var2 = RooRealVar('bridge_y','',0,3)
+    var1.setBins(4)
+    var2.setBins(3)
+    h = _filled_TH2F('h_rdh')
+    rdh = make_RDH(h, RooArgList(var1,var2))
+    weights, sumw2 = rdh_to_array(rdh)
+    content, hsumw2 = hist_to_array(h, flow=False)
+    assert numpy.allclose(weights, content)
+    assert numpy.allclose(sumw2, hsumw2)
+
+    rdh2 = array_to_rdh('rdh2', weights, RooArgList(var1,var2), h, sumw2)
+    assert numpy.allclose(rdh_to_array(rdh2)[0], weights)
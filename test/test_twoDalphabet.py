@@ -0,0 +1,39 @@
+import pandas
+from TwoDAlphabet.twoDalphabet import Ledger
+
+def _make_ledger():
+    return Ledger(pandas.DataFrame({
+        'process':      ['ttbar','ttbar','data_obs'],
+        'region':       ['SR','SR','SR'],
+        'variation':    ['nominal','JER','nominal'],
+        'process_type': ['BKG','BKG','DATA'],
+        'syst_type':    ['','shapes',''],
+        'color':        [2,2,1],
+        'title':        ['ttbar','ttbar','data']
+    }))
+
+def test_Ledger_select_not_cached():
+    ledger = _make_ledger()
+    want = 'ttbar'
+    select_want = lambda row, args: row.process == want
+    assert len(ledger.select(select_want).df) == 2
+    want = 'data_obs'
+    assert len(ledger.select(select_want).df) == 1
+    assert ledger.select(lambda row, args: row.process == args[0], 'ttbar').df.variation.tolist() == ['nominal','JER']
+
+def test_Ledger_inplace_invalidates():
+    ledger = _make_ledger()
+    assert ledger.GetProcesses() == ['ttbar','data_obs']
+    ledger.df.loc[2,'process'] = 'data'
+    assert ledger.GetProcesses() == ['ttbar','data']
+    ledger.df.at[0,'title'] = 't#bar{t}'
+    assert ledger.GetProcessTitle('ttbar') == 't#bar{t}'
+    ledger.df.loc[ledger.df.process.eq('ttbar'),'process_type'] = 'SIGNAL'
+    assert ledger.nsignals == 1
+    ledger.df['color'] = [3,3,1]
+    assert ledger.GetProcessColor('ttbar') == 3
+    ledger.alphaObjs = pandas.concat([ledger.alphaObjs, pandas.DataFrame([{'process':'qcd','region':'SR','process_type':'BKG'}])], ignore_index=True)
+    assert ledger.nbkgs == 1
+    ledger.alphaObjs.iat[0,0] = 'multijet'
+    assert ledger.GetProcesses(includeConfig=False) == ['multijet']
+    assert type(ledger.selectWhere(process='ttbar').df.loc[[True,False]]) is pandas.DataFrame